@@ -4,15 +4,60 @@ Bloom Filter Builder for EasyPrivacy Tracker Domains
 Builds a compact binary Bloom filter from the EasyPrivacy third-party
 domain list for use by the Veil extension's CNAME uncloaking engine.
 
-Output format:
+Output format (classic layout, read by bloom-filter.js):
   - Bytes 0-3: filter size in bits (uint32, little-endian)
   - Bytes 4-7: number of hash functions (uint32, little-endian)
   - Bytes 8+:  bit array data
 
+Versioned format (--layout blocked):
+  - Bytes 0-3:   magic b'VBLF'
+  - Byte 4:      format version (2)
+  - Byte 5:      layout (0 = classic, 1 = blocked into 512-bit blocks)
+  - Bytes 6-7:   reserved
+  - Bytes 8-11:  filter size in bits (uint32, little-endian)
+  - Bytes 12-15: number of hash functions (uint32, little-endian)
+  - Bytes 16+:   bit array data
+read_filter() reads both formats.
+
+Binary fuse format (--layout fuse), see BinaryFuseFilterBuilder:
+  - Bytes 0-3:   magic b'VBFF'
+  - Byte 4:      format version (1)
+  - Byte 5:      fingerprint bits (8 or 16)
+  - Bytes 6-7:   reserved
+  - Bytes 8-15:  hash seed (uint64, little-endian)
+  - Bytes 16-19: segment length (uint32)
+  - Bytes 20-23: segment count length (uint32)
+  - Bytes 24-27: fingerprint array length (uint32)
+  - Bytes 28+:   fingerprints (uint8 or little-endian uint16)
+
 Usage:
-  python build_bloom_filter.py [--input domains.txt] [--output tracker_bloom.bin]
+  python build_bloom_filter.py [--input domains.txt] [--output tracker_bloom.bin] [--workers N]
+  python build_bloom_filter.py --incremental --add new_domains.txt [--input domains.txt]
+  python build_bloom_filter.py --counting-state tracker_bloom.counts --remove whitelisted.txt
 
 If no input file is specified, a built-in list of known tracker domains is used.
+
+Input files are streamed through a memory-mapped reader in chunks: a first
+pass counts distinct domains (exact up to a bound, HyperLogLog beyond it) to
+size the filter, a second pass hashes and inserts them. Peak memory depends
+on the chunk size and filter size, not on the input size.
+
+Every build writes a sidecar manifest (<output>.manifest.json) with the item
+count and SHA-256 of the source lists. With --incremental, additions deltas
+are OR-ed into the existing filter and a full rebuild only happens when the
+projected false positive rate from the fill ratio exceeds --fp-rate. Full
+builds are sized for --capacity-headroom times the distinct domain count
+(default 1.25), so later deltas fit in place at the same --fp-rate until the
+list has grown by that factor; the factor is recorded in the manifest.
+
+With --counting-state, a counting Bloom filter (4-bit counters) is kept next
+to the output so --remove deltas can be applied in place; the shipped file is
+always collapsed back to the plain bit-array format above.
+
+Full builds probe --fp-probes generated negatives (default 100000) for the
+false positive estimate. In-place updates already gate on the projected rate,
+so they skip the probe unless --fp-probes, --fp-negatives, --fp-report or a
+budget option asks for a measurement.
 """
 
 import struct
@@ -20,6 +65,35 @@ import math
 import sys
 import os
 import hashlib
+import itertools
+import json
+import mmap
+import random
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# Seeds for the two base hashes used by double hashing (see bloom-filter.js)
+HASH_SEED_1 = 0
+HASH_SEED_2 = 1577836800
+
+# Rows hashed per vectorized pass; bounds the padded key matrix in memory
+HASH_CHUNK_SIZE = 65536
+
+# Full builds are sized for this many times the distinct domains, leaving room
+# for incremental additions at the same target false positive rate
+DEFAULT_CAPACITY_HEADROOM = 1.25
+
+# Generated negatives probed for the FP estimate of a full build
+DEFAULT_FP_PROBES = 100_000
+
+# Filter shipped with the extension
+DEFAULT_FILTER_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..',
+    '02_Extension_App', 'core', 'data', 'tracker_bloom.bin'))
 
 
 def murmurhash3_32(key: str, seed: int = 0) -> int:
@@ -72,6 +146,100 @@ def murmurhash3_32(key: str, seed: int = 0) -> int:
     return h
 
 
+def _murmurhash3_32_block(keys: list, seeds):
+    """
+    Hash one chunk of encoded keys with every seed in a single vectorized pass.
+
+    Keys are packed into a zero-padded (n, width) byte matrix so that the
+    4-byte body blocks can be read as little-endian uint32 columns. Rows whose
+    key is shorter than the current block column are masked out, so each
+    row follows exactly the same steps as the scalar implementation.
+    """
+    n = len(keys)
+    lengths = np.fromiter((len(k) for k in keys), dtype=np.int64, count=n)
+    max_len = int(lengths.max()) if n else 0
+    width = max(4, (max_len + 3) // 4 * 4 + 4)
+
+    # 'S' dtype pads every key with NUL bytes up to `width`
+    matrix = np.array(keys, dtype=f'S{width}').view(np.uint8).reshape(n, width)
+    blocks = matrix.view('<u4').astype(np.uint32)
+    nblocks = lengths // 4
+    tail_len = lengths & 3
+    rows = np.arange(n)
+
+    c1 = np.uint32(0xCC9E2D51)
+    c2 = np.uint32(0x1B873593)
+
+    # Tail bytes are shared by all seeds
+    tail_start = nblocks * 4
+    tail = np.zeros(n, dtype=np.uint32)
+    for offset in (2, 1, 0):
+        byte = matrix[rows, tail_start + offset].astype(np.uint32)
+        tail ^= np.where(tail_len > offset, byte << np.uint32(8 * offset), np.uint32(0))
+    tail = tail * c1
+    tail = (tail << np.uint32(15)) | (tail >> np.uint32(17))
+    tail = tail * c2
+    has_tail = tail_len > 0
+
+    results = []
+    for seed in seeds:
+        h = np.full(n, seed & 0xFFFFFFFF, dtype=np.uint32)
+
+        # Body
+        for i in range(max_len // 4):
+            k = blocks[:, i] * c1
+            k = (k << np.uint32(15)) | (k >> np.uint32(17))
+            k = k * c2
+
+            mixed = h ^ k
+            mixed = (mixed << np.uint32(13)) | (mixed >> np.uint32(19))
+            mixed = mixed * np.uint32(5) + np.uint32(0xE6546B64)
+            h = np.where(nblocks > i, mixed, h)
+
+        # Tail
+        h = np.where(has_tail, h ^ tail, h)
+
+        # Finalization
+        h ^= lengths.astype(np.uint32)
+        h ^= h >> np.uint32(16)
+        h = h * np.uint32(0x85EBCA6B)
+        h ^= h >> np.uint32(13)
+        h = h * np.uint32(0xC2B2AE35)
+        h ^= h >> np.uint32(16)
+        results.append(h)
+
+    return results
+
+
+def murmurhash3_32_many(keys, seeds=(HASH_SEED_1, HASH_SEED_2),
+                        chunk_size: int = HASH_CHUNK_SIZE):
+    """
+    Vectorized MurmurHash3 32-bit over a whole list of keys.
+
+    Bit-identical to murmurhash3_32() (and therefore bloom-filter.js) for
+    every key and seed.
+
+    Args:
+        keys: Iterable of str (UTF-8 encoded here) or bytes
+        seeds: Seeds to hash every key with
+        chunk_size: Keys hashed per vectorized pass
+
+    Returns:
+        Tuple with one uint32 NumPy array per seed, in key order
+    """
+    encoded = [k.encode('utf-8') if isinstance(k, str) else bytes(k) for k in keys]
+    seeds = tuple(seeds)
+    if not encoded:
+        return tuple(np.empty(0, dtype=np.uint32) for _ in seeds)
+
+    outputs = tuple(np.empty(len(encoded), dtype=np.uint32) for _ in seeds)
+    for start in range(0, len(encoded), chunk_size):
+        chunk = encoded[start:start + chunk_size]
+        for out, hashed in zip(outputs, _murmurhash3_32_block(chunk, seeds)):
+            out[start:start + len(chunk)] = hashed
+    return outputs
+
+
 def calculate_optimal_params(num_items: int, fp_rate: float = 0.001):
     """Calculate optimal Bloom filter size and number of hash functions."""
     size = int(math.ceil(-(num_items * math.log(fp_rate)) / (math.log(2) ** 2)))
@@ -79,30 +247,62 @@ def calculate_optimal_params(num_items: int, fp_rate: float = 0.001):
     return size, num_hashes
 
 
+def normalize_domain(domain: str) -> str:
+    """Normalize a domain the same way bloom-filter.js does before hashing."""
+    return domain.lower().lstrip('.')
+
+
+def hash_positions_many(keys, num_hashes: int, size: int) -> np.ndarray:
+    """
+    Compute all k double-hashing bit positions for a list of normalized keys.
+
+    Returns:
+        (len(keys), num_hashes) uint64 array where row r holds
+        ((h1 + i * h2) & 0xFFFFFFFF) % size for i in range(num_hashes)
+    """
+    h1, h2 = murmurhash3_32_many(keys)
+    steps = np.arange(num_hashes, dtype=np.uint64)
+    combined = h1.astype(np.uint64)[:, None] + steps * h2.astype(np.uint64)[:, None]
+    return (combined & np.uint64(0xFFFFFFFF)) % np.uint64(size)
+
+
+def iter_position_chunks(domains, num_hashes: int, size: int, chunk_size: int = HASH_CHUNK_SIZE):
+    """Yield (n, k) position arrays for successive chunks of domains."""
+    for chunk in iter_chunks(domains, chunk_size):
+        yield hash_positions_many([normalize_domain(d) for d in chunk], num_hashes, size)
+
+
 class BloomFilterBuilder:
     def __init__(self, size: int, num_hashes: int = 7):
         self.size = size
         self.num_hashes = num_hashes
-        self.bit_array = bytearray(math.ceil(size / 8))
+        self.bit_array = np.zeros(math.ceil(size / 8), dtype=np.uint8)
 
     def _get_hash_positions(self, key: str):
-        h1 = murmurhash3_32(key, 0)
-        h2 = murmurhash3_32(key, 1577836800)
+        h1 = murmurhash3_32(key, HASH_SEED_1)
+        h2 = murmurhash3_32(key, HASH_SEED_2)
         positions = []
         for i in range(self.num_hashes):
             pos = ((h1 + i * h2) & 0xFFFFFFFF) % self.size
             positions.append(pos)
         return positions
 
+    def _positions_many(self, keys) -> np.ndarray:
+        return hash_positions_many(keys, self.num_hashes, self.size)
+
+    def _iter_position_chunks(self, domains, chunk_size: int):
+        for chunk in iter_chunks(domains, chunk_size):
+            yield self._positions_many([normalize_domain(d) for d in chunk])
+
     def add(self, domain: str):
-        key = domain.lower().lstrip('.')
+        key = normalize_domain(domain)
         for pos in self._get_hash_positions(key):
             byte_index = pos // 8
             bit_offset = pos % 8
             self.bit_array[byte_index] |= (1 << bit_offset)
 
     def has(self, domain: str) -> bool:
-        key = domain.lower().lstrip('.')
+        key = normalize_domain(domain)
         for pos in self._get_hash_positions(key):
             byte_index = pos // 8
             bit_offset = pos % 8
@@ -110,173 +310,1448 @@ class BloomFilterBuilder:
                 return False
         return True
 
+    def add_many(self, domains, chunk_size: int = HASH_CHUNK_SIZE):
+        """
+        Add many domains at once.
+
+        All positions of a chunk are computed in one vectorized pass and
+        scattered into the bit array with a single np.bitwise_or.at call.
+        """
+        for positions in self._iter_position_chunks(domains, chunk_size):
+            positions = positions.ravel()
+            offsets = (positions & np.uint64(7)).astype(np.uint8)
+            np.bitwise_or.at(self.bit_array, positions >> np.uint64(3), np.uint8(1) << offsets)
+
+    def has_many(self, domains, chunk_size: int = HASH_CHUNK_SIZE) -> np.ndarray:
+        """
+        Check many domains at once.
+
+        Returns:
+            Boolean NumPy array, True where the domain is possibly present
+        """
+        results = [np.empty(0, dtype=bool)]
+        for positions in self._iter_position_chunks(domains, chunk_size):
+            offsets = (positions & np.uint64(7)).astype(np.uint8)
+            bits = self.bit_array[positions >> np.uint64(3)] >> offsets
+            results.append((bits & 1).astype(bool).all(axis=1))
+        return np.concatenate(results)
+
+    def fill_ratio(self) -> float:
+        """Fraction of bits set."""
+        return int(np.unpackbits(self.bit_array).sum()) / self.size
+
     def to_bytes(self) -> bytes:
         header = struct.pack('<II', self.size, self.num_hashes)
-        return header + bytes(self.bit_array)
+        return header + self.bit_array.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilterBuilder':
+        """Load a filter previously written by to_bytes() (any header format)."""
+        return read_filter(data)
+
+
+# Versioned header: magic, version, layout, reserved, size in bits, k
+FILTER_MAGIC = b'VBLF'
+FILTER_VERSION = 2
+VERSIONED_HEADER = struct.Struct('<4sBBHII')
+
+LAYOUT_CLASSIC = 0
+LAYOUT_BLOCKED = 1
+LAYOUTS = {'classic': LAYOUT_CLASSIC, 'blocked': LAYOUT_BLOCKED}
+
+# One 64-byte cache line per block
+BLOCK_BITS = 512
+
+
+def blocked_hash_positions_many(keys, num_hashes: int, num_blocks: int) -> np.ndarray:
+    """
+    Bit positions of a blocked filter, all k of a key inside one block.
+
+    h1 selects the block; the low 9 bits of h2 give the first bit in the
+    block and the next 9 bits (forced odd) the stride, so the k bits are
+    distinct whenever k <= 512.
+    """
+    h1, h2 = murmurhash3_32_many(keys)
+    h1 = h1.astype(np.uint64)
+    h2 = h2.astype(np.uint64)
+    block = (h1 % np.uint64(num_blocks)) * np.uint64(BLOCK_BITS)
+    start = h2 & np.uint64(BLOCK_BITS - 1)
+    stride = ((h2 >> np.uint64(9)) & np.uint64(BLOCK_BITS - 1)) | np.uint64(1)
+    steps = np.arange(num_hashes, dtype=np.uint64)
+    offsets = (start[:, None] + steps * stride[:, None]) & np.uint64(BLOCK_BITS - 1)
+    return block[:, None] + offsets
+
+
+def calculate_blocked_params(num_items: int, fp_rate: float = 0.001):
+    """
+    Blocked filter size for the same memory budget as the classic layout.
+
+    The classic optimal size is rounded up to whole 512-bit blocks; k is
+    kept, so the two layouts can be compared at (almost) equal memory.
+    """
+    size, num_hashes = calculate_optimal_params(num_items, fp_rate)
+    num_blocks = max(1, math.ceil(size / BLOCK_BITS))
+    return num_blocks * BLOCK_BITS, num_hashes
+
+
+class BlockedBloomFilterBuilder(BloomFilterBuilder):
+    """
+    Cache-line blocked Bloom filter.
+
+    All k bits of a domain live in one 64-byte block, so a lookup touches a
+    single cache line instead of k random bytes. At equal memory the false
+    positive rate is somewhat higher than the classic layout. Only written
+    with the versioned header (layout=blocked).
+    """
+
+    def __init__(self, size: int, num_hashes: int = 7):
+        if size % BLOCK_BITS:
+            raise ValueError(f"Blocked filter size must be a multiple of {BLOCK_BITS} bits")
+        super().__init__(size, num_hashes)
+        self.num_blocks = size // BLOCK_BITS
+
+    def _get_hash_positions(self, key: str):
+        return self._positions_many([key])[0].tolist()
+
+    def _positions_many(self, keys) -> np.ndarray:
+        return blocked_hash_positions_many(keys, self.num_hashes, self.num_blocks)
+
+    def to_bytes(self) -> bytes:
+        return to_versioned_bytes(self)
+
+
+def to_versioned_bytes(bf: BloomFilterBuilder) -> bytes:
+    """Serialize a classic or blocked filter with the versioned header."""
+    layout = LAYOUT_BLOCKED if isinstance(bf, BlockedBloomFilterBuilder) else LAYOUT_CLASSIC
+    header = VERSIONED_HEADER.pack(FILTER_MAGIC, FILTER_VERSION, layout, 0,
+                                   bf.size, bf.num_hashes)
+    return header + bf.bit_array.tobytes()
+
+
+def parse_filter_header(data) -> tuple:
+    """
+    Parse the header of a filter file in either format.
+
+    Returns:
+        (layout, size in bits, num_hashes, data offset)
+    """
+    if len(data) >= VERSIONED_HEADER.size and bytes(data[:4]) == FILTER_MAGIC:
+        _, version, layout, _, size, num_hashes = VERSIONED_HEADER.unpack_from(data)
+        if version != FILTER_VERSION:
+            raise ValueError(f"Unsupported Bloom filter format version {version}")
+        if layout not in LAYOUTS.values():
+            raise ValueError(f"Unknown Bloom filter layout {layout}")
+        return layout, size, num_hashes, VERSIONED_HEADER.size
+    if len(data) < 8:
+        raise ValueError("Bloom filter data is shorter than its header")
+    size, num_hashes = struct.unpack_from('<II', data)
+    return LAYOUT_CLASSIC, size, num_hashes, 8
+
+
+def read_filter(data) -> BloomFilterBuilder:
+    """
+    Reference reader for every Bloom filter format this tool writes.
+
+    Accepts the legacy '<II' header and the versioned header, returning a
+    BloomFilterBuilder or BlockedBloomFilterBuilder.
+    """
+    layout, size, num_hashes, offset = parse_filter_header(data)
+    cls = BlockedBloomFilterBuilder if layout == LAYOUT_BLOCKED else BloomFilterBuilder
+    bf = cls(size, num_hashes)
+    if len(data) - offset < len(bf.bit_array):
+        raise ValueError("Bloom filter data is shorter than its declared size")
+    bf.bit_array[:] = np.frombuffer(data, dtype=np.uint8, count=len(bf.bit_array), offset=offset)
+    return bf
+
+
+def new_filter(layout: str, size: int, num_hashes: int) -> BloomFilterBuilder:
+    """Create an empty filter builder for a layout name."""
+    if layout == 'blocked':
+        return BlockedBloomFilterBuilder(size, num_hashes)
+    return BloomFilterBuilder(size, num_hashes)
+
+
+class BloomFilterView:
+    """
+    Read-only, zero-copy view of a Bloom filter file.
+
+    The file is memory-mapped and the bit array is a NumPy view over the
+    mapping (np.frombuffer), so nothing is copied and every process that
+    opens the same file shares one page-cached copy. Reads the legacy
+    '<II' header and the versioned header (classic or blocked layout).
+
+    Usage:
+        with BloomFilterView(DEFAULT_FILTER_PATH) as trackers:
+            trackers.has('doubleclick.net')
+            trackers.has_many(['a.example.com', 'b.example.com'])
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or DEFAULT_FILTER_PATH
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"Bloom filter file {self.path} is empty")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.layout, self.size, self.num_hashes, offset = parse_filter_header(self._mmap)
+            nbytes = math.ceil(self.size / 8)
+            if len(self._mmap) - offset < nbytes:
+                raise ValueError("Bloom filter data is shorter than its declared size")
+            self.bit_array = np.frombuffer(self._mmap, dtype=np.uint8, count=nbytes, offset=offset)
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def _positions(self, keys) -> np.ndarray:
+        if self.layout == LAYOUT_BLOCKED:
+            return blocked_hash_positions_many(keys, self.num_hashes, self.size // BLOCK_BITS)
+        return hash_positions_many(keys, self.num_hashes, self.size)
+
+    def has_many(self, domains, chunk_size: int = HASH_CHUNK_SIZE) -> np.ndarray:
+        """Boolean mask, True where the domain is possibly present."""
+        results = [np.empty(0, dtype=bool)]
+        for chunk in iter_chunks(domains, chunk_size):
+            positions = self._positions([normalize_domain(d) for d in chunk])
+            offsets = (positions & np.uint64(7)).astype(np.uint8)
+            bits = self.bit_array[positions >> np.uint64(3)] >> offsets
+            results.append((bits & 1).astype(bool).all(axis=1))
+        return np.concatenate(results)
+
+    def has(self, domain: str) -> bool:
+        return bool(self.has_many([domain])[0])
+
+    def __contains__(self, domain: str) -> bool:
+        return self.has(domain)
+
+    def close(self):
+        """Release the mapping (the NumPy view must go first)."""
+        if self._mmap is not None:
+            self.bit_array = None
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+FUSE_MAGIC = b'VBFF'
+FUSE_VERSION = 1
+# magic, version, fingerprint bits, reserved, seed, segment length,
+# segment count length, fingerprint array length
+FUSE_HEADER = struct.Struct('<4sBBHQIII')
+
+
+def key_hashes_many(keys) -> np.ndarray:
+    """64-bit key hashes (h1 << 32 | h2) from the two MurmurHash3 seeds."""
+    h1, h2 = murmurhash3_32_many(keys)
+    return (h1.astype(np.uint64) << np.uint64(32)) | h2.astype(np.uint64)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """MurmurHash3 64-bit finalizer (a bijection on uint64)."""
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xFF51AFD7ED558CCD)
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xC4CEB9FE1A85EC53)
+    return x ^ (x >> np.uint64(33))
+
+
+def _splitmix64(state: int) -> int:
+    """Next seed from a SplitMix64 sequence."""
+    z = (state + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return z ^ (z >> 31)
+
+
+class BinaryFuseFilterBuilder:
+    """
+    3-wise binary fuse filter (Graf & Lemire, 2022) over tracker domains.
+
+    A static alternative to the Bloom filter: with 8-bit fingerprints the
+    false positive rate is ~1/256, with 16-bit ~1/65536, at roughly 1.13x
+    the fingerprint size per key, and a lookup reads exactly 3 entries.
+    Keys are hashed with the same MurmurHash3 pair as the Bloom filter.
+    Parameters follow the reference implementation.
+    """
+
+    MAX_ATTEMPTS = 100
+
+    def __init__(self, num_items: int, fingerprint_bits: int = 8):
+        if fingerprint_bits not in (8, 16):
+            raise ValueError("fingerprint_bits must be 8 or 16")
+        self.fingerprint_bits = fingerprint_bits
+        self.dtype = np.uint8 if fingerprint_bits == 8 else np.dtype('<u2')
+        self.seed = 0
+
+        arity = 3
+        if num_items == 0:
+            segment_length = 4
+        else:
+            segment_length = 1 << int(math.floor(math.log(num_items) / math.log(3.33) + 2.25))
+        self.segment_length = min(segment_length, 262144)
+        if num_items > 1:
+            size_factor = max(1.125, 0.875 + 0.25 * math.log(1000000) / math.log(num_items))
+            capacity = int(round(num_items * size_factor))
+        else:
+            capacity = 0
+        init_segment_count = -(-capacity // self.segment_length) - (arity - 1)
+        array_length = (init_segment_count + arity - 1) * self.segment_length
+        segment_count = -(-array_length // self.segment_length)
+        segment_count = 1 if segment_count <= arity - 1 else segment_count - (arity - 1)
+        self.segment_count_length = segment_count * self.segment_length
+        self.fingerprints = np.zeros((segment_count + arity - 1) * self.segment_length,
+                                     dtype=self.dtype)
+
+    def _hash(self, key_hashes: np.ndarray) -> np.ndarray:
+        return _mix64(key_hashes + np.uint64(self.seed))
+
+    def _locations(self, hashes: np.ndarray):
+        """The three fingerprint slots of every hash (h0, h1, h2)."""
+        # High 64 bits of hash * segment_count_length
+        n = np.uint64(self.segment_count_length)
+        high = (hashes >> np.uint64(32)) * n
+        low = ((hashes & np.uint64(0xFFFFFFFF)) * n) >> np.uint64(32)
+        h0 = ((high + low) >> np.uint64(32)).astype(np.int64)
+        mask = self.segment_length - 1
+        h1 = (h0 + self.segment_length) ^ ((hashes >> np.uint64(18)).astype(np.int64) & mask)
+        h2 = (h1 + self.segment_length) ^ (hashes.astype(np.int64) & mask)
+        return h0, h1, h2
+
+    def _fingerprint(self, hashes: np.ndarray) -> np.ndarray:
+        return (hashes ^ (hashes >> np.uint64(32))).astype(self.dtype)
+
+    def build(self, key_hashes: np.ndarray):
+        """
+        Construct the filter from unique 64-bit key hashes.
+
+        Peels the 3-hypergraph of slots; retries with the next seed in the
+        rare case peeling gets stuck.
+        """
+        key_hashes = np.unique(np.asarray(key_hashes, dtype=np.uint64))
+        size = len(key_hashes)
+        length = len(self.fingerprints)
+        state = 0x726B2B9D438B9D4D
+        for _ in range(self.MAX_ATTEMPTS):
+            state = _splitmix64(state)
+            self.seed = state
+            hashes = self._hash(key_hashes)
+            h0, h1, h2 = self._locations(hashes)
+
+            # Per slot: number of keys (<< 2) XOR which of h0/h1/h2 it was,
+            # and the XOR of the key indices hitting it
+            counts = np.zeros(length, dtype=np.int64)
+            owners = np.zeros(length, dtype=np.int64)
+            index = np.arange(size, dtype=np.int64)
+            for which, slots in enumerate((h0, h1, h2)):
+                np.add.at(counts, slots, 4)
+                np.bitwise_xor.at(counts, slots, which)
+                np.bitwise_xor.at(owners, slots, index)
+
+            order = self._peel(counts.tolist(), owners.tolist(),
+                               (h0.tolist(), h1.tolist(), h2.tolist()))
+            if len(order) == size:
+                self._assign(order, hashes, (h0, h1, h2))
+                return self
+        raise RuntimeError("Binary fuse filter construction failed; duplicate keys?")
+
+    @staticmethod
+    def _peel(counts: list, owners: list, slots: tuple) -> list:
+        """Peel slots hit by a single key; returns (key, which) in peel order."""
+        alone = [i for i, c in enumerate(counts) if c >> 2 == 1]
+        order = []
+        while alone:
+            slot = alone.pop()
+            if counts[slot] >> 2 != 1:
+                continue
+            key = owners[slot]
+            found = counts[slot] & 3
+            order.append((key, found))
+            for step in (1, 2):
+                which = (found + step) % 3
+                other = slots[which][key]
+                if counts[other] >> 2 == 2:
+                    alone.append(other)
+                counts[other] -= 4
+                counts[other] ^= which
+                owners[other] ^= key
+            counts[slot] = 0
+        return order
+
+    def _assign(self, order: list, hashes: np.ndarray, slots: tuple):
+        fingerprints = self.fingerprints.tolist()
+        prints = self._fingerprint(hashes).tolist()
+        h = [s.tolist() for s in slots]
+        for key, found in reversed(order):
+            a = h[found][key]
+            b = h[(found + 1) % 3][key]
+            c = h[(found + 2) % 3][key]
+            fingerprints[a] = prints[key] ^ fingerprints[b] ^ fingerprints[c]
+        self.fingerprints[:] = fingerprints
+
+    def add_many(self, domains, chunk_size: int = HASH_CHUNK_SIZE):
+        """Build the filter from an iterable of domains (replaces contents)."""
+        hashes = [np.empty(0, dtype=np.uint64)]
+        for keys in iter_unique_key_chunks(domains, chunk_size):
+            hashes.append(key_hashes_many(keys))
+        return self.build(np.concatenate(hashes))
+
+    def has_many(self, domains, chunk_size: int = HASH_CHUNK_SIZE) -> np.ndarray:
+        """Boolean mask, True where the domain is possibly present."""
+        results = [np.empty(0, dtype=bool)]
+        for chunk in iter_chunks(domains, chunk_size):
+            results.append(self.contains_hashes(
+                key_hashes_many([normalize_domain(d) for d in chunk])))
+        return np.concatenate(results)
+
+    def contains_hashes(self, key_hashes: np.ndarray) -> np.ndarray:
+        """Membership mask for precomputed 64-bit key hashes."""
+        hashes = self._hash(key_hashes)
+        h0, h1, h2 = self._locations(hashes)
+        f = self.fingerprints
+        return (self._fingerprint(hashes) ^ f[h0] ^ f[h1] ^ f[h2]) == 0
+
+    def has(self, domain: str) -> bool:
+        return bool(self.has_many([domain])[0])
+
+    def to_bytes(self) -> bytes:
+        header = FUSE_HEADER.pack(FUSE_MAGIC, FUSE_VERSION, self.fingerprint_bits, 0,
+                                  self.seed, self.segment_length, self.segment_count_length,
+                                  len(self.fingerprints))
+        return header + self.fingerprints.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BinaryFuseFilterBuilder':
+        """Load a filter written by to_bytes()."""
+        if len(data) < FUSE_HEADER.size or bytes(data[:4]) != FUSE_MAGIC:
+            raise ValueError("Not a binary fuse filter file")
+        (_, version, bits, _, seed, segment_length,
+         segment_count_length, length) = FUSE_HEADER.unpack_from(data)
+        if version != FUSE_VERSION:
+            raise ValueError(f"Unsupported binary fuse filter version {version}")
+        fuse = cls(0, bits)
+        fuse.seed = seed
+        fuse.segment_length = segment_length
+        fuse.segment_count_length = segment_count_length
+        fuse.fingerprints = np.frombuffer(data, dtype=fuse.dtype, count=length,
+                                          offset=FUSE_HEADER.size).copy()
+        return fuse
+
+
+def verify_fuse_filter(path: str, domains) -> int:
+    """
+    Reference verifier for a fuse filter file.
+
+    Returns:
+        Number of expected domains the file does not report present
+    """
+    with open(path, 'rb') as f:
+        fuse = BinaryFuseFilterBuilder.from_bytes(f.read())
+    return int((~fuse.has_many(domains)).sum())
+
+
+COUNTING_MAGIC = b'VCBF'
+
+
+class CountingBloomFilterBuilder:
+    """
+    Counting Bloom filter with 4-bit counters, two per byte.
+
+    Uses the same hashing and geometry as BloomFilterBuilder, so removing a
+    domain costs k counter decrements instead of a full rebuild, and
+    to_bloom() collapses it into the binary format the extension reads.
+
+    Counters saturate at 15 and are then never decremented. Removing a
+    domain that was never added can clear bits of other domains; remove_many
+    therefore only touches domains the filter currently reports present.
+    add_many increments every distinct domain of its input, including ones
+    that already test present: a false positive at insert time still owns
+    counters, so removing the domains it collided with cannot drop it.
+    """
+
+    MAX_COUNT = 15
+
+    def __init__(self, size: int, num_hashes: int = 7):
+        self.size = size
+        self.num_hashes = num_hashes
+        self.counters = np.zeros((size + 1) // 2, dtype=np.uint8)
+
+    def _counts(self, positions: np.ndarray) -> np.ndarray:
+        shifts = ((positions & np.uint64(1)) * np.uint64(4)).astype(np.uint8)
+        return (self.counters[positions >> np.uint64(1)] >> shifts) & np.uint8(0xF)
+
+    def _adjust(self, positions: np.ndarray, sign: int):
+        """Add sign * occurrences to the counter of every position."""
+        positions, occurrences = np.unique(positions.ravel(), return_counts=True)
+        # Even and odd positions share bytes; update them in separate passes
+        # so each pass writes every byte at most once
+        for parity in (0, 1):
+            selected = (positions & np.uint64(1)) == parity
+            index = positions[selected] >> np.uint64(1)
+            delta = occurrences[selected]
+            shift = np.uint8(4 * parity)
+
+            current = ((self.counters[index] >> shift) & np.uint8(0xF)).astype(np.int64)
+            if sign > 0:
+                updated = np.minimum(current + delta, self.MAX_COUNT)
+            else:
+                updated = np.where(current == self.MAX_COUNT, current,
+                                   np.maximum(current - delta, 0))
+            keep = self.counters[index] & ~np.uint8(0xF << (4 * parity))
+            self.counters[index] = keep | (updated.astype(np.uint8) << shift)
+
+    def add_many(self, domains, chunk_size: int = HASH_CHUNK_SIZE) -> int:
+        """
+        Increment the k counters of every distinct domain in the input.
+
+        Duplicates are dropped exactly across the whole input (every chunk),
+        so a domain listed twice is counted once and a single removal takes
+        it out again. Pass all domains of one build or delta in one call;
+        a domain added again by a later call is counted again.
+
+        Returns:
+            Number of distinct domains added
+        """
+        added = 0
+        seen = set()
+        for keys in iter_unique_key_chunks(domains, chunk_size):
+            keys = [key for key in keys if key not in seen]
+            seen.update(keys)
+            if not keys:
+                continue
+            added += len(keys)
+            self._adjust(hash_positions_many(keys, self.num_hashes, self.size), +1)
+        return added
+
+    def remove_many(self, domains, chunk_size: int = HASH_CHUNK_SIZE) -> int:
+        """
+        Decrement the k counters of every domain currently present.
+
+        Duplicates are dropped across the whole input, so a domain listed
+        twice is decremented once and cannot clear other domains' bits.
+
+        Returns:
+            Number of domains removed
+        """
+        removed = 0
+        seen = set()
+        for keys in iter_unique_key_chunks(domains, chunk_size):
+            keys = [key for key in keys if key not in seen]
+            seen.update(keys)
+            if not keys:
+                continue
+            positions = hash_positions_many(keys, self.num_hashes, self.size)
+            present = (self._counts(positions) > 0).all(axis=1)
+            removed += int(present.sum())
+            self._adjust(positions[present], -1)
+        return removed
+
+    def has_many(self, domains, chunk_size: int = HASH_CHUNK_SIZE) -> np.ndarray:
+        """Boolean mask, True where the domain is possibly present."""
+        results = [np.empty(0, dtype=bool)]
+        for positions in iter_position_chunks(domains, self.num_hashes, self.size, chunk_size):
+            results.append((self._counts(positions) > 0).all(axis=1))
+        return np.concatenate(results)
+
+    def to_bloom(self) -> BloomFilterBuilder:
+        """Collapse counters into a plain bit array (bit set where count > 0)."""
+        low = (self.counters & np.uint8(0xF)) > 0
+        high = (self.counters >> np.uint8(4)) > 0
+        occupied = np.stack([low, high], axis=1).ravel()[:self.size]
+        bf = BloomFilterBuilder(self.size, self.num_hashes)
+        packed = np.packbits(occupied, bitorder='little')
+        bf.bit_array[:len(packed)] = packed
+        return bf
+
+    def to_bytes(self) -> bytes:
+        """Serialize the counter state (not read by the extension)."""
+        header = struct.pack('<4sII', COUNTING_MAGIC, self.size, self.num_hashes)
+        return header + self.counters.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CountingBloomFilterBuilder':
+        """Load counter state previously written by to_bytes()."""
+        if len(data) < 12 or data[:4] != COUNTING_MAGIC:
+            raise ValueError("Not a counting Bloom filter state file")
+        _, size, num_hashes = struct.unpack_from('<4sII', data)
+        cbf = cls(size, num_hashes)
+        if len(data) - 12 < len(cbf.counters):
+            raise ValueError("Counting Bloom filter data is shorter than its declared size")
+        cbf.counters[:] = np.frombuffer(data, dtype=np.uint8, count=len(cbf.counters), offset=12)
+        return cbf
 
 
 # Built-in list of known tracker domains (subset of EasyPrivacy + common trackers)
 # In production, this would be generated from the full EasyPrivacy list
-BUILTIN_TRACKER_DOMAINS = [
+BUILTIN_TRACKER_SECTIONS = {
     # -- Major Ad/Tracking Networks --
-    "doubleclick.net",
-    "googlesyndication.com",
-    "google-analytics.com",
-    "googletagmanager.com",
-    "googleadservices.com",
-    "googletagservices.com",
-    "googlesyndication.com",
-    "2mdn.net",
-    "adnxs.com",
-    "adsrvr.org",
-    "advertising.com",
-    "amazon-adsystem.com",
-    "analytics.google.com",
-    "app-measurement.com",
-    "appsflyer.com",
-    "atdmt.com",
-    "bidswitch.net",
-    "bluekai.com",
-    "casalemedia.com",
-    "chartbeat.com",
-    "chartbeat.net",
-    "clicktale.net",
-    "cloudflareinsights.com",
-    "contextweb.com",
-    "cpm-ad.com",
-    "cpmstar.com",
-    "criteo.com",
-    "criteo.net",
-    "crwdcntrl.net",
-    "demdex.net",
-    "dotomi.com",
-    "doubleverify.com",
-    "dpm.demdex.net",
-    "eversttech.net",
-    "exelator.com",
-    "eyeota.net",
-    "facebook.net",
-    "fbcdn.net",
-    "flashtalking.com",
-    "fls.doubleclick.net",
-    "hotjar.com",
-    "hotjar.io",
-    "ib-ibi.com",
-    "id5-sync.com",
-    "igodigital.com",
-    "indexww.com",
-    "iovation.com",
-    "ipredictive.com",
-    "krxd.net",
-    "lijit.com",
-    "liveintent.com",
-    "liveramp.com",
-    "lotame.com",
-    "marketo.com",
-    "marketo.net",
-    "mathtag.com",
-    "media.net",
-    "mediamath.com",
-    "ml314.com",
-    "moatads.com",
-    "mookie1.com",
-    "myvisualiq.net",
-    "narrative.io",
-    "nativo.com",
-    "newrelic.com",
-    "nr-data.net",
-    "omtrdc.net",
-    "onetag-sys.com",
-    "openx.net",
-    "outbrain.com",
-    "owneriq.net",
-    "pardot.com",
-    "parsely.com",
-    "perimeterx.net",
-    "pinterest.com",
-    "pippio.com",
-    "pubmatic.com",
-    "quantcast.com",
-    "quantserve.com",
-    "rfihub.com",
-    "rlcdn.com",
-    "rubiconproject.com",
-    "samba.tv",
-    "scorecardresearch.com",
-    "segment.com",
-    "segment.io",
-    "serving-sys.com",
-    "sharethis.com",
-    "simpli.fi",
-    "sitescout.com",
-    "smartadserver.com",
-    "snapchat.com",
-    "sojern.com",
-    "spotxchange.com",
-    "taboola.com",
-    "tapad.com",
-    "teads.tv",
-    "tealiumiq.com",
-    "thetradedesk.com",
-    "tidaltv.com",
-    "tiktok.com",
-    "tribalfusion.com",
-    "turn.com",
-    "twitter.com",
-    "tynt.com",
-    "undertone.com",
-    "urbanairship.com",
-    "visualiq.com",
-    "w55c.net",
-    "yieldmo.com",
-    "zedo.com",
+    'ad-tracking': [
+        "doubleclick.net",
+        "googlesyndication.com",
+        "google-analytics.com",
+        "googletagmanager.com",
+        "googleadservices.com",
+        "googletagservices.com",
+        "googlesyndication.com",
+        "2mdn.net",
+        "adnxs.com",
+        "adsrvr.org",
+        "advertising.com",
+        "amazon-adsystem.com",
+        "analytics.google.com",
+        "app-measurement.com",
+        "appsflyer.com",
+        "atdmt.com",
+        "bidswitch.net",
+        "bluekai.com",
+        "casalemedia.com",
+        "chartbeat.com",
+        "chartbeat.net",
+        "clicktale.net",
+        "cloudflareinsights.com",
+        "contextweb.com",
+        "cpm-ad.com",
+        "cpmstar.com",
+        "criteo.com",
+        "criteo.net",
+        "crwdcntrl.net",
+        "demdex.net",
+        "dotomi.com",
+        "doubleverify.com",
+        "dpm.demdex.net",
+        "eversttech.net",
+        "exelator.com",
+        "eyeota.net",
+        "facebook.net",
+        "fbcdn.net",
+        "flashtalking.com",
+        "fls.doubleclick.net",
+        "hotjar.com",
+        "hotjar.io",
+        "ib-ibi.com",
+        "id5-sync.com",
+        "igodigital.com",
+        "indexww.com",
+        "iovation.com",
+        "ipredictive.com",
+        "krxd.net",
+        "lijit.com",
+        "liveintent.com",
+        "liveramp.com",
+        "lotame.com",
+        "marketo.com",
+        "marketo.net",
+        "mathtag.com",
+        "media.net",
+        "mediamath.com",
+        "ml314.com",
+        "moatads.com",
+        "mookie1.com",
+        "myvisualiq.net",
+        "narrative.io",
+        "nativo.com",
+        "newrelic.com",
+        "nr-data.net",
+        "omtrdc.net",
+        "onetag-sys.com",
+        "openx.net",
+        "outbrain.com",
+        "owneriq.net",
+        "pardot.com",
+        "parsely.com",
+        "perimeterx.net",
+        "pinterest.com",
+        "pippio.com",
+        "pubmatic.com",
+        "quantcast.com",
+        "quantserve.com",
+        "rfihub.com",
+        "rlcdn.com",
+        "rubiconproject.com",
+        "samba.tv",
+        "scorecardresearch.com",
+        "segment.com",
+        "segment.io",
+        "serving-sys.com",
+        "sharethis.com",
+        "simpli.fi",
+        "sitescout.com",
+        "smartadserver.com",
+        "snapchat.com",
+        "sojern.com",
+        "spotxchange.com",
+        "taboola.com",
+        "tapad.com",
+        "teads.tv",
+        "tealiumiq.com",
+        "thetradedesk.com",
+        "tidaltv.com",
+        "tiktok.com",
+        "tribalfusion.com",
+        "turn.com",
+        "twitter.com",
+        "tynt.com",
+        "undertone.com",
+        "urbanairship.com",
+        "visualiq.com",
+        "w55c.net",
+        "yieldmo.com",
+        "zedo.com",
+    ],
     # -- CNAME Cloaking Known Targets --
-    "omtrdc.net",
-    "adobedtm.com",
-    "eulerian.net",
-    "at-o.net",
-    "keyade.com",
-    "storetail.io",
-    "dnsdelegation.io",
-    "tracedock.com",
-    "a]kamaized.net",
-    "edgekey.net",
-    "akadns.net",
+    'cname-cloaking': [
+        "omtrdc.net",
+        "adobedtm.com",
+        "eulerian.net",
+        "at-o.net",
+        "keyade.com",
+        "storetail.io",
+        "dnsdelegation.io",
+        "tracedock.com",
+    ],
+    # -- CDNs Fronting Cloaked Trackers --
+    'cdn': [
+        "a]kamaized.net",
+        "edgekey.net",
+        "akadns.net",
+    ],
     # -- Fingerprinting Services --
-    "fingerprintjs.com",
-    "fpjs.io",
-    "areyouamhuman.com",
-    "perimeterx.net",
-    "datadome.co",
-    "hcaptcha.com",
-    "sift.com",
-    "siftscience.com",
-    "shape.com",
-    "distilnetworks.com",
-    "imperva.com",
-    "kasada.io",
-]
+    'fingerprinting': [
+        "fingerprintjs.com",
+        "fpjs.io",
+        "areyouamhuman.com",
+        "perimeterx.net",
+        "datadome.co",
+        "hcaptcha.com",
+        "sift.com",
+        "siftscience.com",
+        "shape.com",
+        "distilnetworks.com",
+        "imperva.com",
+        "kasada.io",
+    ],
+}
+
+# Flat list in section order (what the filter and manifest hash see)
+BUILTIN_TRACKER_DOMAINS = [domain for section in BUILTIN_TRACKER_SECTIONS.values()
+                           for domain in section]
+
+
+def parse_domain_line(line: str):
+    """
+    Extract a domain from one blocklist line.
+
+    Understands EasyList network rules (``||domain^`` with optional path or
+    ``$options``) and plain one-domain-per-line lists. Comments, section
+    headers and ``@@`` exception rules yield None.
+    """
+    line = line.strip()
+    if not line or line[0] in '#![' or line.startswith('@@'):
+        return None
+
+    # Extract domain from various formats
+    # Handle EasyList format: ||domain^
+    if line.startswith('||') and line.endswith('^'):
+        domain = line[2:-1]
+    elif line.startswith('||'):
+        domain = line[2:].split('$')[0].split('^')[0].split('/')[0]
+    else:
+        domain = line.split('/')[0]
+
+    if domain and '.' in domain:
+        return domain.lower()
+    return None
+
+
+def iter_domains_from_file(filepath: str, start: int = 0, end: int = None,
+                           release_every: int = 16 << 20):
+    """
+    Stream domains from a blocklist file without loading it into memory.
+
+    The file is memory-mapped and read line by line, so only the current
+    line is materialized as a Python string. Where the platform supports
+    madvise, already-consumed pages are released every `release_every`
+    bytes so resident memory does not grow with the file size.
+
+    Only lines whose first byte lies in [start, end) are read, so byte
+    ranges that tile the file yield every line exactly once.
+    """
+    can_release = hasattr(mmap, 'MADV_DONTNEED') and hasattr(mmap.mmap, 'madvise')
+    with open(filepath, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        end = file_size if end is None else min(end, file_size)
+        if start >= end:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL') and hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            if start > 0:
+                # Skip the line already owned by the previous range
+                newline = mm.find(b'\n', start - 1)
+                start = file_size if newline == -1 else newline + 1
+            mm.seek(start)
+            released = start - start % mmap.PAGESIZE
+            while mm.tell() < end:
+                domain = parse_domain_line(mm.readline().decode('utf-8', errors='replace'))
+                if domain:
+                    yield domain
+                if can_release and mm.tell() - released >= release_every:
+                    consumed = mm.tell() - mm.tell() % mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, released, consumed - released)
+                    released = consumed
 
 
 def load_domains_from_file(filepath: str):
     """Load domains from a text file (one per line)."""
-    domains = []
-    with open(filepath, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#'):
-                # Extract domain from various formats
-                # Handle EasyList format: ||domain^
-                if line.startswith('||') and line.endswith('^'):
-                    domain = line[2:-1]
-                elif line.startswith('||'):
-                    domain = line[2:].split('^')[0].split('/')[0]
-                else:
-                    domain = line.split('/')[0]
-
-                if domain and '.' in domain:
-                    domains.append(domain.lower())
-    return domains
+    return list(iter_domains_from_file(filepath))
+
+
+def iter_chunks(iterable, chunk_size: int = HASH_CHUNK_SIZE):
+    """Group an iterable into lists of at most chunk_size items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_unique_key_chunks(domains, chunk_size: int = HASH_CHUNK_SIZE):
+    """Yield chunks of normalized keys with in-chunk duplicates removed."""
+    for chunk in iter_chunks(domains, chunk_size):
+        yield list(dict.fromkeys(normalize_domain(d) for d in chunk))
+
+
+def iter_delta_domains(paths):
+    """Chain the domains of several delta files into one stream."""
+    for path in paths:
+        yield from iter_domains_from_file(path)
+
+
+def _leading_zeros64(x: np.ndarray) -> np.ndarray:
+    """Count leading zero bits of each uint64 element."""
+    x = x.copy()
+    count = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        top_clear = x < np.uint64(1 << (64 - shift))
+        count += np.where(top_clear, shift, 0)
+        x = np.where(top_clear, x << np.uint64(shift), x)
+    count += (x == 0)
+    return count
+
+
+class DistinctCounter:
+    """
+    Bounded-memory distinct count of hashed keys.
+
+    Keys are identified by their 64-bit (h1, h2) hash pair. Counting is
+    exact while fewer than `exact_limit` distinct pairs have been seen;
+    past that the exact set is dropped and a HyperLogLog sketch with
+    2**precision registers (relative error ~1.04 / sqrt(2**precision))
+    takes over, so memory never exceeds roughly 8 * exact_limit bytes.
+    """
+
+    def __init__(self, precision: int = 14, exact_limit: int = 1 << 20):
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+        self._exact = np.empty(0, dtype=np.uint64)
+        self._pending = []
+        self._pending_size = 0
+
+    @property
+    def exact(self) -> bool:
+        return self._exact is not None
+
+    def update(self, h1: np.ndarray, h2: np.ndarray):
+        """Record a batch of keys given their two 32-bit seed hashes."""
+        x = (h1.astype(np.uint64) << np.uint64(32)) | h2.astype(np.uint64)
+        p = np.uint64(self.precision)
+        index = (x >> (np.uint64(64) - p)).astype(np.intp)
+        rank = _leading_zeros64(x << p) + 1
+        rank = np.minimum(rank, 64 - self.precision + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+        if self.exact:
+            self._pending.append(x)
+            self._pending_size += len(x)
+            if self._pending_size >= self.exact_limit:
+                self._compact()
+
+    def merge(self, other: 'DistinctCounter'):
+        """Fold another counter with the same precision into this one."""
+        np.maximum(self.registers, other.registers, out=self.registers)
+        if self.exact and other.exact:
+            self._pending.extend([other._exact] + other._pending)
+            self._compact()
+        else:
+            self._exact = None
+            self._pending = []
+            self._pending_size = 0
+
+    def _compact(self):
+        self._exact = np.unique(np.concatenate([self._exact] + self._pending))
+        self._pending = []
+        self._pending_size = 0
+        if len(self._exact) > self.exact_limit:
+            self._exact = None
+
+    def count(self) -> int:
+        """Number of distinct keys seen so far (exact or estimated)."""
+        if self.exact:
+            self._compact()
+        if self.exact:
+            return len(self._exact)
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+def scan_domain_source(domains, chunk_size: int = HASH_CHUNK_SIZE):
+    """
+    First streaming pass: count parsed and distinct domains.
+
+    Returns:
+        (total parsed entries, distinct normalized domains, exact flag)
+    """
+    total, counter = _scan_domains(domains, chunk_size)
+    return total, counter.count(), counter.exact
+
+
+def _scan_domains(domains, chunk_size: int):
+    counter = DistinctCounter()
+    total = 0
+    for chunk in iter_chunks(domains, chunk_size):
+        total += len(chunk)
+        keys = list(dict.fromkeys(normalize_domain(d) for d in chunk))
+        counter.update(*murmurhash3_32_many(keys))
+    return total, counter
+
+
+def make_shards(input_path: str = None, domains=None, workers: int = 1):
+    """
+    Split a domain source into `workers` independent shards.
+
+    A file is split into byte ranges that each worker reads through its own
+    memory map (no domain strings cross process boundaries); an in-memory
+    list is split into contiguous slices.
+    """
+    workers = max(1, workers)
+    if input_path is not None:
+        file_size = os.path.getsize(input_path)
+        step = max(1, math.ceil(file_size / workers))
+        return [('file', input_path, start, min(start + step, file_size))
+                for start in range(0, file_size, step)] or [('file', input_path, 0, 0)]
+
+    domains = list(domains)
+    step = max(1, math.ceil(len(domains) / workers))
+    return [('list', domains[start:start + step])
+            for start in range(0, len(domains), step)] or [('list', [])]
+
+
+def iter_shard(shard):
+    """Iterate the raw domains of one shard produced by make_shards()."""
+    if shard[0] == 'file':
+        _, path, start, end = shard
+        return iter_domains_from_file(path, start, end)
+    return iter(shard[1])
+
+
+def _scan_shard(shard, chunk_size: int):
+    return _scan_domains(iter_shard(shard), chunk_size)
+
+
+def _build_shard(shard, size: int, num_hashes: int, chunk_size: int, layout: str = 'classic'):
+    """
+    Hash one shard into a private bit array of the final size/k.
+
+    Each chunk is verified right after insertion; bits are never cleared
+    and the private array is a subset of the merged one, so this equals a
+    final membership check.
+    """
+    bf = new_filter(layout, size, num_hashes)
+    missing = []
+    missing_count = 0
+    for keys in iter_unique_key_chunks(iter_shard(shard), chunk_size):
+        bf.add_many(keys)
+        present = bf.has_many(keys)
+        if not present.all():
+            missing_count += int((~present).sum())
+            missing.extend(k for k, ok in zip(keys, present) if not ok)
+            del missing[5:]
+    return bf.bit_array, missing_count, missing
+
+
+def scan_shards(shards, chunk_size: int = HASH_CHUNK_SIZE, executor=None):
+    """
+    Count parsed and distinct domains across shards.
+
+    Per-shard counters are merged, so the result is identical to a
+    single-process scan of the whole source.
+    """
+    mapper = executor.map if executor else map
+    total = 0
+    counter = None
+    for shard_total, shard_counter in mapper(_scan_shard, shards, itertools.repeat(chunk_size)):
+        total += shard_total
+        if counter is None:
+            counter = shard_counter
+        else:
+            counter.merge(shard_counter)
+    return total, counter.count(), counter.exact
+
+
+def build_shards(shards, size: int, num_hashes: int,
+                 chunk_size: int = HASH_CHUNK_SIZE, executor=None, layout: str = 'classic'):
+    """
+    Build a filter by OR-reducing per-shard bit arrays.
+
+    Returns:
+        (filter builder of the given layout, missing domain count,
+         up to 5 missing examples)
+    """
+    mapper = executor.map if executor else map
+    bf = new_filter(layout, size, num_hashes)
+    missing = []
+    missing_count = 0
+    results = mapper(_build_shard, shards, itertools.repeat(size),
+                     itertools.repeat(num_hashes), itertools.repeat(chunk_size),
+                     itertools.repeat(layout))
+    for bits, shard_missing_count, shard_missing in results:
+        np.bitwise_or(bf.bit_array, bits, out=bf.bit_array)
+        missing_count += shard_missing_count
+        missing.extend(shard_missing)
+    return bf, missing_count, missing[:5]
+
+
+def _hash_shard(shard, chunk_size: int):
+    """Parsed entry count and unique 64-bit key hashes of one shard."""
+    total = 0
+    hashes = [np.empty(0, dtype=np.uint64)]
+    for chunk in iter_chunks(iter_shard(shard), chunk_size):
+        total += len(chunk)
+        keys = list(dict.fromkeys(normalize_domain(d) for d in chunk))
+        hashes.append(np.unique(key_hashes_many(keys)))
+    return total, np.unique(np.concatenate(hashes))
+
+
+def build_fuse_filter(shards, fingerprint_bits: int, chunk_size: int, workers: int,
+                      timings: dict, source_label: str) -> BinaryFuseFilterBuilder:
+    """Hash every shard (in parallel with workers > 1) and build a fuse filter."""
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with stage_timer(timings, 'scan'):
+            mapper = executor.map if executor else map
+            parts = list(mapper(_hash_shard, shards, itertools.repeat(chunk_size)))
+    finally:
+        if executor:
+            executor.shutdown()
+    key_hashes = np.unique(np.concatenate([hashes for _, hashes in parts]))
+    print(source_label.format(sum(total for total, _ in parts)))
+    print(f"Unique domains: {len(key_hashes)}")
+    if not len(key_hashes):
+        print("ERROR: no domains to add")
+        sys.exit(1)
+
+    with stage_timer(timings, 'build'):
+        fuse = BinaryFuseFilterBuilder(len(key_hashes), fingerprint_bits).build(key_hashes)
+    print(f"Binary fuse filter parameters: {fingerprint_bits}-bit fingerprints, "
+          f"{len(fuse.fingerprints)} slots ({fuse.fingerprints.nbytes} bytes)")
+
+    missing_count = int((~fuse.contains_hashes(key_hashes)).sum())
+    if missing_count:
+        print(f"ERROR: {missing_count} domains missing from filter!")
+        sys.exit(1)
+    return fuse
+
+
+@contextlib.contextmanager
+def stage_timer(timings: dict, stage: str):
+    """Record the wall-clock duration of a build stage into `timings`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - started
+
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def manifest_path(filter_path: str) -> str:
+    """Path of the sidecar manifest written next to a filter file."""
+    return filter_path + MANIFEST_SUFFIX
+
+
+def file_sha256(filepath: str, block_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def builtin_domains_sha256() -> str:
+    """Hex SHA-256 identifying the built-in tracker list."""
+    return hashlib.sha256('\n'.join(BUILTIN_TRACKER_DOMAINS).encode('utf-8')).hexdigest()
+
+
+def load_manifest(filter_path: str):
+    """Load the sidecar manifest of a filter, or None if absent/unreadable."""
+    try:
+        with open(manifest_path(filter_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(filter_path: str, bf: BloomFilterBuilder, item_count: int,
+                   fp_rate: float, sources: dict, additions: dict, removals: dict = None,
+                   capacity_headroom: float = DEFAULT_CAPACITY_HEADROOM):
+    """
+    Write the sidecar manifest describing a filter file.
+
+    The manifest records everything the incremental mode needs to decide
+    between updating in place and rebuilding without rescanning any list:
+    the filter geometry and the capacity headroom it was sized with, the
+    number of distinct items inserted and the SHA-256 of every source list
+    and applied additions/removals delta.
+    """
+    manifest = {
+        'size': bf.size,
+        'num_hashes': bf.num_hashes,
+        'layout': 'blocked' if isinstance(bf, BlockedBloomFilterBuilder) else 'classic',
+        'item_count': int(item_count),
+        'fp_rate': fp_rate,
+        'capacity_headroom': capacity_headroom,
+        'fill_ratio': bf.fill_ratio(),
+        'sources': sources,
+        'additions': additions,
+        'removals': removals or {},
+        'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    with open(manifest_path(filter_path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def accumulated_deltas(manifest, kind: str, current: dict) -> dict:
+    """
+    Delta files recorded in a manifest plus the ones given for this run.
+
+    Deltas stay in effect after they are applied, so an incremental run
+    keeps every earlier additions/removals file and a fallback rebuild
+    replays all of them, not just the current run's. Digests are
+    recomputed so an edited file is applied again; files that no longer
+    exist are dropped.
+    """
+    deltas = {}
+    for path in (manifest or {}).get(kind, {}):
+        if path in current:
+            continue
+        if os.path.exists(path):
+            deltas[path] = file_sha256(path)
+        else:
+            print(f"WARNING: {kind} file {path} from the manifest no longer exists, dropping it")
+    deltas.update(current)
+    return deltas
+
+
+def projected_fp_rate(fill_ratio: float, num_hashes: int) -> float:
+    """False-positive rate implied by the fraction of set bits."""
+    return fill_ratio ** num_hashes
+
+
+NEGATIVE_SYLLABLES = [
+    'ba', 'ca', 'da', 'fa', 'ga', 'ha', 'ka', 'la', 'ma', 'na', 'pa', 'ra', 'sa', 'ta',
+    'va', 'za', 'be', 'de', 'fe', 'ge', 'le', 'me', 'ne', 're', 'se', 'te', 've', 'bi',
+    'di', 'fi', 'gi', 'ki', 'li', 'mi', 'ni', 'pi', 'ri', 'si', 'ti', 'vi', 'bo', 'co',
+    'do', 'fo', 'go', 'lo', 'mo', 'no', 'po', 'ro', 'so', 'to', 'bu', 'cu', 'du', 'lu',
+    'mu', 'nu', 'pu', 'ru', 'su', 'tu', 'shop', 'news', 'net', 'web', 'cloud', 'tech',
+    'home', 'blog', 'city', 'book', 'land', 'hub', 'lab', 'box', 'star', 'line',
+]
+NEGATIVE_SUBDOMAINS = ['www', 'cdn', 'api', 'static', 'img', 'm', 'shop', 'mail', 'app', 'blog']
+NEGATIVE_TLDS = ['com'] * 8 + ['net', 'org'] * 2 + [
+    'io', 'co', 'de', 'uk', 'ru', 'fr', 'jp', 'br', 'info', 'app', 'dev', 'nl', 'it', 'pl']
+
+
+def generate_negative_domains(count: int, seed: int = 20240601):
+    """
+    Yield `count` realistic-looking non-tracker domains.
+
+    Labels are 2-4 random syllables with an optional number, under a
+    weighted mix of TLDs and, for ~40% of names, a common subdomain, so the
+    length and character distribution resemble real hostnames rather than
+    a fixed template.
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        label = ''.join(rng.choice(NEGATIVE_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.2:
+            label += str(rng.randint(1, 999))
+        domain = f"{label}.{rng.choice(NEGATIVE_TLDS)}"
+        if rng.random() < 0.4:
+            domain = f"{rng.choice(NEGATIVE_SUBDOMAINS)}.{domain}"
+        yield domain
+
+
+def wilson_interval(successes: int, trials: int, z: float = 1.96):
+    """Wilson score confidence interval for a binomial proportion."""
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def analytic_fp_rate(filt) -> float:
+    """
+    Expected false positive rate of a built filter.
+
+    fill_ratio ** k for Bloom filters (exact for the classic layout, a
+    lower bound for the blocked one) and 2 ** -bits for fuse filters.
+    """
+    if isinstance(filt, BinaryFuseFilterBuilder):
+        return 2.0 ** -filt.fingerprint_bits
+    fill = int(np.unpackbits(filt.bit_array).sum()) / filt.size
+    return projected_fp_rate(fill, filt.num_hashes)
+
+
+def filter_nbytes(filt) -> int:
+    """Payload size of a filter in bytes (without header)."""
+    if isinstance(filt, BinaryFuseFilterBuilder):
+        return int(filt.fingerprints.nbytes)
+    return int(filt.bit_array.nbytes)
+
+
+def evaluate_false_positive_rate(filt, negatives, target_fp_rate: float,
+                                 chunk_size: int = HASH_CHUNK_SIZE, z: float = 1.96,
+                                 max_fp_rate: float = None, max_size_bytes: int = None,
+                                 min_probes_per_sec: float = None) -> dict:
+    """
+    Probe a filter with known negatives in batches and report its FP rate.
+
+    Args:
+        filt: Any filter with has_many() (builders or BloomFilterView)
+        negatives: Iterable of domains known not to be in the filter
+        target_fp_rate: FP rate the filter was sized for
+        z: Normal quantile of the confidence interval (1.96 = 95%)
+        max_fp_rate: Optional FP budget, failed when the CI lower bound
+            is above it (i.e. the excess is statistically significant)
+        max_size_bytes: Optional payload size budget
+        min_probes_per_sec: Optional lookup throughput budget
+
+    Returns:
+        JSON-serializable report; 'passed' is False when any budget is
+        exceeded
+    """
+    probes = false_positives = 0
+    probe_seconds = 0.0
+    for chunk in iter_chunks(negatives, chunk_size):
+        started = time.perf_counter()
+        hits = filt.has_many(chunk, chunk_size)
+        probe_seconds += time.perf_counter() - started
+        probes += len(chunk)
+        false_positives += int(hits.sum())
+
+    fp_rate = false_positives / probes if probes else 0.0
+    ci_low, ci_high = wilson_interval(false_positives, probes, z)
+    probes_per_sec = probes / probe_seconds if probe_seconds else 0.0
+    size_bytes = filter_nbytes(filt)
+
+    failures = []
+    if max_fp_rate is not None and ci_low > max_fp_rate:
+        failures.append(f"FP rate {fp_rate:.6f} (CI low {ci_low:.6f}) above budget {max_fp_rate}")
+    if max_size_bytes is not None and size_bytes > max_size_bytes:
+        failures.append(f"size {size_bytes} bytes above budget {max_size_bytes}")
+    if min_probes_per_sec is not None and probes_per_sec < min_probes_per_sec:
+        failures.append(f"{probes_per_sec:.0f} probes/sec below budget {min_probes_per_sec:.0f}")
+
+    return {
+        'probes': probes,
+        'false_positives': false_positives,
+        'fp_rate': fp_rate,
+        'confidence': {'z': z, 'low': ci_low, 'high': ci_high},
+        'analytic_fp_rate': analytic_fp_rate(filt),
+        'target_fp_rate': target_fp_rate,
+        'size_bytes': size_bytes,
+        'probes_per_sec': probes_per_sec,
+        'ns_per_probe': 1e9 / probes_per_sec if probes_per_sec else None,
+        'budget': {
+            'max_fp_rate': max_fp_rate,
+            'max_size_bytes': max_size_bytes,
+            'min_probes_per_sec': min_probes_per_sec,
+        },
+        'passed': not failures,
+        'failures': failures,
+    }
+
+
+def apply_additions(bf: BloomFilterBuilder, additions, chunk_size: int = HASH_CHUNK_SIZE) -> int:
+    """
+    OR the domains of an additions delta into an existing filter.
+
+    Returns:
+        Number of added keys that were not already reported present
+    """
+    added = 0
+    for keys in iter_unique_key_chunks(additions, chunk_size):
+        added += int((~bf.has_many(keys)).sum())
+        bf.add_many(keys)
+    return added
+
+
+def build_filter(shards, fp_rate: float, chunk_size: int, workers: int,
+                 timings: dict, source_label: str, layout: str = 'classic',
+                 headroom: float = DEFAULT_CAPACITY_HEADROOM):
+    """
+    Full two-pass build of a filter from shards.
+
+    The filter is sized for `headroom` times the distinct domains, so it
+    stays within `fp_rate` while incremental additions fill that room.
+
+    Returns:
+        (BloomFilterBuilder, number of distinct domains inserted)
+    """
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with stage_timer(timings, 'scan'):
+            total, unique, exact = scan_shards(shards, chunk_size, executor)
+        print(source_label.format(total))
+        if not unique:
+            print("ERROR: no domains to add")
+            sys.exit(1)
+        print(f"Unique domains: {unique}{'' if exact else ' (HyperLogLog estimate)'}")
+
+        # Calculate optimal parameters for the capacity, not just today's list
+        capacity = max(unique, math.ceil(unique * headroom))
+        if layout == 'blocked':
+            size, num_hashes = calculate_blocked_params(capacity, fp_rate)
+        else:
+            size, num_hashes = calculate_optimal_params(capacity, fp_rate)
+        print(f"Bloom filter parameters: layout={layout}, capacity={capacity}, "
+              f"size={size} bits ({size // 8} bytes), k={num_hashes}")
+
+        # Build and verify every shard, then OR-merge into the final filter
+        with stage_timer(timings, 'build'):
+            bf, missing_count, missing = build_shards(shards, size, num_hashes,
+                                                      chunk_size, executor, layout)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if missing_count:
+        print(f"ERROR: {missing_count} domains missing from filter!")
+        for d in missing:
+            print(f"  - {d}")
+        sys.exit(1)
+
+    return bf, unique
+
+
+def update_filter(output: str, manifest: dict, sources: dict, additions: dict,
+                  fp_rate: float, chunk_size: int, timings: dict, layout: str = 'classic'):
+    """
+    Try to bring an existing filter up to date without a rebuild.
+
+    Returns:
+        (BloomFilterBuilder, item count) after applying the pending additions,
+        'unchanged' when nothing needs doing, or None when a full rebuild is
+        required (no usable manifest, changed sources without a delta, or a
+        projected false-positive rate above `fp_rate`).
+    """
+    with open(output, 'rb') as f:
+        bf = read_filter(f.read())
+    if (not manifest or manifest.get('size') != bf.size
+            or manifest.get('num_hashes') != bf.num_hashes
+            or manifest.get('layout', 'classic') != layout):
+        print("Incremental: no matching manifest, rebuilding")
+        return None
+
+    pending = {path: digest for path, digest in additions.items()
+               if manifest.get('additions', {}).get(path) != digest}
+    if not pending:
+        if manifest.get('sources') == sources:
+            return 'unchanged'
+        print("Incremental: source lists changed without an additions delta, rebuilding")
+        return None
+
+    with stage_timer(timings, 'apply'):
+        added = 0
+        for path in pending:
+            added += apply_additions(bf, iter_domains_from_file(path), chunk_size)
+    item_count = manifest['item_count'] + added
+    projected = projected_fp_rate(bf.fill_ratio(), bf.num_hashes)
+    print(f"Incremental: added {added} new domains "
+          f"({item_count} total, fill ratio {bf.fill_ratio():.4f}, "
+          f"projected FP rate {projected:.5f})")
+    if projected > fp_rate:
+        print(f"Incremental: projected FP rate exceeds {fp_rate}, rebuilding")
+        return None
+    return bf, item_count
+
+
+def build_counting_filter(shards, size: int, num_hashes: int,
+                          chunk_size: int = HASH_CHUNK_SIZE) -> CountingBloomFilterBuilder:
+    """Insert every shard into a counting filter of the given geometry."""
+    cbf = CountingBloomFilterBuilder(size, num_hashes)
+    # One call, so a domain repeated across shards is counted once
+    cbf.add_many(itertools.chain.from_iterable(iter_shard(shard) for shard in shards), chunk_size)
+    return cbf
+
+
+def update_counting_filter(state_path: str, manifest: dict, sources: dict,
+                           additions: dict, removals: dict, fp_rate: float,
+                           chunk_size: int, timings: dict):
+    """
+    Apply pending additions and removals to a saved counting filter.
+
+    Returns:
+        (CountingBloomFilterBuilder, item count), 'unchanged', or None when
+        a full rebuild is required (same rules as update_filter()).
+    """
+    with open(state_path, 'rb') as f:
+        cbf = CountingBloomFilterBuilder.from_bytes(f.read())
+    if (not manifest or manifest.get('size') != cbf.size
+            or manifest.get('num_hashes') != cbf.num_hashes):
+        print("Counting: no matching manifest, rebuilding")
+        return None
+
+    pending_additions = [path for path, digest in additions.items()
+                         if manifest.get('additions', {}).get(path) != digest]
+    pending_removals = [path for path, digest in removals.items()
+                        if manifest.get('removals', {}).get(path) != digest]
+    if not pending_additions and not pending_removals:
+        if manifest.get('sources') == sources:
+            return 'unchanged'
+        print("Counting: source lists changed without a delta, rebuilding")
+        return None
+
+    added = removed = 0
+    with stage_timer(timings, 'apply'):
+        added = cbf.add_many(iter_delta_domains(pending_additions), chunk_size)
+        removed = cbf.remove_many(iter_delta_domains(pending_removals), chunk_size)
+
+    item_count = manifest['item_count'] + added - removed
+    fill_ratio = cbf.to_bloom().fill_ratio()
+    projected = projected_fp_rate(fill_ratio, cbf.num_hashes)
+    print(f"Counting: added {added}, removed {removed} domains "
+          f"({item_count} total, fill ratio {fill_ratio:.4f}, "
+          f"projected FP rate {projected:.5f})")
+    if projected > fp_rate:
+        print(f"Counting: projected FP rate exceeds {fp_rate}, rebuilding")
+        return None
+    return cbf, item_count
 
 
 def main():
@@ -285,55 +1760,174 @@ def main():
     parser = argparse.ArgumentParser(description='Build Bloom filter for tracker domains')
     parser.add_argument('--input', '-i', help='Input domain list file (one domain per line)')
     parser.add_argument('--output', '-o',
-                        default=os.path.join(os.path.dirname(__file__), '..', '..',
-                                             '02_Extension_App', 'core', 'data', 'tracker_bloom.bin'),
-                        help='Output binary file path')
+                        help='Output binary file path (default: the extension\'s '
+                             'tracker_bloom.bin, classic layout only)')
     parser.add_argument('--fp-rate', type=float, default=0.001,
                         help='Target false positive rate (default: 0.001)')
+    parser.add_argument('--chunk-size', type=int, default=HASH_CHUNK_SIZE,
+                        help=f'Domains hashed per streaming chunk (default: {HASH_CHUNK_SIZE})')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Build shards in N worker processes and OR-merge them (default: 1)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Update the existing output in place when its projected '
+                             'FP rate stays within --fp-rate; rebuild otherwise')
+    parser.add_argument('--capacity-headroom', type=float, default=DEFAULT_CAPACITY_HEADROOM,
+                        help='Size full builds for this many times the distinct domains so '
+                             f'--incremental additions fit in place (default: {DEFAULT_CAPACITY_HEADROOM})')
+    parser.add_argument('--add', action='append', default=[], metavar='FILE',
+                        help='Domain additions delta to apply (repeatable)')
+    parser.add_argument('--remove', action='append', default=[], metavar='FILE',
+                        help='Domain removals delta to apply (repeatable, needs --counting-state)')
+    parser.add_argument('--counting-state', metavar='FILE',
+                        help='Counting Bloom filter state kept next to the output so '
+                             'removals cost k decrements instead of a rebuild')
+
+    parser.add_argument('--layout', choices=sorted(LAYOUTS) + ['fuse'], default='classic',
+                        help='classic: legacy <II header read by the extension; '
+                             'blocked: 64-byte blocks with the versioned header; '
+                             'fuse: static binary fuse filter (VBFF format)')
+    parser.add_argument('--fp-probes', type=int,
+                        help='Generated negative domains probed for the FP estimate '
+                             f'(default: {DEFAULT_FP_PROBES}; in-place updates skip the '
+                             'probe unless this or another --fp-*/budget option is given)')
+    parser.add_argument('--fp-negatives', metavar='FILE',
+                        help='Held-out non-tracker domain list to probe instead')
+    parser.add_argument('--fp-report', metavar='FILE',
+                        help='Write the FP evaluation report as JSON')
+    parser.add_argument('--max-fp-rate', type=float,
+                        help='Fail the build if the measured FP rate is significantly above this')
+    parser.add_argument('--max-size-bytes', type=int,
+                        help='Fail the build if the filter payload exceeds this size')
+    parser.add_argument('--min-probes-per-sec', type=float,
+                        help='Fail the build if batched lookups are slower than this')
+    parser.add_argument('--fingerprint-bits', type=int, choices=(8, 16),
+                        help='Fuse filter fingerprint size (default: 8 if --fp-rate '
+                             '>= 1/256, else 16)')
 
     args = parser.parse_args()
+    if args.output is None:
+        if args.layout != 'classic':
+            parser.error(f'--layout {args.layout} requires --output')
+        args.output = DEFAULT_FILTER_PATH
+    elif args.layout != 'classic' and os.path.abspath(args.output) == DEFAULT_FILTER_PATH:
+        # bloom-filter.js only parses the legacy <II header
+        parser.error(f'--layout {args.layout} cannot be written to {DEFAULT_FILTER_PATH}; '
+                     'the extension only reads the classic layout')
+    if args.capacity_headroom < 1:
+        parser.error('--capacity-headroom must be at least 1')
+    if args.remove and not args.counting_state:
+        parser.error('--remove requires --counting-state')
+    if args.counting_state and args.layout != 'classic':
+        parser.error('--counting-state only supports the classic layout')
+    if args.layout == 'fuse' and (args.incremental or args.remove):
+        parser.error('fuse filters are static; rebuild instead of --incremental/--remove')
 
-    # Load domains
+    # Domains are streamed twice (sizing, then insertion), never held in full
     if args.input and os.path.exists(args.input):
-        domains = load_domains_from_file(args.input)
-        print(f"Loaded {len(domains)} domains from {args.input}")
+        shards = make_shards(input_path=args.input, workers=args.workers)
+        sources = {args.input: file_sha256(args.input)}
+        source_label = f"Loaded {{}} domains from {args.input}"
     else:
-        domains = BUILTIN_TRACKER_DOMAINS
-        print(f"Using {len(domains)} built-in tracker domains")
-
-    # Remove duplicates
-    domains = list(set(domains))
-    print(f"Unique domains: {len(domains)}")
-
-    # Calculate optimal parameters
-    size, num_hashes = calculate_optimal_params(len(domains), args.fp_rate)
-    print(f"Bloom filter parameters: size={size} bits ({size // 8} bytes), k={num_hashes}")
-
-    # Build the filter
-    bf = BloomFilterBuilder(size, num_hashes)
-    for domain in domains:
-        bf.add(domain)
-
-    # Verify all domains are present
-    missing = [d for d in domains if not bf.has(d)]
-    if missing:
-        print(f"ERROR: {len(missing)} domains missing from filter!")
-        for d in missing[:5]:
-            print(f"  - {d}")
-        sys.exit(1)
+        shards = make_shards(domains=BUILTIN_TRACKER_DOMAINS, workers=args.workers)
+        sources = {'builtin': builtin_domains_sha256()}
+        source_label = "Using {} built-in tracker domains"
+    additions = {path: file_sha256(path) for path in args.add}
+    removals = {path: file_sha256(path) for path in args.remove}
+
+    timings = {}
+    result = None
+    cbf = None
+    manifest = load_manifest(args.output)
+    headroom = args.capacity_headroom
+    in_place = False
+    if args.incremental or args.counting_state:
+        additions = accumulated_deltas(manifest, 'additions', additions)
+        removals = accumulated_deltas(manifest, 'removals', removals)
+    if args.layout == 'fuse':
+        for path in args.add:
+            shards += make_shards(input_path=path, workers=args.workers)
+        bits = args.fingerprint_bits or (8 if args.fp_rate >= 1 / 256 else 16)
+        bf = build_fuse_filter(shards, bits, args.chunk_size, args.workers,
+                               timings, source_label)
+        result = bf, None
+    elif args.counting_state and os.path.exists(args.counting_state):
+        result = update_counting_filter(args.counting_state, manifest, sources, additions,
+                                        removals, args.fp_rate, args.chunk_size, timings)
+        if isinstance(result, tuple):
+            cbf, item_count = result
+            result = cbf.to_bloom(), item_count
+    elif args.incremental and os.path.exists(args.output):
+        result = update_filter(args.output, manifest, sources, additions,
+                               args.fp_rate, args.chunk_size, timings, args.layout)
+    if result == 'unchanged':
+        print(f"{args.output} is up to date")
+        return
 
-    # Test false positive rate with random non-tracker domains
-    test_domains = [f"test{i}random{i*7}.example{i}.com" for i in range(10000)]
-    false_positives = sum(1 for d in test_domains if bf.has(d))
-    actual_fp_rate = false_positives / len(test_domains)
-    print(f"Estimated false positive rate: {actual_fp_rate:.4f} (target: {args.fp_rate})")
+    if result is None:
+        for path in additions:
+            shards += make_shards(input_path=path, workers=args.workers)
+        if additions:
+            source_label += f" plus {len(additions)} additions file(s)"
+        bf, item_count = build_filter(shards, args.fp_rate, args.chunk_size, args.workers,
+                                      timings, source_label, args.layout, args.capacity_headroom)
+        if args.counting_state:
+            with stage_timer(timings, 'counting'):
+                cbf = build_counting_filter(shards, bf.size, bf.num_hashes, args.chunk_size)
+                item_count -= cbf.remove_many(iter_delta_domains(removals), args.chunk_size)
+                bf = cbf.to_bloom()
+    else:
+        bf, item_count = result
+        if args.layout != 'fuse':
+            # Updated in place: the geometry, and so its headroom, is unchanged
+            headroom = (manifest or {}).get('capacity_headroom', 1.0)
+            in_place = True
+
+    # Probe the false positive rate with known non-tracker domains. In-place
+    # updates were already gated on the projected rate from the fill ratio
+    measure = any(option is not None for option in (
+        args.fp_probes, args.fp_negatives, args.fp_report,
+        args.max_fp_rate, args.max_size_bytes, args.min_probes_per_sec))
+    if in_place and not measure:
+        print(f"Skipping FP probe for in-place update (projected rate within {args.fp_rate}; "
+              "pass --fp-probes to measure)")
+    else:
+        with stage_timer(timings, 'fp-probe'):
+            if args.fp_negatives:
+                negatives = iter_domains_from_file(args.fp_negatives)
+            else:
+                negatives = generate_negative_domains(args.fp_probes or DEFAULT_FP_PROBES)
+            report = evaluate_false_positive_rate(bf, negatives, args.fp_rate, args.chunk_size,
+                                                  max_fp_rate=args.max_fp_rate,
+                                                  max_size_bytes=args.max_size_bytes,
+                                                  min_probes_per_sec=args.min_probes_per_sec)
+        print(f"Estimated false positive rate: {report['fp_rate']:.4f} "
+              f"(95% CI {report['confidence']['low']:.4f}-{report['confidence']['high']:.4f}, "
+              f"analytic {report['analytic_fp_rate']:.4f}, {report['probes']} probes, "
+              f"target: {args.fp_rate})")
+        if args.fp_report:
+            with open(args.fp_report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"FP report written to {args.fp_report}")
+        if not report['passed']:
+            for failure in report['failures']:
+                print(f"ERROR: {failure}")
+            sys.exit(1)
 
     # Write output
-    os.makedirs(os.path.dirname(args.output), exist_ok=True)
-    data = bf.to_bytes()
-    with open(args.output, 'wb') as f:
-        f.write(data)
+    with stage_timer(timings, 'write'):
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        data = bf.to_bytes()
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        if not isinstance(bf, BinaryFuseFilterBuilder):
+            write_manifest(args.output, bf, item_count, args.fp_rate,
+                           sources, additions, removals, headroom)
+        if cbf is not None:
+            with open(args.counting_state, 'wb') as f:
+                f.write(cbf.to_bytes())
 
+    print(f"Stage timings ({len(shards)} shard(s), {args.workers} worker(s)): "
+          + ', '.join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items()))
     print(f"Written {len(data)} bytes to {args.output}")
     print("Done!")
 
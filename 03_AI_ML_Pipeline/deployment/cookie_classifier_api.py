@@ -4,12 +4,25 @@ This service uses a Hugging Face model to classify cookies into categories
 """
 
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, stream_with_context
 from flask_cors import CORS
-from huggingface_hub import InferenceClient
 import re
-from typing import Dict, List, Any
+import bisect
+import contextlib
+import functools
+import queue
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field, is_dataclass
+from concurrent.futures import Future
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple, TypedDict
 import logging
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,8 +36,54 @@ CORS(app)  # Enable CORS for Chrome extension
 HF_TOKEN = os.getenv('HF_TOKEN', '')  # Set via environment variable
 MODEL_NAME = os.getenv('MODEL_NAME', 'distilbert-base-uncased-finetuned-sst-2-english')
 
-# Initialize client
-client = InferenceClient(token=HF_TOKEN)
+# Local CPU inference (no network needed); falls back to rules when the
+# checkpoint cannot be loaded
+USE_LOCAL_MODEL = os.getenv('USE_LOCAL_MODEL', '1') != '0'
+
+# When the local model loads: 'eager' (during import; pair with gunicorn
+# --preload so forked workers share the weights copy-on-write), 'background'
+# (a thread loads it while the rules answer requests) or 'lazy' (on the
+# first classification)
+MODEL_LOAD_MODE = os.getenv('MODEL_LOAD_MODE', 'background')
+LOCAL_MODEL_PATH = os.getenv('LOCAL_MODEL_PATH', MODEL_NAME)
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 32))
+INFERENCE_MAX_SEQ_LENGTH = int(os.getenv('INFERENCE_MAX_SEQ_LENGTH', 64))
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 0))  # 0 = runtime default
+
+# Backend for the local model: 'transformers' (PyTorch) or 'onnx' (ONNX Runtime,
+# directory from export_onnx_model.py; ONNX_MODEL_FILE=model.int8.onnx for INT8)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'transformers')
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', LOCAL_MODEL_PATH)
+ONNX_MODEL_FILE = os.getenv('ONNX_MODEL_FILE', 'model.onnx')
+
+# Cross-request micro-batching for /classify
+MICRO_BATCHING = os.getenv('MICRO_BATCHING', '1') != '0'
+MICRO_BATCH_TIMEOUT = float(os.getenv('MICRO_BATCH_TIMEOUT', 30))
+
+# Cookies classified per step of /classify-stream
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 512))
+
+# Request/response JSON codec: 'auto' (orjson, then msgspec, then stdlib),
+# 'orjson', 'msgspec' or 'json'
+JSON_CODEC = os.getenv('JSON_CODEC', 'auto')
+
+# Tracker domains classified by domain alone: the bloom builder's built-in
+# list plus an optional blocklist file (EasyList or one domain per line);
+# domains without a category keyword get their built-in section's category,
+# else DOMAIN_INDEX_DEFAULT_CATEGORY; empty leaves them to the rule default
+DOMAIN_INDEX_SOURCE = os.getenv('DOMAIN_INDEX_SOURCE', '')
+DOMAIN_INDEX_DEFAULT_CATEGORY = os.getenv('DOMAIN_INDEX_DEFAULT_CATEGORY', '') or None
+
+# Persistent classification store shared by all workers on a host (SQLite
+# in WAL mode); empty disables it. Rows expire after RESULT_STORE_TTL
+# seconds and the oldest are dropped beyond RESULT_STORE_SIZE rows
+RESULT_STORE_PATH = os.getenv('RESULT_STORE_PATH', '')
+RESULT_STORE_SIZE = int(os.getenv('RESULT_STORE_SIZE', 1000000))
+RESULT_STORE_TTL = float(os.getenv('RESULT_STORE_TTL', 86400))
+
+# Fraction of /classify requests whose result is logged at INFO; logging
+# every cookie is a measurable cost at high RPS
+CLASSIFY_LOG_SAMPLE_RATE = float(os.getenv('CLASSIFY_LOG_SAMPLE_RATE', 0.01))
 
 # Cookie categories mapping
 COOKIE_CATEGORIES = {
@@ -55,6 +114,736 @@ COOKIE_CATEGORIES = {
 }
 
 
+class KeywordMatcher:
+    """
+    Precompiled multi-keyword matcher over the category keyword tables.
+
+    All keywords are compiled into one regex: a zero-width lookahead at
+    every position (guarded by the set of keyword first characters) with
+    one named group per category, alternatives in category order. At each
+    position the first matching alternative is the highest-priority
+    category matching there, so the lowest category index over all
+    positions equals the first-match result of looping over categories and
+    keywords in order, overlapping keywords included.
+
+    Cookie names and domains repeat heavily, so the per-text result is
+    memoized in a bounded LRU; the matcher (and its memo) is rebuilt
+    whenever the category tables change.
+    """
+
+    def __init__(self, categories: Dict[str, Dict[str, Any]], memo_size: int = 65536):
+        self.categories = list(categories)
+        alternatives = [
+            f"(?P<c{i}>{'|'.join(re.escape(k) for k in data['keywords'])})"
+            for i, data in enumerate(categories.values()) if data['keywords']
+        ]
+        first_chars = {k[0] for data in categories.values() for k in data['keywords'] if k}
+        self._pattern = None
+        if alternatives:
+            guard = '[' + ''.join(re.escape(c) for c in sorted(first_chars)) + ']'
+            self._pattern = re.compile(f"(?={guard})(?=(?:{'|'.join(alternatives)}))")
+        self._best_index = functools.lru_cache(maxsize=memo_size)(self._scan)
+
+    def _scan(self, text: str) -> int:
+        best = len(self.categories)
+        if self._pattern is not None:
+            for found in self._pattern.finditer(text):
+                index = int(found.lastgroup[1:])
+                if index < best:
+                    best = index
+                    if best == 0:
+                        break
+        return best
+
+    def match(self, *texts: str):
+        """
+        Return the highest-priority category whose keyword occurs in any text,
+        or None when nothing matches
+        """
+        best = min((self._best_index(text) for text in texts), default=len(self.categories))
+        return self.categories[best] if best < len(self.categories) else None
+
+
+# Built once at startup from the category tables
+keyword_matcher = KeywordMatcher(COOKIE_CATEGORIES)
+
+# Base privacy risk per category
+CATEGORY_RISK = {
+    'necessary': 10,
+    'functional': 20,
+    'performance': 30,
+    'analytics': 60,
+    'advertising': 80,
+    'social_media': 70
+}
+
+
+class DomainIndex:
+    """
+    Precomputed category per tracker domain
+
+    Entries are keyed by normalized domain (lowercase, no leading dot).
+    lookup() probes the cookie domain and then each parent domain in turn
+    (a.b.example.com, b.example.com, example.com), so a domain resolves in
+    O(labels) dict probes and the most specific listed domain wins.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, domain: str, category: str):
+        self._entries[domain.lower().lstrip('.')] = category
+
+    def lookup(self, domain: str) -> Optional[str]:
+        """
+        Resolve a cookie domain against the index
+        
+        Args:
+            domain: Cookie domain, e.g. '.stats.example.com'
+            
+        Returns:
+            Category of the closest listed domain, or None
+        """
+        domain = domain.lower().lstrip('.')
+        entries = self._entries
+        while '.' in domain:
+            category = entries.get(domain)
+            if category is not None:
+                return category
+            domain = domain[domain.index('.') + 1:]
+        return None
+
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """Digest of the entries, part of the classifier version"""
+        state = json.dumps(sorted(self._entries.items()), separators=(',', ':'))
+        return hashlib.sha256(state.encode('utf-8')).hexdigest()[:16]
+
+
+# Category of each section of the bloom builder's built-in tracker list.
+# CDNs and bot-protection/fingerprinting vendors serve first-party and
+# security traffic, so their domains alone say nothing about the cookie
+BUILTIN_SECTION_CATEGORIES = {
+    'ad-tracking': 'advertising',
+    'cname-cloaking': 'analytics',
+    'cdn': None,
+    'fingerprinting': None,
+}
+
+
+def build_domain_index(domains: Iterable[str], default_category: Optional[str] = None,
+                       index: Optional[DomainIndex] = None) -> DomainIndex:
+    """
+    Categorize tracker domains once, up front
+    
+    A domain containing a category keyword gets that category (the same
+    answer the keyword matcher gives for it); others get default_category,
+    or are left out (to the rule-based default) when it is None. Risk is
+    scored from the category later, like any other classification.
+    
+    Args:
+        domains: Tracker domains
+        default_category: Category for domains without a keyword
+        index: Index to add to (default: a new one)
+        
+    Returns:
+        The populated index
+    """
+    if default_category is not None and default_category not in COOKIE_CATEGORIES:
+        raise ValueError(f"Unknown DOMAIN_INDEX_DEFAULT_CATEGORY '{default_category}' "
+                         f"(expected one of {sorted(COOKIE_CATEGORIES)})")
+    
+    index = DomainIndex() if index is None else index
+    for domain in domains:
+        category = keyword_matcher.match(domain.lower()) or default_category
+        if category is not None:
+            index.add(domain, category)
+    return index
+
+
+def load_domain_index(path: str = '', default_category: Optional[str] = None) -> DomainIndex:
+    """
+    Build the index from the bloom filter builder's domain sources
+    
+    Args:
+        path: Optional blocklist file read with iter_domains_from_file();
+              the built-in tracker list is always included, each section
+              with its BUILTIN_SECTION_CATEGORIES category
+        default_category: Category for blocklist domains (and unmapped
+                          sections) without a keyword
+        
+    Returns:
+        The populated index
+    """
+    from build_bloom_filter import BUILTIN_TRACKER_SECTIONS, iter_domains_from_file
+    
+    index = DomainIndex()
+    for section, domains in BUILTIN_TRACKER_SECTIONS.items():
+        build_domain_index(domains, BUILTIN_SECTION_CATEGORIES.get(section, default_category), index)
+    if path:
+        build_domain_index(iter_domains_from_file(path), default_category, index)
+    logger.info(f"Domain index: {len(index)} tracker domains")
+    return index
+
+
+# Built once at startup, rebuilt with the keyword matcher
+domain_index = load_domain_index(DOMAIN_INDEX_SOURCE, DOMAIN_INDEX_DEFAULT_CATEGORY)
+
+
+class ClassificationCache:
+    """
+    Bounded, thread-safe LRU cache with optional TTL for classification results.
+
+    Keys are produced by cookie_cache_key(); values are whatever the caller
+    stores (here the classification dict and risk score). Entries older
+    than `ttl` seconds are treated as misses (ttl <= 0 disables expiry).
+    """
+
+    def __init__(self, maxsize: int = 100000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entry"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every entry (category tables or model changed)"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for /health"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'classifier_version': classifier_version,
+            }
+
+
+class ResultStore:
+    """
+    Persistent classification results shared across worker processes
+
+    A SQLite database in WAL mode, so readers in every gunicorn worker
+    proceed while one writes. Rows are keyed on the classifier version and
+    the normalized cookie_cache_key(), hence results from another model or
+    category table are never returned. Each thread (and each forked
+    process) opens its own connection. Storage errors are logged and
+    treated as misses; the store never fails a request.
+
+    Like ClassificationCache the store is bounded: rows older than `ttl`
+    seconds (wall clock, shared by all processes) are misses, and prune()
+    deletes them along with other classifier versions and the oldest rows
+    beyond `maxsize`. Each process prunes after every PRUNE_INTERVAL
+    writes (ttl <= 0 disables expiry, maxsize <= 0 the row cap).
+    """
+
+    # Keys per SELECT ... IN (...), below SQLite's bound-parameter limit
+    LOOKUP_CHUNK = 500
+
+    # Rows written by this process between bound checks
+    PRUNE_INTERVAL = 10000
+
+    def __init__(self, path: str, maxsize: int = 1000000, ttl: float = 86400,
+                 timeout: float = 5.0):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.pruned = 0
+        self._writes_since_prune = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=timeout)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(results)')]
+            if columns and 'stored_at' not in columns:
+                # Written before rows were timestamped; it is only a cache
+                conn.execute('DROP TABLE results')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    version TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    PRIMARY KEY (version, key)
+                ) WITHOUT ROWID
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS results_stored_at ON results (stored_at)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def encode_key(key: Tuple) -> str:
+        return json.dumps(key, separators=(',', ':'))
+
+    def get_many(self, keys: List[Tuple], version: str) -> Dict[Tuple, Tuple[Dict[str, Any], int]]:
+        """
+        Look up many cookie keys in one read transaction
+        
+        Args:
+            keys: cookie_cache_key() tuples
+            version: Classifier version the results must come from
+            
+        Returns:
+            {key: (classification result, risk score)} for the keys found
+        """
+        encoded = {self.encode_key(key): key for key in keys}
+        oldest = time.time() - self.ttl if self.ttl > 0 else float('-inf')
+        found = {}
+        try:
+            conn = self._connection()
+            with conn:
+                names = list(encoded)
+                for start in range(0, len(names), self.LOOKUP_CHUNK):
+                    chunk = names[start:start + self.LOOKUP_CHUNK]
+                    rows = conn.execute(
+                        f"SELECT key, value FROM results WHERE version = ? AND stored_at >= ? "
+                        f"AND key IN ({','.join('?' * len(chunk))})",
+                        [version, oldest, *chunk]
+                    )
+                    for name, value in rows:
+                        classification, risk_score = json.loads(value)
+                        found[encoded[name]] = (classification, risk_score)
+        except sqlite3.Error as e:
+            logger.warning(f"Result store lookup failed: {e}")
+            with self._stats_lock:
+                self.errors += 1
+            return {}
+        
+        with self._stats_lock:
+            self.hits += len(found)
+            self.misses += len(encoded) - len(found)
+        return found
+
+    def put_many(self, results: Dict[Tuple, Tuple[Dict[str, Any], int]], version: str):
+        """
+        Store many results in one write transaction
+        
+        Args:
+            results: {cookie key: (classification result, risk score)}
+            version: Classifier version that produced them
+        """
+        if not results:
+            return
+        now = time.time()
+        rows = [(version, self.encode_key(key), json.dumps(result, separators=(',', ':')), now)
+                for key, result in results.items()]
+        try:
+            conn = self._connection()
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Result store write failed: {e}")
+            with self._stats_lock:
+                self.errors += 1
+            return
+        
+        with self._stats_lock:
+            self.writes += len(rows)
+            self._writes_since_prune += len(rows)
+            due = self._writes_since_prune >= self.PRUNE_INTERVAL
+            if due:
+                self._writes_since_prune = 0
+        if due:
+            self.prune(version)
+
+    def prune(self, version: Optional[str] = None) -> int:
+        """
+        Delete results from other classifier versions, expired results and
+        the oldest results beyond maxsize
+        
+        Args:
+            version: Classifier version to keep; None keeps every version
+            
+        Returns:
+            Number of rows removed
+        """
+        removed = 0
+        try:
+            conn = self._connection()
+            with conn:
+                if version is not None:
+                    removed += conn.execute('DELETE FROM results WHERE version != ?',
+                                            (version,)).rowcount
+                if self.ttl > 0:
+                    removed += conn.execute('DELETE FROM results WHERE stored_at < ?',
+                                            (time.time() - self.ttl,)).rowcount
+                if self.maxsize > 0:
+                    cutoff = conn.execute('SELECT stored_at FROM results ORDER BY stored_at DESC '
+                                          'LIMIT 1 OFFSET ?', (self.maxsize - 1,)).fetchone()
+                    if cutoff is not None:
+                        removed += conn.execute('DELETE FROM results WHERE stored_at < ?',
+                                                cutoff).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Result store prune failed: {e}")
+            with self._stats_lock:
+                self.errors += 1
+        
+        with self._stats_lock:
+            self.pruned += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup metrics for /health"""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'path': self.path,
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'writes': self.writes,
+                'pruned': self.pruned,
+                'errors': self.errors,
+            }
+
+
+def cookie_cache_key(cookie: Dict[str, Any]) -> Tuple:
+    """
+    Normalized identity of a cookie for classification purposes
+
+    Only the fields classification and risk scoring read are included,
+    normalized the same way they are read (lowercased name/domain/path,
+    truthiness of flags, raw sameSite since risk compares it verbatim).
+    The path is only read by the model, so without one it is None and
+    copies of a cookie across paths share a key.
+    """
+    same_site = cookie.get('sameSite')
+    if not isinstance(same_site, (str, type(None))):
+        same_site = repr(same_site)
+    return (
+        (cookie.get('name') or '').lower(),
+        (cookie.get('domain') or '').lower(),
+        (cookie.get('path') or '').lower() if inference_engine.available else None,
+        bool(cookie.get('httpOnly')),
+        bool(cookie.get('secure')),
+        same_site,
+        bool(cookie.get('session')),
+    )
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    """Row-wise softmax of a (batch, labels) logits array"""
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+class LocalInferenceEngine:
+    """
+    Batched CPU inference with a local transformers sequence classifier
+
+    The checkpoint's labels must name cookie categories (id2label values
+    such as 'analytics' or 'advertising'); anything else, a missing
+    checkpoint or missing transformers/torch leaves the engine unavailable
+    and callers fall back to the rule engine.
+    """
+
+    backend = 'transformers'
+    tensor_type = 'pt'
+
+    def __init__(self, model_path: str, max_batch_size: int = 32, max_seq_length: int = 64,
+                 num_threads: int = 0):
+        self.model_path = model_path
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_seq_length = max_seq_length
+        self.num_threads = num_threads
+        self.tokenizer = None
+        self.model = None
+        self.labels = None
+        self.load_error = None
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    @property
+    def model_id(self) -> Optional[str]:
+        """Identity of the loaded checkpoint (None when using rules)"""
+        return f"{self.backend}:{self.model_path}" if self.available else None
+
+    def load(self) -> bool:
+        """
+        Load tokenizer and model from the local cache/directory
+        
+        Returns:
+            True if the model is ready for inference
+        """
+        try:
+            from transformers import AutoTokenizer
+            
+            tokenizer = AutoTokenizer.from_pretrained(self.model_path, local_files_only=True)
+            model, config = self._load_model()
+            
+            labels = [str(config.id2label[i]).lower() for i in range(config.num_labels)]
+            unknown = [label for label in labels if label not in COOKIE_CATEGORIES]
+            if unknown:
+                raise ValueError(f"labels {unknown} are not cookie categories")
+        except Exception as e:
+            self.load_error = str(e)
+            logger.warning(f"Local model '{self.model_path}' ({self.backend}) unavailable, "
+                           f"using rules: {e}")
+            return False
+        
+        # model last: `available` flips only once labels/tokenizer are set
+        self.tokenizer, self.labels, self.model = tokenizer, labels, model
+        self.load_error = None
+        logger.info(f"Loaded local model '{self.model_path}' ({self.backend}, {len(labels)} labels)")
+        return True
+
+    def _load_model(self):
+        """Returns (model, config) for this backend"""
+        import torch
+        from transformers import AutoModelForSequenceClassification
+        
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+        model = AutoModelForSequenceClassification.from_pretrained(
+            self.model_path, local_files_only=True
+        )
+        model.to(torch.device('cpu'))
+        model.eval()
+        return model, model.config
+
+    def _logits(self, encoded) -> np.ndarray:
+        """Forward pass over one tokenized batch"""
+        import torch
+        
+        with torch.inference_mode():
+            return self.model(**encoded).logits.float().numpy()
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        """
+        Classify feature strings, one padded forward pass per batch
+        
+        Args:
+            texts: Feature strings from extract_cookie_features()
+            
+        Returns:
+            (category, probability) per text, in input order
+        """
+        predictions = []
+        for start in range(0, len(texts), self.max_batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + self.max_batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors=self.tensor_type
+            )
+            probabilities = softmax(self._logits(encoded))
+            index = probabilities.argmax(axis=-1)
+            confidence = probabilities[np.arange(len(index)), index]
+            predictions.extend(
+                (self.labels[i], round(float(c), 4))
+                for i, c in zip(index.tolist(), confidence.tolist())
+            )
+        return predictions
+
+
+class OnnxInferenceEngine(LocalInferenceEngine):
+    """
+    Same batching as LocalInferenceEngine, run under ONNX Runtime
+
+    `model_path` is a directory written by export_onnx_model.py (tokenizer,
+    config and the .onnx graph); `model_file` picks the fp32 graph or its
+    dynamically quantized INT8 variant.
+    """
+
+    backend = 'onnx'
+    tensor_type = 'np'
+
+    def __init__(self, model_path: str, max_batch_size: int = 32, max_seq_length: int = 64,
+                 num_threads: int = 0, model_file: str = 'model.onnx'):
+        super().__init__(model_path, max_batch_size, max_seq_length, num_threads)
+        self.model_file = model_file
+        self.input_names = []
+
+    @property
+    def model_id(self) -> Optional[str]:
+        return f"{self.backend}:{os.path.join(self.model_path, self.model_file)}" if self.available else None
+
+    def _load_model(self):
+        import onnxruntime as ort
+        from transformers import AutoConfig
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads > 0:
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+        session = ort.InferenceSession(
+            os.path.join(self.model_path, self.model_file),
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = [i.name for i in session.get_inputs()]
+        return session, AutoConfig.from_pretrained(self.model_path, local_files_only=True)
+
+    def _logits(self, encoded) -> np.ndarray:
+        feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        return self.model.run(['logits'], feed)[0]
+
+
+INFERENCE_BACKENDS = {
+    'transformers': LocalInferenceEngine,
+    'onnx': OnnxInferenceEngine,
+}
+
+
+def create_inference_engine(backend: str) -> LocalInferenceEngine:
+    """
+    Build the inference engine selected by INFERENCE_BACKEND
+    
+    Args:
+        backend: 'transformers' (PyTorch) or 'onnx' (ONNX Runtime)
+        
+    Returns:
+        Unloaded engine configured from the environment
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}' "
+                         f"(expected one of {sorted(INFERENCE_BACKENDS)})")
+    
+    options = {
+        'max_batch_size': INFERENCE_MAX_BATCH_SIZE,
+        'max_seq_length': INFERENCE_MAX_SEQ_LENGTH,
+        'num_threads': INFERENCE_THREADS,
+    }
+    if backend == 'onnx':
+        return OnnxInferenceEngine(ONNX_MODEL_PATH, model_file=ONNX_MODEL_FILE, **options)
+    return LocalInferenceEngine(LOCAL_MODEL_PATH, **options)
+
+
+inference_engine = create_inference_engine(INFERENCE_BACKEND)
+
+
+def compute_classifier_version() -> str:
+    """Fingerprint of everything a cached result depends on"""
+    state = json.dumps([COOKIE_CATEGORIES, CATEGORY_RISK, MODEL_NAME, inference_engine.model_id,
+                        domain_index.fingerprint], sort_keys=True)
+    return hashlib.sha256(state.encode('utf-8')).hexdigest()[:16]
+
+
+classifier_version = compute_classifier_version()
+classification_cache = ClassificationCache(
+    maxsize=int(os.getenv('CLASSIFICATION_CACHE_SIZE', 100000)),
+    ttl=float(os.getenv('CLASSIFICATION_CACHE_TTL', 3600))
+)
+result_store = (ResultStore(RESULT_STORE_PATH, maxsize=RESULT_STORE_SIZE, ttl=RESULT_STORE_TTL)
+                if RESULT_STORE_PATH else None)
+
+
+def prune_result_store() -> int:
+    """
+    Bound the result store to the current classifier version
+
+    The store only holds model results, so rows of other versions are
+    only dropped once the model is loaded; before that the version lacks
+    the model and would match none of the rows about to be reused.
+
+    Returns:
+        Number of rows removed
+    """
+    if result_store is None:
+        return 0
+    return result_store.prune(classifier_version if inference_engine.available else None)
+
+
+prune_result_store()
+
+
+def refresh_classifier() -> bool:
+    """
+    Pick up changes to the category tables or model
+
+    Rebuilds the keyword matcher and domain index and invalidates the
+    classification cache when the classifier fingerprint changed. Call
+    after editing COOKIE_CATEGORIES/CATEGORY_RISK or switching MODEL_NAME.
+
+    Returns:
+        True if anything changed
+    """
+    global classifier_version, keyword_matcher, domain_index
+    version = compute_classifier_version()
+    if version == classifier_version:
+        return False
+    keyword_matcher = KeywordMatcher(COOKIE_CATEGORIES)
+    domain_index = load_domain_index(DOMAIN_INDEX_SOURCE, DOMAIN_INDEX_DEFAULT_CATEGORY)
+    # The rebuilt index may categorize differently; fingerprint it too
+    version = compute_classifier_version()
+    classifier_version = version
+    classification_cache.invalidate()
+    pruned = prune_result_store()
+    logger.info(f"Classifier changed (version {version}), cache invalidated, "
+                f"{pruned} stored results pruned")
+    return True
+
+
 def extract_cookie_features(cookie: Dict[str, Any]) -> str:
     """
     Extract relevant features from cookie for classification
@@ -97,15 +886,24 @@ def rule_based_classification(cookie: Dict[str, Any]) -> Dict[str, Any]:
     domain = cookie.get('domain', '').lower()
     
     # Check against known patterns
-    for category, data in COOKIE_CATEGORIES.items():
-        for keyword in data['keywords']:
-            if keyword in name or keyword in domain:
-                return {
-                    'category': category,
-                    'confidence': 0.85,
-                    'description': data['description'],
-                    'method': 'rule-based'
-                }
+    category = keyword_matcher.match(name, domain)
+    if category is not None:
+        return {
+            'category': category,
+            'confidence': 0.85,
+            'description': COOKIE_CATEGORIES[category]['description'],
+            'method': 'rule-based'
+        }
+    
+    # Known tracker domain (or a subdomain of one)
+    category = domain_index.lookup(domain)
+    if category is not None:
+        return {
+            'category': category,
+            'confidence': 0.8,
+            'description': COOKIE_CATEGORIES[category]['description'],
+            'method': 'domain-index'
+        }
     
     # Default to functional if no match
     return {
@@ -126,25 +924,45 @@ def ml_based_classification(cookie: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Classification result
     """
-    try:
-        # Extract features
-        feature_text = extract_cookie_features(cookie)
-        
-        # Use Hugging Face Inference API
-        # For text classification, you can use various models
-        # Here we'll use a sentiment model as an example and map it to categories
+    return ml_based_classification_batch([cookie])[0]
+
+
+def ml_based_classification_batch(cookies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Classify many cookies with one batched pass through the local model
+    
+    Args:
+        cookies: List of cookie objects
         
-        # TODO: Replace with actual cookie classification model
-        # For now, using rule-based as primary method
+    Returns:
+        Classification results in input order
+    """
+    model_loader.ensure()
+    if inference_engine.available:
+        try:
+            # Extract features
+            feature_texts = [extract_cookie_features(cookie) for cookie in cookies]
+            predictions = inference_engine.predict(feature_texts)
+            
+            return [{
+                'category': category,
+                'confidence': confidence,
+                'description': COOKIE_CATEGORIES[category]['description'],
+                'method': 'ml-local'
+            } for category, confidence in predictions]
+            
+        except Exception as e:
+            logger.error(f"ML classification error: {str(e)}")
+    
+    # Fallback to rule-based when the model is absent or fails
+    results = []
+    for cookie in cookies:
         result = rule_based_classification(cookie)
-        result['method'] = 'hybrid-ml-fallback'
-        
-        return result
-        
-    except Exception as e:
-        logger.error(f"ML classification error: {str(e)}")
-        # Fallback to rule-based
-        return rule_based_classification(cookie)
+        # Keep domain index hits distinguishable in responses and metrics
+        result['method'] = ('hybrid-ml-fallback:domain-index' if result['method'] == 'domain-index'
+                            else 'hybrid-ml-fallback')
+        results.append(result)
+    return results
 
 
 def calculate_risk_score(cookie: Dict[str, Any], category: str) -> int:
@@ -161,15 +979,7 @@ def calculate_risk_score(cookie: Dict[str, Any], category: str) -> int:
     risk = 0
     
     # Category-based risk
-    category_risk = {
-        'necessary': 10,
-        'functional': 20,
-        'performance': 30,
-        'analytics': 60,
-        'advertising': 80,
-        'social_media': 70
-    }
-    risk += category_risk.get(category, 50)
+    risk += CATEGORY_RISK.get(category, 50)
     
     # Security flags reduce risk
     if cookie.get('httpOnly'):
@@ -191,14 +1001,1079 @@ def calculate_risk_score(cookie: Dict[str, Any], category: str) -> int:
     return max(0, min(100, risk))
 
 
+# Score adjustment per risk flag column, in risk_flag_columns() order:
+# httpOnly, secure, strict/lax sameSite, leading-dot domain, session
+RISK_FLAG_WEIGHTS = np.array([-10, -10, -5, 15, -5], dtype=np.int64)
+
+
+def category_risk_table() -> Tuple[Dict[str, int], np.ndarray]:
+    """
+    Category codes and base risk per code for calculate_risk_scores()
+    
+    Returns:
+        (category -> code, base risk array); the extra last code stands
+        for categories missing from CATEGORY_RISK (base risk 50)
+    """
+    codes = {category: code for code, category in enumerate(CATEGORY_RISK)}
+    base_risk = np.array(list(CATEGORY_RISK.values()) + [50], dtype=np.int64)
+    return codes, base_risk
+
+
+def risk_flag_columns(cookies: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Risk-relevant flags of each cookie, read the way calculate_risk_score() reads them
+    
+    Returns:
+        (len(cookies), 5) bool array: httpOnly, secure, strict/lax
+        sameSite, leading-dot domain, session
+    """
+    # One int bitmask per cookie: building small ints is far cheaper than
+    # converting per-cookie tuples into a bool matrix
+    masks = np.array([(1 if cookie.get('httpOnly') else 0)
+                      | (2 if cookie.get('secure') else 0)
+                      | (4 if cookie.get('sameSite') in ('strict', 'lax') else 0)
+                      | (8 if cookie.get('domain', '').startswith('.') else 0)
+                      | (16 if cookie.get('session') else 0)
+                      for cookie in cookies], dtype=np.int64)
+    return ((masks[:, None] >> np.arange(len(RISK_FLAG_WEIGHTS))) & 1).astype(bool)
+
+
+def calculate_risk_scores(category_codes: np.ndarray, flags: np.ndarray,
+                          base_risk: np.ndarray) -> np.ndarray:
+    """
+    Vectorized calculate_risk_score() over a batch
+    
+    Args:
+        category_codes: Category code per cookie (see category_risk_table())
+        flags: Flag columns from risk_flag_columns()
+        base_risk: Base risk per category code
+        
+    Returns:
+        int64 array of risk scores clamped to 0-100
+    """
+    return np.clip(base_risk[category_codes] + flags.astype(np.int64) @ RISK_FLAG_WEIGHTS, 0, 100)
+
+
+def calculate_risk_score_many(cookies: List[Dict[str, Any]], categories: List[str]) -> List[int]:
+    """
+    Risk score of each cookie given its category, equal to calculate_risk_score()
+    
+    Args:
+        cookies: Cookie objects
+        categories: Classified category per cookie
+        
+    Returns:
+        Risk scores in input order
+    """
+    codes, base_risk = category_risk_table()
+    unknown = len(codes)
+    category_codes = np.array([codes.get(category, unknown) for category in categories], dtype=np.intp)
+    return calculate_risk_scores(category_codes, risk_flag_columns(cookies), base_risk).tolist()
+
+
+def classify_with_risk(cookie: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Classify a cookie and score its risk, served from the cache when possible
+    
+    Args:
+        cookie: Cookie object
+        
+    Returns:
+        (classification result, risk score); the result dict is shared with
+        the cache and must not be modified
+    """
+    key = cookie_cache_key(cookie)
+    cached = classification_cache.get(key)
+    if cached is not None:
+        return cached
+    return classify_uncached([cookie], [key])[0]
+
+
+def dedupe_cookies(cookies: List[Dict[str, Any]]) -> Tuple[List[Tuple], List[Dict[str, Any]], List[int]]:
+    """
+    Group a batch by normalized classification key
+    
+    Args:
+        cookies: List of cookie objects
+        
+    Returns:
+        (unique keys, first cookie with each key, position of every input
+        cookie's key in the unique lists)
+    """
+    positions = {}
+    unique_cookies = []
+    inverse = []
+    for cookie in cookies:
+        key = cookie_cache_key(cookie)
+        position = positions.get(key)
+        if position is None:
+            position = positions[key] = len(unique_cookies)
+            unique_cookies.append(cookie)
+        inverse.append(position)
+    return list(positions), unique_cookies, inverse
+
+
+def classify_many_deduped(cookies: List[Dict[str, Any]]) -> Tuple[List[Tuple[Dict[str, Any], int]], int]:
+    """
+    Classify each distinct cookie in a batch once and fan the results out
+    
+    Cookies differing only in fields classification ignores (value, the
+    case of name/domain, the path unless a model reads it) share a key, so
+    they cost one cache lookup and at most one model slot; cache misses
+    are classified together so the model sees one batch.
+    
+    Args:
+        cookies: List of cookie objects
+        
+    Returns:
+        ((classification result, risk score) per cookie in input order,
+        number of unique keys)
+    """
+    keys, unique_cookies, inverse = dedupe_cookies(cookies)
+    unique_results = [classification_cache.get(key) for key in keys]
+    
+    missed = [i for i, cached in enumerate(unique_results) if cached is None]
+    if missed:
+        computed = classify_uncached([unique_cookies[i] for i in missed], [keys[i] for i in missed])
+        for i, result in zip(missed, computed):
+            unique_results[i] = result
+    return [unique_results[i] for i in inverse], len(keys)
+
+
+def classify_many_with_risk(cookies: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], int]]:
+    """
+    Batch version of classify_with_risk()
+    
+    Args:
+        cookies: List of cookie objects
+        
+    Returns:
+        (classification result, risk score) per cookie, in input order
+    """
+    return classify_many_deduped(cookies)[0]
+
+
+def classify_uncached(cookies: List[Dict[str, Any]],
+                      keys: Optional[List[Tuple]] = None) -> List[Tuple[Dict[str, Any], int]]:
+    """
+    Classify and score cookies in one model batch, then cache the results
+    
+    Cookies sharing a cache key are classified once. With a result store
+    and a loaded model, all unique keys are looked up in the store in one
+    round trip and only the misses reach the model; their results are
+    written back in one transaction. The rules are cheaper than a store
+    lookup, so rule results bypass the store.
+    
+    Args:
+        cookies: Cookie objects (already known to miss the cache)
+        keys: Their cache keys, if the caller computed them
+        
+    Returns:
+        (classification result, risk score) per cookie, in input order
+    """
+    if keys is None:
+        keys = [cookie_cache_key(cookie) for cookie in cookies]
+    
+    unique = {}
+    for key, cookie in zip(keys, cookies):
+        unique.setdefault(key, cookie)
+    
+    version = classifier_version
+    store = result_store if inference_engine.available else None
+    computed = store.get_many(list(unique), version) if store is not None else {}
+    
+    missing = [key for key in unique if key not in computed]
+    if missing:
+        missing_cookies = [unique[key] for key in missing]
+        with metrics.stage('classify'):
+            classifications = ml_based_classification_batch(missing_cookies)
+        with metrics.stage('risk'):
+            risk_scores = calculate_risk_score_many(missing_cookies, [c['category'] for c in classifications])
+        metrics.count_methods(classifications)
+        fresh = dict(zip(missing, zip(classifications, risk_scores)))
+        if store is not None:
+            store.put_many(fresh, version)
+        computed.update(fresh)
+    
+    for key, result in computed.items():
+        classification_cache.put(key, result)
+    return [computed[key] for key in keys]
+
+
+class Histogram:
+    """
+    Cumulative bucket histogram (Prometheus-style 'le' buckets)
+    """
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        buckets, running = {}, 0
+        for bound, count in zip(self.bounds + ['+Inf'], counts):
+            running += count
+            buckets[str(bound)] = running
+        return {'buckets': buckets, 'count': running, 'sum': total}
+
+
+LATENCY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+def prometheus_labels(labels: Dict[str, Any]) -> str:
+    """{name="value",...} label set, or '' when there are no labels"""
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels.items():
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def prometheus_metric(name: str, kind: str, help_text: str,
+                      samples: Iterable[Tuple[Dict[str, Any], Any]]) -> List[str]:
+    """
+    Text exposition lines for one metric family
+    
+    Args:
+        name: Metric name
+        kind: 'counter', 'gauge' or 'histogram'
+        help_text: HELP line
+        samples: (labels, value) pairs; histogram values are
+                 Histogram.snapshot() dicts
+        
+    Returns:
+        Lines of the Prometheus text format
+    """
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        if kind != 'histogram':
+            lines.append(f'{name}{prometheus_labels(labels)} {value}')
+            continue
+        for bound, count in value['buckets'].items():
+            lines.append(f'{name}_bucket{prometheus_labels({**labels, "le": bound})} {count}')
+        lines.append(f'{name}_sum{prometheus_labels(labels)} {value["sum"]}')
+        lines.append(f'{name}_count{prometheus_labels(labels)} {value["count"]}')
+    return lines
+
+
+class ApiMetrics:
+    """
+    In-process request metrics exported by /metrics
+
+    Per-endpoint latency and response counts, per-stage timers (parse,
+    classify, risk, serialize), the /classify-batch size distribution and
+    counts of fresh classifications by method. Counters are per process:
+    under gunicorn each scrape reports the worker that served it.
+    """
+
+    STAGES = ('parse', 'classify', 'risk', 'serialize')
+
+    def __init__(self):
+        self.request_ms = {}
+        self.responses = {}
+        self.stage_ms = {stage: Histogram(LATENCY_BUCKETS_MS) for stage in self.STAGES}
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.batch_cookies = 0
+        self.batch_unique_cookies = 0
+        self.methods = {}
+        self._lock = threading.Lock()
+
+    def observe_request(self, endpoint: str, status: int, elapsed_ms: float):
+        """Record one finished request"""
+        with self._lock:
+            histogram = self.request_ms.get(endpoint)
+            if histogram is None:
+                histogram = self.request_ms[endpoint] = Histogram(LATENCY_BUCKETS_MS)
+            self.responses[endpoint, status] = self.responses.get((endpoint, status), 0) + 1
+        histogram.observe(elapsed_ms)
+
+    def observe_batch(self, total: int, unique: int):
+        """Record one /classify-batch request's size and distinct cookies"""
+        self.batch_size.observe(total)
+        with self._lock:
+            self.batch_cookies += total
+            self.batch_unique_cookies += unique
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block into the `name` stage histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_ms[name].observe((time.perf_counter() - start) * 1000)
+
+    def count_methods(self, classifications: List[Dict[str, Any]]):
+        """Count fresh classification results by their 'method'"""
+        counts = Counter(classification['method'] for classification in classifications)
+        with self._lock:
+            for method, count in counts.items():
+                self.methods[method] = self.methods.get(method, 0) + count
+
+    def render(self) -> List[str]:
+        """Prometheus text lines for everything recorded here"""
+        with self._lock:
+            request_ms = sorted(self.request_ms.items())
+            responses = sorted(self.responses.items())
+            methods = sorted(self.methods.items())
+            batch_cookies, batch_unique = self.batch_cookies, self.batch_unique_cookies
+        return (
+            prometheus_metric('cookie_api_request_duration_ms', 'histogram',
+                              'Request latency by endpoint in milliseconds',
+                              (({'endpoint': e}, h.snapshot()) for e, h in request_ms))
+            + prometheus_metric('cookie_api_responses_total', 'counter',
+                                'Responses by endpoint and status code',
+                                (({'endpoint': e, 'status': status}, n) for (e, status), n in responses))
+            + prometheus_metric('cookie_api_stage_duration_ms', 'histogram',
+                                'Time spent per request stage in milliseconds',
+                                (({'stage': stage}, h.snapshot()) for stage, h in self.stage_ms.items()))
+            + prometheus_metric('cookie_api_batch_size', 'histogram',
+                                'Cookies per /classify-batch request',
+                                [({}, self.batch_size.snapshot())])
+            + prometheus_metric('cookie_api_batch_cookies_total', 'counter',
+                                '/classify-batch cookies received, and distinct after dedupe',
+                                [({'kind': 'received'}, batch_cookies), ({'kind': 'unique'}, batch_unique)])
+            + prometheus_metric('cookie_api_batch_dedupe_ratio', 'gauge',
+                                'Cookies received per distinct cookie classified in /classify-batch',
+                                [({}, batch_cookies / batch_unique if batch_unique else 1.0)])
+            + prometheus_metric('cookie_api_classifications_total', 'counter',
+                                'Cookies classified (cache misses) by method',
+                                (({'method': method}, n) for method, n in methods))
+        )
+
+
+metrics = ApiMetrics()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-cookie requests into model batches
+
+    Request threads submit() a cookie and wait on the returned future. A
+    background worker takes the first queued cookie, keeps collecting until
+    `max_batch_size` cookies or `max_wait_ms` after that first cookie was
+    queued, classifies the lot with one classify_uncached() call and
+    resolves the futures.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.submitted = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+
+    def submit(self, cookie: Dict[str, Any], key: Optional[Tuple] = None) -> Future:
+        """Queue a cookie; the future resolves to (classification, risk score)"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((cookie, key, future, time.monotonic()))
+        with self._stats_lock:
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return future
+
+    def _ensure_worker(self):
+        # Started on first use so forked server workers each get their own
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][3] + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        # Past the deadline: still take whatever is already waiting
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                # Never let one bad batch stop the worker; fail its callers instead
+                logger.error(f"Micro-batch error: {str(e)}")
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _process(self, batch):
+        # Skip requests whose caller gave up (an asyncio wait_for timeout
+        # cancels the future); the rest can no longer be cancelled
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.monotonic()
+        for _, _, _, enqueued in batch:
+            self.queue_wait_ms.observe((started - enqueued) * 1000)
+        self.batch_sizes.observe(len(batch))
+        self.batches += 1
+        
+        cookies = [item[0] for item in batch]
+        try:
+            keys = [item[1] if item[1] is not None else cookie_cache_key(item[0]) for item in batch]
+            results = classify_uncached(cookies, keys)
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        
+        finished = time.monotonic()
+        for (_, _, future, enqueued), result in zip(batch, results):
+            future.set_result(result)
+            self.latency_ms.observe((finished - enqueued) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and batching/latency histograms"""
+        return {
+            'enabled': True,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'submitted': self.submitted,
+            'batches': self.batches,
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_wait_ms': self.queue_wait_ms.snapshot(),
+            'latency_ms': self.latency_ms.snapshot()
+        }
+
+
+micro_batcher = MicroBatcher(
+    max_batch_size=int(os.getenv('MICRO_BATCH_MAX_SIZE', INFERENCE_MAX_BATCH_SIZE)),
+    max_wait_ms=float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', 2))
+) if MICRO_BATCHING else None
+
+
+def micro_batching_active() -> bool:
+    """
+    Whether /classify misses go through the micro-batcher
+    
+    Without a loaded model the rules have no batched call to share, so
+    the thread handoff and wait window would only add latency.
+    """
+    return micro_batcher is not None and inference_engine.available
+
+
+def classify_single(cookie: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Classify one cookie for /classify
+    
+    Cache hits return immediately; misses join the micro-batch queue so
+    concurrent requests share a model call.
+    """
+    if not micro_batching_active():
+        return classify_with_risk(cookie)
+    
+    key = cookie_cache_key(cookie)
+    cached = classification_cache.get(key)
+    if cached is not None:
+        return cached
+    return micro_batcher.submit(cookie, key).result(timeout=MICRO_BATCH_TIMEOUT)
+
+
+@functools.lru_cache(maxsize=None)
+def get_inference_client():
+    """Hugging Face Inference API client, imported and built on first use"""
+    from huggingface_hub import InferenceClient
+    
+    return InferenceClient(token=HF_TOKEN)
+
+
+class ModelLoader:
+    """
+    Loads the local model at most once per process
+    
+    `state` is 'disabled' (USE_LOCAL_MODEL=0), 'pending' (not started yet;
+    lazy mode until the first classification), 'loading', 'ready' or
+    'failed' (serving with rules, see inference_engine.load_error).
+    Requests arriving while the model loads are answered by the rules;
+    refresh_classifier() then drops their cached results.
+    """
+
+    LOAD_MODES = ('eager', 'background', 'lazy')
+
+    def __init__(self, engine: LocalInferenceEngine, mode: str = 'background', enabled: bool = True):
+        if mode not in self.LOAD_MODES:
+            raise ValueError(f"Unknown MODEL_LOAD_MODE '{mode}' (expected one of {list(self.LOAD_MODES)})")
+        self.engine = engine
+        self.mode = mode
+        self.state = 'pending' if enabled else 'disabled'
+        self.load_seconds = None
+        self._lock = threading.Lock()
+
+    @property
+    def warm(self) -> bool:
+        return self.state == 'ready'
+
+    def load(self) -> bool:
+        """
+        Load the model in the calling thread (no-op once finished)
+        
+        Returns:
+            True if the model is ready for inference
+        """
+        with self._lock:
+            if self.state in ('pending', 'loading'):
+                self.state = 'loading'
+                start = time.perf_counter()
+                loaded = self.engine.load()
+                refresh_classifier()
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                self.state = 'ready' if loaded else 'failed'
+            return self.state == 'ready'
+
+    def start(self):
+        """Load the model in a daemon thread and return immediately"""
+        if self.state != 'pending':
+            return
+        self.state = 'loading'
+        threading.Thread(target=self.load, name='model-loader', daemon=True).start()
+
+    def ensure(self):
+        """Called before inference; lazy mode loads here, blocking until done"""
+        if self.mode == 'lazy' and self.state in ('pending', 'loading'):
+            self.load()
+
+    def after_fork(self):
+        """Restart a load whose thread was lost when the process forked"""
+        self._lock = threading.Lock()
+        if self.state == 'loading':
+            self.state = 'pending'
+            self.start()
+
+
+model_loader = ModelLoader(inference_engine, MODEL_LOAD_MODE, enabled=USE_LOCAL_MODEL)
+os.register_at_fork(after_in_child=model_loader.after_fork)
+
+# Eager blocks the import so a gunicorn --preload master holds the weights
+# before forking; background lets the server listen while the model warms
+if MODEL_LOAD_MODE == 'eager':
+    model_loader.load()
+elif MODEL_LOAD_MODE == 'background':
+    model_loader.start()
+
+
+class JsonCodec:
+    """
+    Request parsing and response serialization for one JSON library
+
+    dumps() always returns UTF-8 bytes and serializes the response
+    dataclasses below as objects, so handlers never rebuild them as
+    dicts. loads() raises ValueError on malformed input.
+    """
+
+    name = 'json'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(default=_struct_fields, separators=(',', ':'),
+                                         check_circular=False)
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return self._encoder.encode(obj).encode('utf-8')
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson: serializes dataclasses natively"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return self._orjson.dumps(obj)
+
+
+class MsgspecCodec(JsonCodec):
+    """msgspec: reusable encoder/decoder, dataclasses supported natively"""
+
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._decode_error = msgspec.DecodeError
+
+    def loads(self, data):
+        try:
+            return self._decoder.decode(data)
+        except self._decode_error as e:
+            raise ValueError(str(e)) from e
+
+    def dumps(self, obj) -> bytes:
+        return self._encoder.encode(obj)
+
+
+def _struct_fields(obj):
+    # Stdlib fallback for the response dataclasses (one level at a time)
+    if is_dataclass(obj):
+        return obj.__dict__
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+JSON_CODECS = {
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+    'json': JsonCodec,
+}
+
+
+def create_json_codec(name: str) -> JsonCodec:
+    """
+    Build the codec selected by JSON_CODEC
+    
+    Args:
+        name: 'auto' or a JSON_CODECS key; a library that is not installed
+              falls back to the next one and finally to the stdlib
+        
+    Returns:
+        Ready-to-use codec
+    """
+    if name != 'auto' and name not in JSON_CODECS:
+        raise ValueError(f"Unknown JSON_CODEC '{name}' "
+                         f"(expected 'auto' or one of {sorted(JSON_CODECS)})")
+    
+    candidates = list(JSON_CODECS) if name == 'auto' else [name, 'json']
+    for candidate in candidates:
+        try:
+            return JSON_CODECS[candidate]()
+        except ImportError:
+            if candidate == name:
+                logger.warning(f"JSON_CODEC '{name}' is not installed, using the stdlib codec")
+    return JsonCodec()
+
+
+json_codec = create_json_codec(JSON_CODEC)
+
+
+class CookieResult(TypedDict):
+    """
+    One /classify-batch result (one /classify-stream line)
+    
+    A TypedDict rather than a dataclass: one is built per cookie, and a
+    dict literal is the cheapest object every codec encodes natively.
+    """
+    cookie_name: str
+    domain: Optional[str]
+    category: str
+    confidence: float
+    description: str
+    risk_score: int
+    classification_method: str
+
+
+@dataclass
+class BatchStatistics:
+    """Aggregate statistics of a /classify-batch response"""
+    total_cookies: int
+    by_category: Dict[str, int] = field(default_factory=dict)
+    average_risk_score: float = 0
+    unique_cookies: int = 0
+    dedupe_ratio: float = 1.0  # total_cookies / unique_cookies
+
+
+@dataclass
+class BatchResponse:
+    """Body of /classify-batch"""
+    results: List[CookieResult]
+    statistics: BatchStatistics
+
+
+@dataclass
+class BatchStatisticsResponse:
+    """Body of /classify-batch with "stats_only": true"""
+    statistics: BatchStatistics
+
+
+def validate_cookie(cookie) -> Optional[str]:
+    """
+    Check the fields classification reads before any work is done
+    
+    Returns:
+        Reason the cookie is rejected, or None when it is valid
+    """
+    if not isinstance(cookie, dict):
+        return 'cookie must be an object'
+    if not isinstance(cookie.get('name'), str):
+        return "'name' must be a string"
+    for key in ('domain', 'path'):
+        if key in cookie and not isinstance(cookie[key], str):
+            return f"'{key}' must be a string"
+    return None
+
+
+def validate_cookies(cookies) -> List[Dict[str, Any]]:
+    """
+    Validate a whole batch in one pass
+    
+    Returns:
+        {"index", "error"} per rejected cookie (empty when all are valid)
+    """
+    if not isinstance(cookies, list):
+        return [{'index': None, 'error': "'cookies' must be a list"}]
+    errors = []
+    for index, cookie in enumerate(cookies):
+        error = validate_cookie(cookie)
+        if error is not None:
+            errors.append({'index': index, 'error': error})
+    return errors
+
+
+def json_response(payload, status: int = 200) -> Response:
+    """Flask response serialized with json_codec"""
+    with metrics.stage('serialize'):
+        body = json_codec.dumps(payload)
+    return Response(body, status=status, mimetype='application/json')
+
+
+def health_payload() -> Dict[str, Any]:
+    """Body of /health, shared by the Flask and ASGI apps"""
+    return {
+        'status': 'healthy',
+        'model': MODEL_NAME,
+        'version': '1.0.0',
+        'inference': {
+            'backend': inference_engine.backend if inference_engine.available else 'rules',
+            'threads': inference_engine.num_threads,
+            'max_batch_size': inference_engine.max_batch_size,
+            'max_seq_length': inference_engine.max_seq_length,
+            'load_error': inference_engine.load_error
+        },
+        'readiness': {
+            'listening': True,
+            'model_warm': model_loader.warm,
+            'model_state': model_loader.state,
+            'load_mode': model_loader.mode,
+            'load_seconds': model_loader.load_seconds
+        },
+        'micro_batching': micro_batcher.stats() if micro_batcher else {'enabled': False},
+        'cache': classification_cache.stats(),
+        'result_store': result_store.stats() if result_store is not None else {'enabled': False},
+        'domain_index': {'domains': len(domain_index), 'source': DOMAIN_INDEX_SOURCE or 'builtin'},
+        'json_codec': json_codec.name
+    }
+
+
+def metrics_text() -> str:
+    """Body of /metrics (Prometheus text format), shared by the Flask and ASGI apps"""
+    cache = classification_cache.stats()
+    lines = metrics.render()
+    lines += prometheus_metric('cookie_api_cache_lookups_total', 'counter',
+                               'Classification cache lookups by result',
+                               [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])])
+    lines += prometheus_metric('cookie_api_cache_hit_ratio', 'gauge',
+                               'Share of classification cache lookups that hit',
+                               [({}, cache['hit_rate'])])
+    if result_store is not None:
+        store = result_store.stats()
+        lines += prometheus_metric('cookie_api_result_store_lookups_total', 'counter',
+                                   'Persistent result store lookups by result',
+                                   [({'result': 'hit'}, store['hits']), ({'result': 'miss'}, store['misses'])])
+        lines += prometheus_metric('cookie_api_result_store_errors_total', 'counter',
+                                   'Persistent result store reads/writes that failed',
+                                   [({}, store['errors'])])
+    if micro_batcher is not None:
+        batching = micro_batcher.stats()
+        lines += prometheus_metric('cookie_api_micro_batch_size', 'histogram',
+                                   'Cookies per micro-batched model call',
+                                   [({}, batching['batch_size'])])
+        lines += prometheus_metric('cookie_api_micro_batch_queue_depth', 'gauge',
+                                   'Cookies waiting for the micro-batcher',
+                                   [({}, batching['queue_depth'])])
+    return '\n'.join(lines) + '\n'
+
+
+def log_sampled() -> bool:
+    """Whether to log this request's result (CLASSIFY_LOG_SAMPLE_RATE)"""
+    return random.random() < CLASSIFY_LOG_SAMPLE_RATE and logger.isEnabledFor(logging.INFO)
+
+
+def classify_response(cookie: Dict[str, Any], result: Dict[str, Any], risk_score: int) -> Dict[str, Any]:
+    """Body of /classify for one classified cookie"""
+    return {
+        'cookie_name': cookie.get('name'),
+        'category': result['category'],
+        'confidence': result['confidence'],
+        'description': result['description'],
+        'risk_score': risk_score,
+        'classification_method': result['method']
+    }
+
+
+def batch_result(cookie: Dict[str, Any], classification: Dict[str, Any], risk_score: int) -> CookieResult:
+    """One entry of the /classify-batch results (one line of /classify-stream)"""
+    return {
+        'cookie_name': cookie.get('name'),
+        'domain': cookie.get('domain'),
+        'category': classification['category'],
+        'confidence': classification['confidence'],
+        'description': classification['description'],
+        'risk_score': risk_score,
+        'classification_method': classification['method']
+    }
+
+
+def batch_response(cookies: List[Dict[str, Any]],
+                   classified: List[Tuple[Dict[str, Any], int]],
+                   stats_only: bool = False,
+                   unique_cookies: Optional[int] = None):
+    """
+    Body of /classify-batch: per-cookie results plus aggregate statistics
+    
+    One pass over the classified batch fills a category-code column and a
+    risk column (and the results, unless stats_only); the statistics are
+    then reduced from the columns with NumPy instead of re-walking the
+    results.
+    
+    Args:
+        cookies: Cookie objects
+        classified: (classification result, risk score) per cookie
+        stats_only: Skip building per-cookie results
+        unique_cookies: Distinct classification keys, from
+                        classify_many_deduped() (default: no duplicates)
+        
+    Returns:
+        BatchResponse, or BatchStatisticsResponse when stats_only
+    """
+    count = len(classified)
+    if unique_cookies is None:
+        unique_cookies = count
+    category_codes = []
+    risk_scores = []
+    codes = {}  # category -> code, in order of first occurrence
+    results = None if stats_only else []
+    
+    for cookie, (classification, risk_score) in zip(cookies, classified):
+        category = classification['category']
+        code = codes.get(category)
+        if code is None:
+            code = codes[category] = len(codes)
+        category_codes.append(code)
+        risk_scores.append(risk_score)
+        if results is not None:
+            results.append(batch_result(cookie, classification, risk_score))
+    
+    # Columns are converted once; per-element NumPy stores cost more than the loop
+    category_codes = np.array(category_codes, dtype=np.int32)
+    risk_scores = np.array(risk_scores, dtype=np.int64)
+    counts = np.bincount(category_codes, minlength=len(codes)).tolist()
+    stats = BatchStatistics(
+        total_cookies=count,
+        by_category={category: counts[code] for category, code in codes.items()},
+        average_risk_score=int(risk_scores.sum()) / count if count else 0,
+        unique_cookies=unique_cookies,
+        dedupe_ratio=round(count / unique_cookies, 4) if unique_cookies else 1.0
+    )
+    
+    if stats_only:
+        return BatchStatisticsResponse(stats)
+    return BatchResponse(results, stats)
+
+
+class StreamStatistics:
+    """
+    Running /classify-batch statistics for a stream of results
+
+    Keeps counters only, so memory stays flat however many cookies pass
+    through; snapshot() has the shape of the batch 'statistics' without
+    the dedupe fields (that would need every key seen so far), plus the
+    number of rejected lines.
+    """
+
+    def __init__(self):
+        self.total_cookies = 0
+        self.risk_total = 0
+        self.by_category = {}
+        self.errors = 0
+
+    def add(self, category: str, risk_score: int):
+        self.total_cookies += 1
+        self.risk_total += risk_score
+        self.by_category[category] = self.by_category.get(category, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'total_cookies': self.total_cookies,
+            'by_category': dict(self.by_category),
+            'average_risk_score': self.risk_total / self.total_cookies if self.total_cookies else 0,
+            'errors': self.errors
+        }
+
+
+def parse_ndjson_cookie(line, line_number: int) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Parse one /classify-stream input line
+
+    Args:
+        line: Raw line (str or bytes)
+        line_number: 1-based position in the stream, echoed in errors
+
+    Returns:
+        (cookie, None) for a valid cookie, (None, error line) for a bad
+        one, (None, None) for a blank line
+    """
+    if not line.strip():
+        return None, None
+    try:
+        cookie = json_codec.loads(line)
+    except ValueError:
+        return None, {'line': line_number, 'error': 'Invalid JSON'}
+    if validate_cookie(cookie) is not None:
+        return None, {'line': line_number, 'error': 'Invalid cookie data'}
+    return cookie, None
+
+
+def ndjson_line(payload) -> bytes:
+    return json_codec.dumps(payload) + b'\n'
+
+
+class CookieChunker:
+    """
+    Groups NDJSON input lines into classification chunks
+
+    feed() returns (cookies, error lines) once chunk_size cookies have
+    accumulated, flush() returns whatever is left; rejected lines are
+    counted in stats. Shared by the Flask and ASGI stream endpoints.
+    """
+
+    def __init__(self, stats: StreamStatistics, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.stats = stats
+        self.chunk_size = max(1, chunk_size)
+        self.line_number = 0
+        self._cookies = []
+        self._errors = []
+
+    def feed(self, line) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        self.line_number += 1
+        cookie, error = parse_ndjson_cookie(line, self.line_number)
+        if error is not None:
+            self.stats.errors += 1
+            self._errors.append(error)
+        elif cookie is not None:
+            self._cookies.append(cookie)
+        if len(self._cookies) >= self.chunk_size:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        if not self._cookies and not self._errors:
+            return None
+        chunk = (self._cookies, self._errors)
+        self._cookies, self._errors = [], []
+        return chunk
+
+
+def stream_chunk_lines(cookies: List[Dict[str, Any]], errors: List[Dict[str, Any]],
+                       classified: List[Tuple[Dict[str, Any], int]],
+                       stats: StreamStatistics) -> Iterator[bytes]:
+    """NDJSON output for one classified chunk: rejected lines, then results"""
+    for error in errors:
+        yield ndjson_line(error)
+    for cookie, (classification, risk_score) in zip(cookies, classified):
+        stats.add(classification['category'], risk_score)
+        yield ndjson_line(batch_result(cookie, classification, risk_score))
+
+
+def classify_stream_chunk(chunk: Tuple[List[Dict[str, Any]], List[Dict[str, Any]]],
+                          stats: StreamStatistics) -> Iterator[bytes]:
+    """Classify one CookieChunker chunk and yield its NDJSON output lines"""
+    cookies, errors = chunk
+    classified = classify_many_with_risk(cookies) if cookies else []
+    yield from stream_chunk_lines(cookies, errors, classified, stats)
+
+
+def classify_stream(lines: Iterable, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Classify an NDJSON cookie stream chunk by chunk
+
+    Only one chunk of cookies and results is alive at a time. Each output
+    line is a /classify-batch result (or {"line", "error"} for a rejected
+    input line); the last line is {"statistics": {...}}.
+
+    Args:
+        lines: Iterable of NDJSON lines, one cookie object per line
+        chunk_size: Cookies classified per classify_many_with_risk() call
+
+    Yields:
+        NDJSON output lines
+    """
+    stats = StreamStatistics()
+    chunker = CookieChunker(stats, chunk_size)
+    for line in lines:
+        chunk = chunker.feed(line)
+        if chunk is not None:
+            yield from classify_stream_chunk(chunk, stats)
+    chunk = chunker.flush()
+    if chunk is not None:
+        yield from classify_stream_chunk(chunk, stats)
+    yield ndjson_line({'statistics': stats.snapshot()})
+
+
+def categories_payload() -> Dict[str, Any]:
+    """Body of /categories"""
+    return {
+        'categories': {
+            category: data['description'] 
+            for category, data in COOKIE_CATEGORIES.items()
+        }
+    }
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-endpoint latency; streamed responses count until the headers are sent"""
+    rule = request.url_rule
+    metrics.observe_request(rule.rule if rule is not None else 'other', response.status_code,
+                            (time.perf_counter() - g.request_start) * 1000)
+    return response
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'model': MODEL_NAME,
-        'version': '1.0.0'
-    })
+    return json_response(health_payload())
 
 
 @app.route('/classify', methods=['POST'])
@@ -219,33 +2094,29 @@ def classify_cookie():
     }
     """
     try:
-        cookie = request.json
-        
-        if not cookie or 'name' not in cookie:
-            return jsonify({'error': 'Invalid cookie data'}), 400
-        
-        # Classify using hybrid approach
-        result = ml_based_classification(cookie)
+        with metrics.stage('parse'):
+            try:
+                cookie = json_codec.loads(request.get_data(cache=False))
+            except ValueError:
+                return json_response({'error': 'Invalid JSON'}, 400)
+            
+            error = validate_cookie(cookie)
+            if error is not None:
+                return json_response({'error': 'Invalid cookie data', 'details': error}, 400)
         
-        # Add risk score
-        risk_score = calculate_risk_score(cookie, result['category'])
+        # Classify using hybrid approach and add risk score
+        result, risk_score = classify_single(cookie)
         
-        response = {
-            'cookie_name': cookie.get('name'),
-            'category': result['category'],
-            'confidence': result['confidence'],
-            'description': result['description'],
-            'risk_score': risk_score,
-            'classification_method': result['method']
-        }
+        response = classify_response(cookie, result, risk_score)
         
-        logger.info(f"Classified cookie '{cookie.get('name')}' as '{result['category']}'")
+        if log_sampled():
+            logger.info(f"Classified cookie '{cookie.get('name')}' as '{result['category']}'")
         
-        return jsonify(response)
+        return json_response(response)
         
     except Exception as e:
         logger.error(f"Classification error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 
 @app.route('/classify-batch', methods=['POST'])
@@ -258,64 +2129,76 @@ def classify_cookies_batch():
         "cookies": [
             { "name": "...", "domain": "...", ... },
             ...
-        ]
+        ],
+        "stats_only": false  # Optional, return only "statistics"
     }
     """
     try:
-        data = request.json
-        cookies = data.get('cookies', [])
-        
-        if not cookies:
-            return jsonify({'error': 'No cookies provided'}), 400
-        
-        results = []
-        for cookie in cookies:
-            # Classify each cookie
-            classification = ml_based_classification(cookie)
-            risk_score = calculate_risk_score(cookie, classification['category'])
+        with metrics.stage('parse'):
+            try:
+                data = json_codec.loads(request.get_data(cache=False))
+            except ValueError:
+                return json_response({'error': 'Invalid JSON'}, 400)
             
-            results.append({
-                'cookie_name': cookie.get('name'),
-                'domain': cookie.get('domain'),
-                'category': classification['category'],
-                'confidence': classification['confidence'],
-                'description': classification['description'],
-                'risk_score': risk_score,
-                'classification_method': classification['method']
-            })
-        
-        # Calculate aggregate statistics
-        stats = {
-            'total_cookies': len(results),
-            'by_category': {},
-            'average_risk_score': sum(r['risk_score'] for r in results) / len(results)
-        }
+            cookies = data.get('cookies', []) if isinstance(data, dict) else None
+            if not cookies:
+                return json_response({'error': 'No cookies provided'}, 400)
+            
+            # Reject malformed cookies before classifying any of them
+            errors = validate_cookies(cookies)
+            if errors:
+                return json_response({'error': 'Invalid cookie data', 'invalid': errors}, 400)
         
-        for result in results:
-            category = result['category']
-            stats['by_category'][category] = stats['by_category'].get(category, 0) + 1
+        # Classify each distinct cookie once, in one batch
+        classified, unique = classify_many_deduped(cookies)
+        metrics.observe_batch(len(cookies), unique)
+        response = batch_response(cookies, classified, stats_only=bool(data.get('stats_only')),
+                                  unique_cookies=unique)
         
-        logger.info(f"Batch classified {len(results)} cookies")
+        if log_sampled():
+            logger.info(f"Batch classified {len(cookies)} cookies")
         
-        return jsonify({
-            'results': results,
-            'statistics': stats
-        })
+        return json_response(response)
         
     except Exception as e:
         logger.error(f"Batch classification error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
+
+
+@app.route('/classify-stream', methods=['POST'])
+def classify_cookies_stream():
+    """
+    Classify a newline-delimited JSON stream of cookies
+    
+    Expected body (application/x-ndjson), one cookie object per line:
+    { "name": "...", "domain": "...", ... }
+    { "name": "...", "domain": "...", ... }
+    
+    Results are streamed back as NDJSON in input order, one
+    /classify-batch result per cookie; rejected lines produce
+    {"line": n, "error": "..."} and the final line is
+    {"statistics": {...}}.
+    """
+    def generate():
+        try:
+            yield from classify_stream(request.stream)
+        except Exception as e:
+            logger.error(f"Stream classification error: {str(e)}")
+            yield ndjson_line({'error': str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 
 @app.route('/categories', methods=['GET'])
 def get_categories():
     """Get available cookie categories and their descriptions"""
-    return jsonify({
-        'categories': {
-            category: data['description'] 
-            for category, data in COOKIE_CATEGORIES.items()
-        }
-    })
+    return json_response(categories_payload())
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, stage, batch, cache and classification metrics for Prometheus"""
+    return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,280 @@
+"""
+Cookie Classification API Service (ASGI)
+Async variant of cookie_classifier_api.py with the same endpoints and responses.
+Model calls run on a bounded thread pool so the event loop keeps serving
+connections while inference is in progress.
+
+Run with:
+    uvicorn cookie_classifier_asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import os
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import cookie_classifier_api as api
+
+logger = logging.getLogger(__name__)
+
+# Threads running model calls; pending requests beyond this wait on the loop
+ASGI_INFERENCE_WORKERS = int(os.getenv('ASGI_INFERENCE_WORKERS', 4))
+# Requests allowed to wait for a worker before new ones get 503
+ASGI_MAX_PENDING = int(os.getenv('ASGI_MAX_PENDING', 1024))
+
+inference_executor = ThreadPoolExecutor(max_workers=ASGI_INFERENCE_WORKERS,
+                                        thread_name_prefix='inference')
+_pending = 0
+
+
+class ServerBusy(Exception):
+    """Raised when ASGI_MAX_PENDING requests are already waiting"""
+
+
+async def run_inference(func, *args):
+    """
+    Run a blocking classification call on the bounded executor
+
+    Args:
+        func: Classification function from cookie_classifier_api
+        *args: Its arguments
+
+    Returns:
+        The function's result
+    """
+    global _pending
+    if _pending >= ASGI_MAX_PENDING:
+        raise ServerBusy('Server busy, retry later')
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(inference_executor, func, *args)
+    finally:
+        _pending -= 1
+
+
+async def classify_single(cookie):
+    """
+    Async counterpart of api.classify_single()
+
+    Cache hits are answered on the loop; misses wait on the micro-batcher's
+    future without holding a thread.
+    """
+    if not api.micro_batching_active():
+        return await run_inference(api.classify_with_risk, cookie)
+
+    key = api.cookie_cache_key(cookie)
+    cached = api.classification_cache.get(key)
+    if cached is not None:
+        return cached
+    future = api.micro_batcher.submit(cookie, key)
+    return await asyncio.wait_for(asyncio.wrap_future(future), api.MICRO_BATCH_TIMEOUT)
+
+
+class CodecJSONResponse(JSONResponse):
+    """JSONResponse serialized with the API's json_codec"""
+
+    def render(self, content) -> bytes:
+        with api.metrics.stage('serialize'):
+            return api.json_codec.dumps(content)
+
+
+def error_response(e: Exception, context: str) -> JSONResponse:
+    if isinstance(e, ServerBusy):
+        return CodecJSONResponse({'error': str(e)}, status_code=503)
+    logger.error(f"{context} error: {str(e)}")
+    return CodecJSONResponse({'error': str(e)}, status_code=500)
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    payload = api.health_payload()
+    payload['asgi'] = {
+        'inference_workers': ASGI_INFERENCE_WORKERS,
+        'max_pending': ASGI_MAX_PENDING,
+        'pending': _pending
+    }
+    return CodecJSONResponse(payload)
+
+
+async def classify_cookie(request):
+    """Classify a single cookie (same body as the Flask /classify)"""
+    try:
+        body = await request.body()
+        with api.metrics.stage('parse'):
+            try:
+                cookie = api.json_codec.loads(body)
+            except ValueError:
+                return CodecJSONResponse({'error': 'Invalid JSON'}, status_code=400)
+
+            error = api.validate_cookie(cookie)
+            if error is not None:
+                return CodecJSONResponse({'error': 'Invalid cookie data', 'details': error},
+                                         status_code=400)
+
+        result, risk_score = await classify_single(cookie)
+        return CodecJSONResponse(api.classify_response(cookie, result, risk_score))
+
+    except Exception as e:
+        return error_response(e, 'Classification')
+
+
+async def classify_cookies_batch(request):
+    """Classify multiple cookies at once (same body as the Flask /classify-batch)"""
+    try:
+        body = await request.body()
+        with api.metrics.stage('parse'):
+            try:
+                data = api.json_codec.loads(body)
+            except ValueError:
+                return CodecJSONResponse({'error': 'Invalid JSON'}, status_code=400)
+
+            cookies = data.get('cookies', []) if isinstance(data, dict) else None
+            if not cookies:
+                return CodecJSONResponse({'error': 'No cookies provided'}, status_code=400)
+
+            errors = api.validate_cookies(cookies)
+            if errors:
+                return CodecJSONResponse({'error': 'Invalid cookie data', 'invalid': errors},
+                                         status_code=400)
+
+        classified, unique = await run_inference(api.classify_many_deduped, cookies)
+        api.metrics.observe_batch(len(cookies), unique)
+        return CodecJSONResponse(api.batch_response(cookies, classified,
+                                                    stats_only=bool(data.get('stats_only')),
+                                                    unique_cookies=unique))
+
+    except Exception as e:
+        return error_response(e, 'Batch classification')
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for endpoints that keep reading the request body
+
+    The stock response listens for http.disconnect on receive() while
+    streaming (ASGI < 2.4), which steals body messages from
+    request.stream() and hangs the request. Here the body reader alone
+    owns receive(); a disconnect surfaces there as ClientDisconnect.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def iter_body_lines(request):
+    """Yield the request body line by line as it arrives"""
+    pending = b''
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+async def classify_stream_chunk(chunk, stats):
+    """Classify one CookieChunker chunk off the loop and return its output lines"""
+    cookies, errors = chunk
+    classified = await run_inference(api.classify_many_with_risk, cookies) if cookies else []
+    return list(api.stream_chunk_lines(cookies, errors, classified, stats))
+
+
+async def classify_cookies_stream(request):
+    """Classify an NDJSON cookie stream (same lines as the Flask /classify-stream)"""
+    async def generate():
+        stats = api.StreamStatistics()
+        chunker = api.CookieChunker(stats)
+        try:
+            async for line in iter_body_lines(request):
+                chunk = chunker.feed(line)
+                if chunk is not None:
+                    for out in await classify_stream_chunk(chunk, stats):
+                        yield out
+            chunk = chunker.flush()
+            if chunk is not None:
+                for out in await classify_stream_chunk(chunk, stats):
+                    yield out
+            yield api.ndjson_line({'statistics': stats.snapshot()})
+        except ClientDisconnect:
+            logger.info('Client disconnected from /classify-stream')
+        except Exception as e:
+            logger.error(f"Stream classification error: {str(e)}")
+            yield api.ndjson_line({'error': str(e)})
+
+    return BodyStreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+async def get_categories(request):
+    """Get available cookie categories and their descriptions"""
+    return CodecJSONResponse(api.categories_payload())
+
+
+async def get_metrics(request):
+    """Request, stage, batch, cache and classification metrics for Prometheus"""
+    return PlainTextResponse(api.metrics_text(), media_type='text/plain; version=0.0.4')
+
+
+class RequestMetricsMiddleware:
+    """Records per-endpoint latency, until the last body byte, in api.metrics"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = scope['path'] if scope['path'] in ENDPOINTS else 'other'
+            api.metrics.observe_request(endpoint, status, (time.perf_counter() - start) * 1000)
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/classify', classify_cookie, methods=['POST']),
+    Route('/classify-batch', classify_cookies_batch, methods=['POST']),
+    Route('/classify-stream', classify_cookies_stream, methods=['POST']),
+    Route('/categories', get_categories, methods=['GET']),
+    Route('/metrics', get_metrics, methods=['GET']),
+]
+# Paths reported as metric labels; anything else is 'other'
+ENDPOINTS = {route.path for route in routes}
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestMetricsMiddleware),
+        # Enable CORS for Chrome extension
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    ],
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.getenv('PORT', 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port)
@@ -0,0 +1,150 @@
+"""
+ONNX Export for the Cookie Classification Model
+Exports a transformers sequence classifier to ONNX for the API's onnx backend,
+optionally with dynamic INT8 quantization
+"""
+
+import os
+import logging
+from typing import Dict
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ONNX_FILE = 'model.onnx'
+INT8_FILE = 'model.int8.onnx'
+
+
+def export_onnx(model_path: str, output_dir: str, opset: int = 17,
+                quantize: bool = False) -> Dict[str, str]:
+    """
+    Export a checkpoint to ONNX with dynamic batch and sequence axes
+
+    The output directory also receives the tokenizer and config, so it can
+    be used directly as ONNX_MODEL_PATH.
+
+    Args:
+        model_path: Local checkpoint directory or cached hub model id
+        output_dir: Directory to write the export into
+        opset: ONNX opset version
+        quantize: Also write a dynamically quantized INT8 graph
+
+    Returns:
+        Dictionary of written graph paths ('fp32' and optionally 'int8')
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path, local_files_only=True)
+    model.eval()
+
+    sample = tokenizer(['Cookie name: _ga. Domain: .example.com. Path: /.'] * 2,
+                       padding=True, return_tensors='pt')
+    input_names = list(sample.keys())
+
+    class LogitsOnly(torch.nn.Module):
+        """Positional-input wrapper returning just the logits tensor"""
+
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+
+        def forward(self, *inputs):
+            return self.wrapped(**dict(zip(input_names, inputs))).logits
+
+    paths = {'fp32': os.path.join(output_dir, ONNX_FILE)}
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsOnly(model),
+            tuple(sample[name] for name in input_names),
+            paths['fp32'],
+            input_names=input_names,
+            output_names=['logits'],
+            dynamic_axes={
+                **{name: {0: 'batch', 1: 'sequence'} for name in input_names},
+                'logits': {0: 'batch'},
+            },
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    logger.info(f"Exported {model_path} to {paths['fp32']}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        paths['int8'] = os.path.join(output_dir, INT8_FILE)
+        quantize_dynamic(paths['fp32'], paths['int8'], weight_type=QuantType.QInt8)
+        logger.info(f"Wrote INT8 graph to {paths['int8']}")
+
+    return paths
+
+
+def verify_export(model_path: str, output_dir: str, onnx_file: str = ONNX_FILE) -> float:
+    """
+    Largest absolute logit difference between PyTorch and ONNX Runtime
+
+    Args:
+        model_path: Original checkpoint
+        output_dir: Export directory
+        onnx_file: Graph inside output_dir to compare
+
+    Returns:
+        Max absolute difference over a small padded batch
+    """
+    import onnxruntime as ort
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(output_dir, local_files_only=True)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path, local_files_only=True)
+    model.eval()
+
+    texts = ['Cookie name: _ga. Domain: .google.com. Path: /.',
+             'Cookie name: sessionid. Domain: www.example.com. Path: /. HTTPOnly enabled.',
+             'Cookie name: ide. Domain: .doubleclick.net. Path: /. Secure flag set. SameSite: none.']
+    encoded = tokenizer(texts, padding=True, return_tensors='np')
+    session = ort.InferenceSession(os.path.join(output_dir, onnx_file),
+                                   providers=['CPUExecutionProvider'])
+    feed = {i.name: encoded[i.name].astype(np.int64) for i in session.get_inputs()}
+    onnx_logits = session.run(['logits'], feed)[0]
+    with torch.no_grad():
+        torch_logits = model(**{k: torch.from_numpy(v) for k, v in encoded.items()}).logits.numpy()
+    return float(np.abs(onnx_logits - torch_logits).max())
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export the cookie classifier to ONNX')
+    parser.add_argument('--model', '-m', default=os.getenv('MODEL_NAME'), required=not os.getenv('MODEL_NAME'),
+                        help='Checkpoint directory or cached model id (default: $MODEL_NAME)')
+    parser.add_argument('--output', '-o', required=True,
+                        help='Output directory (use as ONNX_MODEL_PATH)')
+    parser.add_argument('--opset', type=int, default=17,
+                        help='ONNX opset version (default: 17)')
+    parser.add_argument('--quantize', action='store_true',
+                        help=f'Also write a dynamic INT8 graph ({INT8_FILE})')
+    parser.add_argument('--verify', action='store_true',
+                        help='Compare exported logits against PyTorch')
+
+    args = parser.parse_args()
+
+    paths = export_onnx(args.model, args.output, opset=args.opset, quantize=args.quantize)
+
+    if args.verify:
+        for label, path in paths.items():
+            diff = verify_export(args.model, args.output, os.path.basename(path))
+            print(f"{label}: max |logit diff| vs PyTorch = {diff:.6f}")
+
+    print("\nServe with:")
+    print(f"  INFERENCE_BACKEND=onnx ONNX_MODEL_PATH={args.output} "
+          f"ONNX_MODEL_FILE={os.path.basename(paths.get('int8', paths['fp32']))}")
+
+
+if __name__ == '__main__':
+    main()
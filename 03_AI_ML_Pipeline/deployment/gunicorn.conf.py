@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for the Cookie Classification API
+
+    gunicorn -c gunicorn.conf.py cookie_classifier_api:app
+
+With GUNICORN_PRELOAD=1 (the default) the master imports the app and loads
+the local model once before forking, so workers start warm and share the
+weights copy-on-write instead of each paying the import and load.
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+if preload_app:
+    # A background loader thread would not survive the fork; load in the master
+    os.environ.setdefault('MODEL_LOAD_MODE', 'eager')
+
+
+def when_ready(server):
+    """Runs in the master after the app is loaded, before workers fork"""
+    if preload_app:
+        # Move the preloaded objects out of the collector's generations so
+        # worker GC passes do not write to (and un-share) their pages
+        gc.freeze()
@@ -0,0 +1,158 @@
+"""
+Load Test for the Cookie Classification API Serving Modes
+Compares concurrent /classify throughput of the Flask (sync worker) and ASGI
+apps, each served by a single process, with a simulated model latency
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+DEPLOYMENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                              '../../03_AI_ML_Pipeline/deployment'))
+sys.path.insert(0, DEPLOYMENT_DIR)
+
+
+def serve(mode, port, simulated_ms):
+    """
+    Serve one app in this process with a fixed per-batch model latency
+
+    Args:
+        mode: 'flask' (single-threaded WSGI server, like one gunicorn sync
+              worker) or 'asgi' (one uvicorn worker)
+        port: Port to listen on
+        simulated_ms: Sleep added to every model batch call
+    """
+    import cookie_classifier_api as api
+
+    classify_batch = api.ml_based_classification_batch
+
+    def slow_batch(cookies):
+        time.sleep(simulated_ms / 1000.0)
+        return classify_batch(cookies)
+
+    api.ml_based_classification_batch = slow_batch
+
+    if mode == 'flask':
+        from werkzeug.serving import make_server
+        make_server('127.0.0.1', port, api.app, threaded=False).serve_forever()
+    else:
+        import uvicorn
+        import cookie_classifier_asgi
+        uvicorn.run(cookie_classifier_asgi.app, host='127.0.0.1', port=port,
+                    log_level='warning', access_log=False)
+
+
+def wait_until_healthy(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f'{base_url}/health', timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not become healthy')
+
+
+async def run_load(base_url, concurrency, total_requests):
+    """
+    Fire unique-cookie /classify requests from `concurrency` clients
+
+    Returns:
+        Dictionary with requests/sec, latency percentiles and error count
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(total_requests))
+
+    async def client_loop(client):
+        nonlocal errors
+        for i in counter:
+            cookie = {'name': f'load_cookie_{i}', 'domain': f'site{i % 97}.example.com',
+                      'path': '/', 'secure': i % 2 == 0}
+            start = time.perf_counter()
+            try:
+                response = await client.post(f'{base_url}/classify', json=cookie)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': total_requests,
+        'concurrency': concurrency,
+        'requests_per_sec': total_requests / elapsed,
+        'p50_ms': latencies[len(latencies) // 2],
+        'p99_ms': latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        'errors': errors,
+    }
+
+
+def benchmark_mode(mode, port, concurrency, total_requests, simulated_ms):
+    """Start a server subprocess for `mode`, load it, and stop it"""
+    server = subprocess.Popen(
+        [sys.executable, __file__, '--serve', mode, '--port', str(port),
+         '--simulated-ms', str(simulated_ms)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_healthy(base_url)
+        result = asyncio.run(run_load(base_url, concurrency, total_requests))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    print(f"{mode}: {result['requests_per_sec']:,.0f} req/s, p50 {result['p50_ms']:.1f}ms, "
+          f"p99 {result['p99_ms']:.1f}ms, errors {result['errors']}")
+    return result
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Flask vs ASGI load test')
+    parser.add_argument('--serve', choices=['flask', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=8731)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--simulated-ms', type=float, default=20,
+                        help='Model latency added per batch call (default: 20)')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.simulated_ms)
+        return
+
+    print(f"Load test: {args.requests} requests, concurrency {args.concurrency}, "
+          f"{args.simulated_ms:g}ms per model call, one server process each\n")
+    results = {
+        mode: benchmark_mode(mode, args.port + offset, args.concurrency, args.requests,
+                             args.simulated_ms)
+        for offset, mode in enumerate(['flask', 'asgi'])
+    }
+    speedup = results['asgi']['requests_per_sec'] / results['flask']['requests_per_sec']
+    results['asgi_speedup'] = speedup
+    print(f"\nASGI vs Flask throughput: {speedup:.1f}x")
+
+    with open('api_load_results.json', 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Results saved to api_load_results.json")
+
+
+if __name__ == '__main__':
+    main()
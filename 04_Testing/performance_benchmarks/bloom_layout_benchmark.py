@@ -0,0 +1,136 @@
+"""
+Bloom Filter Layout Benchmark
+Compares the classic and cache-line blocked Bloom filter layouts at the same
+memory budget: probes/sec and measured false positive rate
+"""
+
+import time
+import json
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '../../03_AI_ML_Pipeline/deployment')))
+
+from build_bloom_filter import (
+    BlockedBloomFilterBuilder,
+    BloomFilterBuilder,
+    blocked_hash_positions_many,
+    calculate_blocked_params,
+    hash_positions_many,
+)
+
+
+class BloomLayoutBenchmark:
+    """
+    Benchmark classic vs blocked layouts built from the same domains
+    """
+
+    def __init__(self, num_items=1_000_000, num_probes=2_000_000, fp_rate=0.001):
+        """
+        Initialize benchmark
+
+        Args:
+            num_items: Number of synthetic tracker domains inserted
+            num_probes: Number of negative domains probed
+            fp_rate: Target false positive rate used for sizing
+        """
+        self.num_items = num_items
+        self.num_probes = num_probes
+        self.fp_rate = fp_rate
+
+    def build(self, cls, size, num_hashes, members):
+        """Build one filter and return it with its build time"""
+        bf = cls(size, num_hashes)
+        start = time.perf_counter()
+        bf.add_many(members)
+        return bf, time.perf_counter() - start
+
+    def measure_lookup(self, bf, positions, repeats=3):
+        """
+        Time bit lookups only, with positions already hashed
+
+        Returns:
+            (best probes/sec, membership mask)
+        """
+        best = float('inf')
+        offsets = (positions & np.uint64(7)).astype(np.uint8)
+        byte_index = positions >> np.uint64(3)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            bits = bf.bit_array[byte_index] >> offsets
+            mask = (bits & 1).astype(bool).all(axis=1)
+            best = min(best, time.perf_counter() - start)
+        return len(positions) / best, mask
+
+    def run_benchmark(self):
+        """
+        Run the comparison
+
+        Returns:
+            Dictionary with results per layout
+        """
+        members = [f"t{i}.tracker{i % 5003}.com" for i in range(self.num_items)]
+        probes = [f"site{i}.example{i % 7919}.org" for i in range(self.num_probes)]
+
+        # Same memory budget for both layouts (classic size rounded up to blocks)
+        size, num_hashes = calculate_blocked_params(self.num_items, self.fp_rate)
+        print(f"Filter: {size // 8} bytes, k={num_hashes}, "
+              f"{self.num_items} items, {self.num_probes} probes")
+
+        results = {'size_bytes': size // 8, 'num_hashes': num_hashes}
+        layouts = {
+            'classic': (BloomFilterBuilder,
+                        lambda keys: hash_positions_many(keys, num_hashes, size)),
+            'blocked': (BlockedBloomFilterBuilder,
+                        lambda keys: blocked_hash_positions_many(
+                            keys, num_hashes, size // 512)),
+        }
+        for name, (cls, positions_of) in layouts.items():
+            bf, build_time = self.build(cls, size, num_hashes, members)
+
+            start = time.perf_counter()
+            bf.has_many(probes)
+            end_to_end = self.num_probes / (time.perf_counter() - start)
+
+            lookup_rate, mask = self.measure_lookup(bf, positions_of(probes))
+            results[name] = {
+                'build_seconds': build_time,
+                'has_many_probes_per_sec': end_to_end,
+                'lookup_probes_per_sec': lookup_rate,
+                'measured_fp_rate': float(mask.mean()),
+                'fill_ratio': bf.fill_ratio(),
+            }
+            print(f"  {name:8s} lookup {lookup_rate / 1e6:7.2f} M probes/s, "
+                  f"has_many {end_to_end / 1e6:6.2f} M probes/s, "
+                  f"FP rate {mask.mean():.5f}")
+
+        return results
+
+    def save_results(self, results, filename='bloom_layout_results.json'):
+        """
+        Save benchmark results to JSON file
+
+        Args:
+            results: Benchmark results dictionary
+            filename: Output filename
+        """
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        print(f"\nResults saved to {filename}")
+
+
+def main():
+    """
+    Run the layout benchmark
+    """
+    benchmark = BloomLayoutBenchmark()
+    results = benchmark.run_benchmark()
+    benchmark.save_results(results)
+
+
+if __name__ == '__main__':
+    main()
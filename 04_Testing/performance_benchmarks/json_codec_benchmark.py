@@ -0,0 +1,107 @@
+"""
+JSON Codec Benchmark for the Cookie Classification API
+Measures /classify-batch request parsing, validation and response
+serialization cost per 1,000 cookies for each installed codec, against the
+original request.json + hand-built dicts + jsonify path
+"""
+
+import time
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '../../03_AI_ML_Pipeline/deployment')))
+
+import cookie_classifier_api as api
+from cookie_classifier_benchmark import generate_cookies
+
+
+def best_time(func, repeats=5):
+    """Fastest of `repeats` calls to func, in seconds"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def legacy_batch_body(cookies, classified):
+    """Response dicts as /classify-batch built them before the structs"""
+    results = []
+    for cookie, (classification, risk_score) in zip(cookies, classified):
+        results.append({
+            'cookie_name': cookie.get('name'),
+            'domain': cookie.get('domain'),
+            'category': classification['category'],
+            'confidence': classification['confidence'],
+            'description': classification['description'],
+            'risk_score': risk_score,
+            'classification_method': classification['method']
+        })
+    stats = {
+        'total_cookies': len(results),
+        'by_category': {},
+        'average_risk_score': sum(r['risk_score'] for r in results) / len(results)
+    }
+    for result in results:
+        stats['by_category'][result['category']] = stats['by_category'].get(result['category'], 0) + 1
+    return {'results': results, 'statistics': stats}
+
+
+def benchmark_legacy(cookies, classified, body):
+    """Flask request.json and jsonify, as the endpoint originally did"""
+    with api.app.app_context():
+        from flask import jsonify
+
+        # request.json decodes the body with the app's JSON provider
+        parse_s = best_time(lambda: api.app.json.loads(body))
+        serialize_s = best_time(lambda: jsonify(legacy_batch_body(cookies, classified)).get_data())
+    return {'parse': parse_s, 'validate': 0.0, 'serialize': serialize_s}
+
+
+def benchmark_codec(codec, cookies, classified, body):
+    """Codec loads, one-pass validation, struct building and dumps"""
+    return {
+        'parse': best_time(lambda: codec.loads(body)),
+        'validate': best_time(lambda: api.validate_cookies(cookies)),
+        'serialize': best_time(lambda: codec.dumps(api.batch_response(cookies, classified))),
+    }
+
+
+def main():
+    """
+    Run the codec benchmark
+    """
+    count = 20000
+    cookies = generate_cookies(count)
+    classified = api.classify_many_with_risk(cookies)
+    body = json.dumps({'cookies': cookies}).encode('utf-8')
+    per_thousand = 1000 / count
+
+    timings = {'flask_jsonify (baseline)': benchmark_legacy(cookies, classified, body)}
+    for name, codec_class in api.JSON_CODECS.items():
+        try:
+            codec = codec_class()
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+            continue
+        timings[name] = benchmark_codec(codec, cookies, classified, body)
+
+    print(f"\n/classify-batch JSON cost per 1,000 cookies ({count} cookies per request):")
+    results = {}
+    for name, stages in timings.items():
+        ms = {stage: seconds * per_thousand * 1000 for stage, seconds in stages.items()}
+        ms['total'] = sum(ms.values())
+        results[name] = ms
+        print(f"  {name:<26} parse {ms['parse']:6.3f}ms  validate {ms['validate']:6.3f}ms  "
+              f"serialize {ms['serialize']:6.3f}ms  total {ms['total']:6.3f}ms")
+
+    with open('json_codec_results.json', 'w') as f:
+        json.dump({'cookies_per_request': count, 'ms_per_1000_cookies': results}, f, indent=2)
+    print("\nResults saved to json_codec_results.json")
+
+
+if __name__ == '__main__':
+    main()
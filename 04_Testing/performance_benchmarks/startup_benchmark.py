@@ -0,0 +1,103 @@
+"""
+Startup-Time Benchmark for the Cookie Classification API
+Measures, in fresh interpreters, how long a worker takes to start listening
+and to have the model warm under each MODEL_LOAD_MODE, against the original
+eager huggingface_hub import + InferenceClient + model load, and how long a
+worker forked from a preloaded gunicorn-style master takes to serve /health
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DEPLOYMENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                              '../../03_AI_ML_Pipeline/deployment'))
+
+# Runs in the child interpreter; prints one JSON line of timings in seconds
+PROBE = '''
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {deployment!r})
+if {legacy!r}:
+    from huggingface_hub import InferenceClient
+    InferenceClient(token=os.getenv('HF_TOKEN', ''))
+import cookie_classifier_api as api
+api.app.test_client().get('/health')
+listening = time.perf_counter() - start
+api.model_loader.ensure()
+while api.model_loader.state == 'loading':
+    time.sleep(0.002)
+warm = time.perf_counter() - start
+print(json.dumps({{'listening': listening, 'warm': warm, 'model_state': api.model_loader.state}}))
+'''
+
+# Imports eagerly like a --preload master, then times a forked worker's first response
+FORK_PROBE = '''
+import json, os, sys, time
+sys.path.insert(0, {deployment!r})
+import cookie_classifier_api as api
+read_fd, write_fd = os.pipe()
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    api.app.test_client().get('/health')
+    os.write(write_fd, repr(time.perf_counter() - start).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+first_response = float(os.read(read_fd, 64))
+print(json.dumps({{'listening': first_response, 'warm': first_response,
+                  'model_state': api.model_loader.state}}))
+'''
+
+
+def run_probe(source, env_overrides):
+    """One fresh interpreter running `source`; returns its timing dict"""
+    env = dict(os.environ, **env_overrides)
+    output = subprocess.run([sys.executable, '-c', source], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark_mode(source, env_overrides, runs):
+    """Median listening/warm times over `runs` fresh interpreters"""
+    samples = [run_probe(source, env_overrides) for _ in range(runs)]
+    return {
+        'listening_s': statistics.median(s['listening'] for s in samples),
+        'warm_s': statistics.median(s['warm'] for s in samples),
+        'model_state': samples[-1]['model_state'],
+    }
+
+
+def main():
+    """
+    Run the startup benchmark
+    """
+    runs = 5
+    probe = lambda legacy: PROBE.format(deployment=DEPLOYMENT_DIR, legacy=legacy)
+    scenarios = {
+        'legacy (eager client + model)': (probe(True), {'MODEL_LOAD_MODE': 'eager'}),
+        'eager': (probe(False), {'MODEL_LOAD_MODE': 'eager'}),
+        'background': (probe(False), {'MODEL_LOAD_MODE': 'background'}),
+        'lazy (first classification)': (probe(False), {'MODEL_LOAD_MODE': 'lazy'}),
+        'preloaded master, forked worker': (FORK_PROBE.format(deployment=DEPLOYMENT_DIR),
+                                            {'MODEL_LOAD_MODE': 'eager'}),
+    }
+
+    print(f"\nWorker startup, median of {runs} fresh interpreters "
+          f"(LOCAL_MODEL_PATH={os.getenv('LOCAL_MODEL_PATH', 'default')}):")
+    results = {}
+    for name, (source, env_overrides) in scenarios.items():
+        results[name] = benchmark_mode(source, env_overrides, runs)
+        r = results[name]
+        print(f"  {name:<34} listening {r['listening_s'] * 1000:8.1f}ms  "
+              f"model warm {r['warm_s'] * 1000:8.1f}ms  ({r['model_state']})")
+
+    with open('startup_results.json', 'w') as f:
+        json.dump({'runs': runs, 'results': results}, f, indent=2)
+    print("\nResults saved to startup_results.json")
+
+
+if __name__ == '__main__':
+    main()
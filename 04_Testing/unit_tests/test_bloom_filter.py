@@ -0,0 +1,681 @@
+"""
+Unit tests for the tracker Bloom filter builder
+"""
+
+import unittest
+import random
+import string
+import tempfile
+import struct
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Add deployment directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '../../03_AI_ML_Pipeline/deployment')))
+
+from build_bloom_filter import (
+    BUILTIN_TRACKER_DOMAINS,
+    BLOCK_BITS,
+    BinaryFuseFilterBuilder,
+    BlockedBloomFilterBuilder,
+    BloomFilterBuilder,
+    BloomFilterView,
+    CountingBloomFilterBuilder,
+    accumulated_deltas,
+    DistinctCounter,
+    blocked_hash_positions_many,
+    build_filter,
+    build_shards,
+    calculate_blocked_params,
+    calculate_optimal_params,
+    evaluate_false_positive_rate,
+    file_sha256,
+    generate_negative_domains,
+    iter_domains_from_file,
+    iter_shard,
+    iter_unique_key_chunks,
+    load_manifest,
+    make_shards,
+    parse_domain_line,
+    read_filter,
+    scan_domain_source,
+    scan_shards,
+    update_filter,
+    verify_fuse_filter,
+    wilson_interval,
+    write_manifest,
+    HASH_SEED_1,
+    HASH_SEED_2,
+    murmurhash3_32,
+    murmurhash3_32_many,
+)
+
+
+def random_domains(count, seed=1234):
+    """Generate reproducible domain-like strings of varying length"""
+    rng = random.Random(seed)
+    alphabet = string.ascii_lowercase + string.digits + '-.'
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 70)))
+            for _ in range(count)]
+
+
+class TestMurmurHashBatch(unittest.TestCase):
+    """Parity of the vectorized MurmurHash3 engine with the scalar version"""
+
+    def assert_parity(self, keys, seeds=(HASH_SEED_1, HASH_SEED_2), **kwargs):
+        hashes = murmurhash3_32_many(keys, seeds, **kwargs)
+        self.assertEqual(len(hashes), len(seeds))
+        for seed, batch in zip(seeds, hashes):
+            self.assertEqual(batch.dtype, np.uint32)
+            expected = [murmurhash3_32(k, seed) for k in keys]
+            self.assertEqual(batch.tolist(), expected)
+
+    def test_builtin_domains(self):
+        """Built-in tracker list hashes identically"""
+        self.assert_parity(BUILTIN_TRACKER_DOMAINS)
+
+    def test_every_tail_length(self):
+        """Keys of length 0-12 cover every body/tail combination"""
+        self.assert_parity(['abcdefghijkl'[:n] for n in range(13)])
+
+    def test_random_domains_across_chunks(self):
+        """Chunk boundaries do not change the result"""
+        self.assert_parity(random_domains(2000), chunk_size=97)
+
+    def test_non_ascii_and_custom_seeds(self):
+        """UTF-8 encoding and arbitrary seeds match the scalar hash"""
+        keys = ['bücher.de', 'пример.рф', '例え.jp', 'ñ']
+        self.assert_parity(keys, seeds=(0, 1, 0xFFFFFFFF, 42))
+
+    def test_empty_input(self):
+        """Empty key list yields empty arrays"""
+        h1, h2 = murmurhash3_32_many([])
+        self.assertEqual(len(h1), 0)
+        self.assertEqual(len(h2), 0)
+
+
+class TestBloomFilterBulk(unittest.TestCase):
+    """Bulk add_many/has_many against the scalar add/has path"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.domains = sorted(set(BUILTIN_TRACKER_DOMAINS))
+        self.size, self.num_hashes = calculate_optimal_params(len(self.domains))
+
+    def test_add_many_matches_scalar_add(self):
+        """Bulk insertion produces byte-identical output"""
+        scalar = BloomFilterBuilder(self.size, self.num_hashes)
+        for domain in self.domains:
+            scalar.add(domain)
+
+        bulk = BloomFilterBuilder(self.size, self.num_hashes)
+        bulk.add_many(self.domains, chunk_size=16)
+
+        self.assertEqual(bulk.to_bytes(), scalar.to_bytes())
+
+    def test_has_many_matches_scalar_has(self):
+        """Bulk membership mask agrees with has() for members and non-members"""
+        bf = BloomFilterBuilder(self.size, self.num_hashes)
+        bf.add_many(self.domains)
+
+        probes = self.domains + ['.DoubleClick.net'] + random_domains(3000)
+        mask = bf.has_many(probes, chunk_size=256)
+
+        self.assertEqual(mask.dtype, np.bool_)
+        self.assertEqual(mask.tolist(), [bf.has(d) for d in probes])
+        self.assertTrue(mask[:len(self.domains) + 1].all())
+
+    def test_has_many_empty(self):
+        """Empty query returns an empty mask"""
+        bf = BloomFilterBuilder(1024, 3)
+        self.assertEqual(len(bf.has_many([])), 0)
+
+    def test_generators_are_consumed_lazily(self):
+        """Position chunks pull one chunk at a time from a generator"""
+        for bf in (BloomFilterBuilder(self.size, self.num_hashes),
+                   BlockedBloomFilterBuilder(BLOCK_BITS * 8, self.num_hashes)):
+            consumed = []
+
+            def domains():
+                for domain in self.domains:
+                    consumed.append(domain)
+                    yield domain
+
+            chunks = bf._iter_position_chunks(domains(), 10)
+            self.assertEqual(next(chunks).shape, (10, self.num_hashes))
+            self.assertLessEqual(len(consumed), 11)
+
+            bulk = type(bf)(bf.size, bf.num_hashes)
+            bulk.add_many(iter(self.domains), chunk_size=7)
+            bf.add_many(self.domains)
+            self.assertEqual(bulk.to_bytes(), bf.to_bytes())
+
+
+class TestStreamingIngestion(unittest.TestCase):
+    """Generator-based parsing, mmap reading and distinct counting"""
+
+    def test_parse_domain_line(self):
+        """EasyList and plain-list syntax are both understood"""
+        cases = {
+            '||doubleclick.net^': 'doubleclick.net',
+            '||Tracker.Example.com^$third-party': 'tracker.example.com',
+            '||pixel.example.org/collect?id=1': 'pixel.example.org',
+            'stats.example.net/path': 'stats.example.net',
+            '  plain.example.com  ': 'plain.example.com',
+            '# comment.example.com': None,
+            '! Title: EasyPrivacy': None,
+            '[Adblock Plus 2.0]': None,
+            '@@||allowed.example.com^': None,
+            'localhost': None,
+            '': None,
+        }
+        for line, expected in cases.items():
+            self.assertEqual(parse_domain_line(line), expected, line)
+
+    def test_iter_domains_from_file(self):
+        """Memory-mapped reader yields parsed domains in file order"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'list.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('! header\n||a.example.com^\nb.example.com\n\n||a.example.com^')
+            self.assertEqual(list(iter_domains_from_file(path)),
+                             ['a.example.com', 'b.example.com', 'a.example.com'])
+
+            empty = os.path.join(tmp, 'empty.txt')
+            open(empty, 'w').close()
+            self.assertEqual(list(iter_domains_from_file(empty)), [])
+
+    def test_scan_counts_normalized_duplicates_once(self):
+        """Distinct count matches a set of normalized domains"""
+        domains = BUILTIN_TRACKER_DOMAINS + ['.DoubleClick.net', 'HOTJAR.com']
+        total, unique, exact = scan_domain_source(domains, chunk_size=7)
+        self.assertEqual(total, len(domains))
+        self.assertEqual(unique, len({d.lower().lstrip('.') for d in domains}))
+        self.assertTrue(exact)
+
+    def test_hyperloglog_estimate(self):
+        """Past the exact limit the estimate stays within a few percent"""
+        keys = [f'host{i}.tracker{i % 97}.com' for i in range(60000)]
+        counter = DistinctCounter(precision=12, exact_limit=1000)
+        for start in range(0, len(keys), 5000):
+            counter.update(*murmurhash3_32_many(keys[start:start + 5000] * 2))
+        self.assertFalse(counter.exact)
+        self.assertAlmostEqual(counter.count() / len(keys), 1.0, delta=0.05)
+
+    def test_streamed_build_matches_in_memory_build(self):
+        """Chunked unique-key insertion produces the same filter"""
+        domains = BUILTIN_TRACKER_DOMAINS * 3
+        size, num_hashes = calculate_optimal_params(len(set(domains)))
+
+        expected = BloomFilterBuilder(size, num_hashes)
+        expected.add_many(list(set(domains)))
+
+        streamed = BloomFilterBuilder(size, num_hashes)
+        for keys in iter_unique_key_chunks(iter(domains), chunk_size=50):
+            streamed.add_many(keys)
+
+        self.assertEqual(streamed.to_bytes(), expected.to_bytes())
+
+
+class TestShardedBuild(unittest.TestCase):
+    """Multi-process sharded build with OR-merge"""
+
+    def setUp(self):
+        """Write a blocklist with mixed syntax and duplicates"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'list.txt')
+        self.domains = random_domains(400, seed=7)
+        self.domains = [d + '.com' for d in self.domains] * 2
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for i, domain in enumerate(self.domains):
+                f.write(f'||{domain}^\n' if i % 2 else f'{domain}\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_file_shards_cover_each_line_once(self):
+        """Byte-range shards tile the file without losing or repeating lines"""
+        expected = [d.lower() for d in self.domains if parse_domain_line(d)]
+        for workers in (1, 2, 3, 7, 50):
+            shards = make_shards(input_path=self.path, workers=workers)
+            streamed = [d for shard in shards for d in iter_shard(shard)]
+            self.assertEqual(streamed, expected, workers)
+
+    def test_distinct_counter_merge(self):
+        """Merged shard counts equal a single-process scan"""
+        single = scan_shards(make_shards(input_path=self.path, workers=1))
+        for workers in (2, 5):
+            merged = scan_shards(make_shards(input_path=self.path, workers=workers))
+            self.assertEqual(merged, single)
+
+    def test_parallel_build_is_byte_identical(self):
+        """OR-reduced worker shards equal the single-process filter"""
+        _, unique, _ = scan_shards(make_shards(input_path=self.path))
+        size, num_hashes = calculate_optimal_params(unique)
+
+        single, missing_count, _ = build_shards(
+            make_shards(input_path=self.path), size, num_hashes)
+        self.assertEqual(missing_count, 0)
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            parallel, missing_count, _ = build_shards(
+                make_shards(input_path=self.path, workers=4), size, num_hashes,
+                chunk_size=64, executor=executor)
+        self.assertEqual(missing_count, 0)
+        self.assertEqual(parallel.to_bytes(), single.to_bytes())
+
+
+class TestIncrementalUpdate(unittest.TestCase):
+    """Incremental OR-in of additions deltas guided by the manifest"""
+
+    def setUp(self):
+        """Write a filter with generous headroom and its manifest"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, 'tracker_bloom.bin')
+        self.sources = {'builtin': 'abc'}
+        self.domains = sorted(set(BUILTIN_TRACKER_DOMAINS))
+        size, num_hashes = calculate_optimal_params(len(self.domains), 0.0001)
+        bf = BloomFilterBuilder(size, num_hashes)
+        bf.add_many(self.domains)
+        with open(self.output, 'wb') as f:
+            f.write(bf.to_bytes())
+        write_manifest(self.output, bf, len(self.domains), 0.0001, self.sources, {})
+        self.manifest = load_manifest(self.output)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_additions(self, name, domains):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(domains))
+        return path
+
+    def test_from_bytes_round_trip(self):
+        """to_bytes/from_bytes preserve the filter exactly"""
+        with open(self.output, 'rb') as f:
+            data = f.read()
+        self.assertEqual(BloomFilterBuilder.from_bytes(data).to_bytes(), data)
+        with self.assertRaises(ValueError):
+            BloomFilterBuilder.from_bytes(data[:20])
+
+    def test_unchanged_sources(self):
+        """No delta and identical sources means nothing to do"""
+        result = update_filter(self.output, self.manifest, self.sources, {}, 0.001, 1000, {})
+        self.assertEqual(result, 'unchanged')
+
+    def test_changed_sources_without_delta_rebuild(self):
+        """A changed source list without a delta forces a rebuild"""
+        result = update_filter(self.output, self.manifest, {'builtin': 'def'}, {}, 0.001, 1000, {})
+        self.assertIsNone(result)
+
+    def test_small_delta_is_applied_in_place(self):
+        """A small delta is OR-ed in and counted"""
+        path = self.write_additions('add.txt', ['new1.tracker.com', 'doubleclick.net'])
+        bf, item_count = update_filter(self.output, self.manifest, self.sources,
+                                       {path: 'x'}, 0.001, 1000, {})
+        self.assertEqual(item_count, len(self.domains) + 1)
+        self.assertTrue(bf.has_many(self.domains + ['new1.tracker.com']).all())
+
+    def test_large_delta_triggers_rebuild(self):
+        """Projected FP rate above target falls back to a rebuild"""
+        path = self.write_additions('add.txt', [f'n{i}.more.com' for i in range(1000)])
+        result = update_filter(self.output, self.manifest, self.sources,
+                               {path: 'x'}, 0.001, 1000, {})
+        self.assertIsNone(result)
+
+    def test_full_build_leaves_headroom_at_same_fp_rate(self):
+        """A full build at --fp-rate takes later additions in place at that rate"""
+        domains = [f'site{i}.tracker-list.com' for i in range(5000)]
+        bf, item_count = build_filter(make_shards(domains=domains), 0.001, 1000, 1, {}, 'test')
+        with open(self.output, 'wb') as f:
+            f.write(bf.to_bytes())
+        write_manifest(self.output, bf, item_count, 0.001, self.sources, {})
+        manifest = load_manifest(self.output)
+        self.assertEqual(manifest['capacity_headroom'], 1.25)
+
+        additions = [f'new{i}.tracker-list.com' for i in range(500)]
+        path = self.write_additions('add.txt', additions)
+        result = update_filter(self.output, manifest, self.sources, {path: 'x'}, 0.001, 1000, {})
+        self.assertIsInstance(result, tuple)
+        updated, count = result
+        self.assertEqual(count, 5500)
+        self.assertTrue(updated.has_many(domains + additions).all())
+
+        exact, _ = build_filter(make_shards(domains=domains), 0.001, 1000, 1, {}, 'test',
+                                headroom=1.0)
+        self.assertLess(exact.size, bf.size)
+
+    def test_applied_deltas_accumulate(self):
+        """Earlier deltas stay in the manifest so a rebuild replays them"""
+        first = self.write_additions('a.txt', ['a.tracker.com'])
+        second = self.write_additions('b.txt', ['b.tracker.com'])
+        self.manifest['additions'] = {first: file_sha256(first),
+                                      os.path.join(self.tmp.name, 'gone.txt'): 'x'}
+        deltas = accumulated_deltas(self.manifest, 'additions', {second: 'y'})
+        self.assertEqual(deltas, {first: file_sha256(first), second: 'y'})
+        self.assertEqual(accumulated_deltas(None, 'removals', {}), {})
+
+    def test_already_applied_delta_is_skipped(self):
+        """Additions recorded in the manifest are not applied again"""
+        self.manifest['additions'] = {'add.txt': 'x'}
+        result = update_filter(self.output, self.manifest, self.sources,
+                               {'add.txt': 'x'}, 0.001, 1000, {})
+        self.assertEqual(result, 'unchanged')
+
+
+class TestCountingBloomFilter(unittest.TestCase):
+    """4-bit counting filter with bulk increment/decrement"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.domains = sorted(set(BUILTIN_TRACKER_DOMAINS))
+        self.size, self.num_hashes = calculate_optimal_params(len(self.domains))
+
+    def plain_filter(self, domains):
+        bf = BloomFilterBuilder(self.size, self.num_hashes)
+        bf.add_many(domains)
+        return bf
+
+    def test_export_matches_plain_builder(self):
+        """Collapsed counters equal the bit array built directly"""
+        cbf = CountingBloomFilterBuilder(self.size, self.num_hashes)
+        cbf.add_many(self.domains, chunk_size=9)
+        self.assertEqual(cbf.to_bloom().to_bytes(), self.plain_filter(self.domains).to_bytes())
+
+    def test_remove_many_equals_rebuild_without_removed(self):
+        """Removing domains yields the filter a rebuild would produce"""
+        cbf = CountingBloomFilterBuilder(self.size, self.num_hashes)
+        cbf.add_many(self.domains)
+        removed = self.domains[::3]
+        self.assertEqual(cbf.remove_many(removed), len(removed))
+
+        kept = [d for d in self.domains if d not in set(removed)]
+        self.assertEqual(cbf.to_bloom().to_bytes(), self.plain_filter(kept).to_bytes())
+        self.assertTrue(cbf.has_many(kept).all())
+
+    def test_remove_absent_domain_is_ignored(self):
+        """Domains reported absent are not decremented"""
+        cbf = CountingBloomFilterBuilder(self.size, self.num_hashes)
+        cbf.add_many(self.domains)
+        before = cbf.to_bytes()
+        absent = [d for d, hit in zip(random_domains(200), cbf.has_many(random_domains(200)))
+                  if not hit]
+        self.assertEqual(cbf.remove_many(absent), 0)
+        self.assertEqual(cbf.to_bytes(), before)
+
+    def test_counters_saturate(self):
+        """Counters stop at 15 and saturated counters are never decremented"""
+        cbf = CountingBloomFilterBuilder(64, 3)
+        positions = np.arange(64, dtype=np.uint64)
+        cbf._adjust(np.repeat(positions, 20), +1)
+        self.assertTrue((cbf._counts(positions) == 15).all())
+        cbf._adjust(np.repeat(positions, 20), -1)
+        cbf.remove_many(['tracker.example.com'])
+        self.assertTrue((cbf._counts(positions) == 15).all())
+
+    def test_duplicate_removals_decrement_once(self):
+        """A domain listed twice in a removals delta cannot clear other domains"""
+        cbf = CountingBloomFilterBuilder(self.size, self.num_hashes)
+        cbf.add_many(self.domains)
+        removed = self.domains[0]
+        self.assertEqual(cbf.remove_many([removed, '.' + removed.upper()] + [removed] * 3,
+                                         chunk_size=2), 1)
+        self.assertTrue(cbf.has_many(self.domains[1:]).all())
+        self.assertEqual(cbf.to_bloom().to_bytes(), self.plain_filter(self.domains[1:]).to_bytes())
+
+    def test_duplicate_additions_count_once(self):
+        """A domain seen in several chunks of one call is removed by one removal"""
+        cbf = CountingBloomFilterBuilder(self.size, self.num_hashes)
+        self.assertEqual(cbf.add_many(self.domains + self.domains[:5], chunk_size=7),
+                         len(self.domains))
+        self.assertEqual(cbf.remove_many(self.domains[:5]), 5)
+        self.assertFalse(cbf.has_many(self.domains[:5]).any())
+        self.assertTrue(cbf.has_many(self.domains[5:]).all())
+
+    def test_colliding_additions_survive_removals(self):
+        """Domains that tested present when added are not dropped by removals"""
+        old, new = random_domains(600, seed=21)[:300], random_domains(600, seed=21)[300:]
+        old, new = sorted(set(old)), sorted(set(new) - set(old))
+        cbf = CountingBloomFilterBuilder(1500, 3)
+        cbf.add_many(old)
+        collided = cbf.has_many(new)
+        self.assertTrue(collided.any(), 'filter too large for collisions')
+        for start in range(0, len(new), 100):
+            self.assertEqual(cbf.add_many(new[start:start + 100]), len(new[start:start + 100]))
+        cbf.remove_many(old)
+        self.assertTrue(cbf.has_many(new).all())
+        self.assertTrue(cbf.to_bloom().has_many(new).all())
+
+    def test_state_round_trip(self):
+        """Counter state serializes and loads back exactly"""
+        cbf = CountingBloomFilterBuilder(self.size + 1, self.num_hashes)
+        cbf.add_many(self.domains)
+        data = cbf.to_bytes()
+        self.assertEqual(CountingBloomFilterBuilder.from_bytes(data).to_bytes(), data)
+        with self.assertRaises(ValueError):
+            CountingBloomFilterBuilder.from_bytes(b'XXXX' + data[4:])
+
+
+class TestBlockedLayout(unittest.TestCase):
+    """Cache-line blocked layout and versioned header"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.domains = sorted(set(BUILTIN_TRACKER_DOMAINS))
+        self.size, self.num_hashes = calculate_blocked_params(len(self.domains))
+
+    def test_positions_stay_in_one_block(self):
+        """All k bits of a key fall into one 512-bit block and are distinct"""
+        positions = blocked_hash_positions_many(random_domains(500), 10, 37)
+        blocks = positions // BLOCK_BITS
+        self.assertTrue((blocks == blocks[:, :1]).all())
+        self.assertTrue((blocks < 37).all())
+        for row in positions:
+            self.assertEqual(len(set(row.tolist())), 10)
+
+    def test_blocked_membership(self):
+        """Bulk and scalar paths agree and members are always found"""
+        bf = BlockedBloomFilterBuilder(self.size, self.num_hashes)
+        bf.add_many(self.domains)
+        probes = self.domains + random_domains(500)
+        mask = bf.has_many(probes)
+        self.assertTrue(mask[:len(self.domains)].all())
+        self.assertEqual(mask.tolist(), [bf.has(d) for d in probes])
+
+    def test_size_must_be_whole_blocks(self):
+        """Blocked filters reject sizes that are not whole blocks"""
+        with self.assertRaises(ValueError):
+            BlockedBloomFilterBuilder(BLOCK_BITS + 1, 3)
+
+    def test_reader_handles_both_formats(self):
+        """read_filter loads the legacy header and the versioned header"""
+        classic = BloomFilterBuilder(1884, 10)
+        classic.add_many(self.domains)
+        legacy = classic.to_bytes()
+        self.assertEqual(legacy[:8], struct.pack('<II', 1884, 10))
+        self.assertEqual(read_filter(legacy).to_bytes(), legacy)
+
+        blocked = BlockedBloomFilterBuilder(self.size, self.num_hashes)
+        blocked.add_many(self.domains)
+        data = blocked.to_bytes()
+        self.assertEqual(data[:4], b'VBLF')
+        loaded = read_filter(data)
+        self.assertIsInstance(loaded, BlockedBloomFilterBuilder)
+        self.assertEqual(loaded.to_bytes(), data)
+        self.assertTrue(loaded.has_many(self.domains).all())
+
+    def test_reader_rejects_unknown_version(self):
+        """Unknown versions are refused rather than misread"""
+        data = bytearray(BlockedBloomFilterBuilder(self.size, self.num_hashes).to_bytes())
+        data[4] = 99
+        with self.assertRaises(ValueError):
+            read_filter(bytes(data))
+
+
+class TestBinaryFuseFilter(unittest.TestCase):
+    """Static binary fuse filter alternative"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.domains = [f'host{i}.tracker{i % 31}.com' for i in range(5000)]
+        self.negatives = [f'site{i}.example{i % 17}.org' for i in range(50000)]
+
+    def test_no_false_negatives(self):
+        """Every inserted domain is reported present for both fingerprint sizes"""
+        for bits in (8, 16):
+            fuse = BinaryFuseFilterBuilder(len(self.domains), bits).add_many(self.domains)
+            self.assertTrue(fuse.has_many(self.domains).all(), bits)
+            self.assertTrue(fuse.has('.HOST7.tracker7.com'))
+
+    def test_false_positive_rate(self):
+        """Measured FP rate is close to 2^-bits"""
+        fuse8 = BinaryFuseFilterBuilder(len(self.domains), 8).add_many(self.domains)
+        self.assertLess(fuse8.has_many(self.negatives).mean(), 2.0 / 256)
+        fuse16 = BinaryFuseFilterBuilder(len(self.domains), 16).add_many(self.domains)
+        self.assertLess(fuse16.has_many(self.negatives).mean(), 10.0 / 65536)
+
+    def test_space_per_key(self):
+        """Slots per key shrink towards the 1.125x capacity factor"""
+        small = BinaryFuseFilterBuilder(len(self.domains), 8)
+        self.assertLess(len(small.fingerprints) / len(self.domains), 1.35)
+        large = BinaryFuseFilterBuilder(1000000, 8)
+        self.assertLess(len(large.fingerprints) / 1000000, 1.14)
+
+    def test_duplicates_and_small_inputs(self):
+        """Duplicates are collapsed and tiny inputs still build"""
+        fuse = BinaryFuseFilterBuilder(3, 8).add_many(['a.com', 'A.com', '.a.com', 'b.com'])
+        self.assertTrue(fuse.has_many(['a.com', 'b.com']).all())
+        self.assertEqual(len(BinaryFuseFilterBuilder(0, 8).add_many([]).fingerprints) % 4, 0)
+
+    def test_file_round_trip_and_verifier(self):
+        """Tagged format loads back and the verifier finds every domain"""
+        fuse = BinaryFuseFilterBuilder(len(self.domains), 16).add_many(self.domains)
+        data = fuse.to_bytes()
+        self.assertEqual(data[:4], b'VBFF')
+        self.assertEqual(BinaryFuseFilterBuilder.from_bytes(data).to_bytes(), data)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tracker_fuse.bin')
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.assertEqual(verify_fuse_filter(path, self.domains), 0)
+        with self.assertRaises(ValueError):
+            BinaryFuseFilterBuilder.from_bytes(b'VBLF' + data[4:])
+
+
+class TestBloomFilterView(unittest.TestCase):
+    """Memory-mapped read-only view over filter files"""
+
+    def setUp(self):
+        """Write one filter per layout"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.domains = sorted(set(BUILTIN_TRACKER_DOMAINS))
+        self.probes = self.domains + random_domains(2000)
+        self.filters = {}
+        for name, cls, params in (
+                ('classic', BloomFilterBuilder, calculate_optimal_params(len(self.domains))),
+                ('blocked', BlockedBloomFilterBuilder, calculate_blocked_params(len(self.domains)))):
+            bf = cls(*params)
+            bf.add_many(self.domains)
+            path = os.path.join(self.tmp.name, f'{name}.bin')
+            with open(path, 'wb') as f:
+                f.write(bf.to_bytes())
+            self.filters[name] = (bf, path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_view_matches_builder(self):
+        """Mapped lookups agree with the in-memory builder for both layouts"""
+        for name, (bf, path) in self.filters.items():
+            with BloomFilterView(path) as view:
+                self.assertEqual(view.size, bf.size)
+                self.assertEqual(view.num_hashes, bf.num_hashes)
+                self.assertEqual(view.has_many(self.probes).tolist(),
+                                 bf.has_many(self.probes).tolist(), name)
+                self.assertIn('doubleclick.net', view)
+
+    def test_view_is_zero_copy_and_read_only(self):
+        """Bits are a read-only view over the mapping, not a copy"""
+        _, path = self.filters['classic']
+        view = BloomFilterView(path)
+        self.assertFalse(view.bit_array.flags.writeable)
+        self.assertFalse(view.bit_array.flags.owndata)
+        view.close()
+        view.close()
+        self.assertIsNone(view.bit_array)
+
+    def test_rejects_truncated_and_empty_files(self):
+        """Truncated or empty files raise ValueError"""
+        bf, path = self.filters['classic']
+        truncated = os.path.join(self.tmp.name, 'truncated.bin')
+        with open(truncated, 'wb') as f:
+            f.write(bf.to_bytes()[:20])
+        with self.assertRaises(ValueError):
+            BloomFilterView(truncated)
+        empty = os.path.join(self.tmp.name, 'empty.bin')
+        open(empty, 'wb').close()
+        with self.assertRaises(ValueError):
+            BloomFilterView(empty)
+
+
+class TestFalsePositiveEvaluation(unittest.TestCase):
+    """Batched FP evaluation, confidence intervals and budgets"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.domains = sorted(set(BUILTIN_TRACKER_DOMAINS))
+        self.bf = BloomFilterBuilder(*calculate_optimal_params(len(self.domains)))
+        self.bf.add_many(self.domains)
+
+    def test_wilson_interval(self):
+        """Interval contains the estimate and matches a known value"""
+        low, high = wilson_interval(10, 1000)
+        self.assertLess(low, 0.01)
+        self.assertGreater(high, 0.01)
+        self.assertAlmostEqual(low, 0.00544, places=4)
+        self.assertAlmostEqual(high, 0.01832, places=4)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+        self.assertEqual(wilson_interval(0, 100)[0], 0.0)
+
+    def test_negative_generator(self):
+        """Generated negatives are deterministic, domain-shaped and not trackers"""
+        first = list(generate_negative_domains(1000, seed=3))
+        self.assertEqual(first, list(generate_negative_domains(1000, seed=3)))
+        self.assertTrue(all(parse_domain_line(d) == d for d in first))
+        self.assertFalse(set(first) & set(self.domains))
+
+    def test_report(self):
+        """Report counts every probe and stays near the analytic rate"""
+        report = evaluate_false_positive_rate(self.bf, generate_negative_domains(200000),
+                                              0.001, chunk_size=50000)
+        self.assertEqual(report['probes'], 200000)
+        self.assertTrue(report['passed'])
+        self.assertLessEqual(report['confidence']['low'], report['fp_rate'])
+        self.assertGreaterEqual(report['confidence']['high'], report['fp_rate'])
+        self.assertLess(report['fp_rate'], 0.005)
+        self.assertGreater(report['analytic_fp_rate'], 0)
+        self.assertEqual(report['size_bytes'], len(self.bf.bit_array))
+
+    def test_budgets_fail_report(self):
+        """Size, FP and throughput budgets are enforced"""
+        report = evaluate_false_positive_rate(
+            self.bf, generate_negative_domains(50000), 0.001,
+            max_fp_rate=0.00001, max_size_bytes=10, min_probes_per_sec=1e12)
+        self.assertFalse(report['passed'])
+        self.assertEqual(len(report['failures']), 3)
+
+    def test_fuse_analytic_rate(self):
+        """Fuse filters report 2^-bits as their analytic rate"""
+        fuse = BinaryFuseFilterBuilder(len(self.domains), 8).add_many(self.domains)
+        report = evaluate_false_positive_rate(fuse, generate_negative_domains(20000), 0.004)
+        self.assertEqual(report['analytic_fp_rate'], 1 / 256)
+        self.assertEqual(report['size_bytes'], len(fuse.fingerprints))
+
+
+if __name__ == '__main__':
+    unittest.main()
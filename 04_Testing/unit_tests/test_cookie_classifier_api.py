@@ -0,0 +1,1038 @@
+"""
+Unit tests for the Cookie Classification API
+"""
+
+import unittest
+import importlib.util
+import json
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+
+# Add deployment directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '../../03_AI_ML_Pipeline/deployment')))
+
+import cookie_classifier_api as api
+
+
+def legacy_category(name, domain, categories=None):
+    """First-match category of the original nested keyword loop"""
+    for category, data in (categories or api.COOKIE_CATEGORIES).items():
+        for keyword in data['keywords']:
+            if keyword in name or keyword in domain:
+                return category
+    return None
+
+
+def random_cookie_texts(count, seed=99):
+    """Names/domains stitched from keyword fragments and noise"""
+    rng = random.Random(seed)
+    fragments = [k for data in api.COOKIE_CATEGORIES.values() for k in data['keywords']]
+    fragments += ['x', 'id', '_', '.com', 'lo', 'ad', 'sess', 'f', 'b', 'g', 'a']
+    return [(''.join(rng.choice(fragments) for _ in range(rng.randint(0, 4))),
+             ''.join(rng.choice(fragments) for _ in range(rng.randint(0, 3))))
+            for _ in range(count)]
+
+
+def has_modules(*names):
+    """Whether optional dependencies are importable"""
+    return all(importlib.util.find_spec(name) for name in names)
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    """Compiled keyword matcher keeps first-match category priority"""
+
+    def test_matches_legacy_loop(self):
+        """Random keyword mashups classify exactly like the nested loop"""
+        for name, domain in random_cookie_texts(5000):
+            self.assertEqual(api.keyword_matcher.match(name, domain),
+                             legacy_category(name, domain), (name, domain))
+
+    def test_overlapping_keywords_use_category_priority(self):
+        """'loads' contains 'load' (performance) and 'ads' (advertising)"""
+        self.assertEqual(api.keyword_matcher.match('loads', ''), 'advertising')
+        self.assertEqual(api.keyword_matcher.match('fb_session', ''), 'necessary')
+        self.assertIsNone(api.keyword_matcher.match('xyz', 'example.com'))
+
+    def test_custom_tables(self):
+        """Matcher follows the order of the tables it is built from"""
+        tables = {
+            'b': {'keywords': ['abc'], 'description': ''},
+            'a': {'keywords': ['bc', 'a.b'], 'description': ''},
+            'empty': {'keywords': [], 'description': ''},
+        }
+        matcher = api.KeywordMatcher(tables)
+        for name in ['abc', 'xbc', 'a.b', 'aXb', 'zabcz']:
+            self.assertEqual(matcher.match(name, ''), legacy_category(name, '', tables))
+
+    def test_rule_based_classification(self):
+        """Result dictionaries are unchanged"""
+        self.assertEqual(api.rule_based_classification({'name': '_ga', 'domain': '.x.com'}), {
+            'category': 'analytics',
+            'confidence': 0.85,
+            'description': api.COOKIE_CATEGORIES['analytics']['description'],
+            'method': 'rule-based'
+        })
+        self.assertEqual(api.rule_based_classification({'name': 'zz', 'domain': 'q.com'})['method'],
+                         'rule-based-default')
+
+
+class TestClassificationCache(unittest.TestCase):
+    """LRU/TTL cache in front of classification and risk scoring"""
+
+    def test_lru_eviction(self):
+        """Least recently used entry goes first once full"""
+        cache = api.ClassificationCache(maxsize=2, ttl=0)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+
+    def test_ttl_expiry(self):
+        """Entries older than the TTL are misses"""
+        cache = api.ClassificationCache(maxsize=10, ttl=0.01)
+        cache.put('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_key_normalization(self):
+        """Fields classification ignores do not split the cache"""
+        base = {'name': '_GA', 'domain': '.Example.com', 'path': '/', 'secure': True}
+        same = dict(base, name='_ga', value='abc', secure=1, httpOnly=False)
+        self.assertEqual(api.cookie_cache_key(base), api.cookie_cache_key(same))
+        self.assertNotEqual(api.cookie_cache_key(base),
+                            api.cookie_cache_key(dict(base, sameSite='lax')))
+
+    def test_cached_results_match_uncached(self):
+        """Cache hits return what a fresh classification would"""
+        api.classification_cache.invalidate()
+        cookies = [{'name': name, 'domain': domain, 'httpOnly': i % 2 == 0,
+                    'sameSite': ['lax', 'none', None][i % 3]}
+                   for i, (name, domain) in enumerate(random_cookie_texts(300))]
+        for _ in range(2):
+            for cookie in cookies:
+                expected = api.ml_based_classification(cookie)
+                result, risk = api.classify_with_risk(cookie)
+                self.assertEqual(result, expected)
+                self.assertEqual(risk, api.calculate_risk_score(cookie, expected['category']))
+        self.assertGreater(api.classification_cache.stats()['hits'], 0)
+
+    def test_refresh_invalidates_on_table_change(self):
+        """Editing the category tables drops cached results"""
+        cookie = {'name': 'veil_probe_cookie', 'domain': 'example.com'}
+        api.refresh_classifier()
+        self.assertEqual(api.classify_with_risk(cookie)[0]['category'], 'functional')
+        self.assertFalse(api.refresh_classifier())
+        api.COOKIE_CATEGORIES['advertising']['keywords'].append('veil_probe')
+        try:
+            self.assertTrue(api.refresh_classifier())
+            self.assertEqual(api.classify_with_risk(cookie)[0]['category'], 'advertising')
+        finally:
+            api.COOKIE_CATEGORIES['advertising']['keywords'].remove('veil_probe')
+            api.refresh_classifier()
+        self.assertEqual(api.classify_with_risk(cookie)[0]['category'], 'functional')
+
+    def test_health_reports_cache(self):
+        """/health exposes hit-rate metrics"""
+        client = api.app.test_client()
+        client.post('/classify', json={'name': '_gid', 'domain': '.example.com'})
+        client.post('/classify', json={'name': '_gid', 'domain': '.example.com'})
+        cache = client.get('/health').get_json()['cache']
+        self.assertIn('hit_rate', cache)
+        self.assertGreaterEqual(cache['hits'], 1)
+
+
+class TestBatchedInference(unittest.TestCase):
+    """Local model batching and rule fallback"""
+
+    def setUp(self):
+        api.classification_cache.invalidate()
+
+    def test_fallback_without_model(self):
+        """Missing checkpoint leaves the rule engine in charge"""
+        engine = api.LocalInferenceEngine('/nonexistent/veil-model')
+        self.assertFalse(engine.load())
+        self.assertIsNotNone(engine.load_error)
+        if not api.inference_engine.available:
+            result = api.ml_based_classification({'name': '_ga', 'domain': '.x.com'})
+            self.assertEqual(result['category'], 'analytics')
+            self.assertEqual(result['method'], 'hybrid-ml-fallback')
+            tracked = api.ml_based_classification({'name': 'uid', 'domain': '.eu.criteo.com'})
+            self.assertEqual(tracked['method'], 'hybrid-ml-fallback:domain-index')
+
+    def test_batch_matches_single(self):
+        """Batch path returns per-cookie results in input order"""
+        cookies = [{'name': name, 'domain': domain, 'secure': i % 2 == 0}
+                   for i, (name, domain) in enumerate(random_cookie_texts(200, seed=5))]
+        cookies += cookies[:20]
+        batch = api.classify_many_with_risk(cookies)
+        self.assertEqual(len(batch), len(cookies))
+        api.classification_cache.invalidate()
+        for cookie, result in zip(cookies, batch):
+            self.assertEqual(result, api.classify_with_risk(cookie))
+
+    def test_classify_batch_route(self):
+        """/classify-batch keeps its response shape"""
+        client = api.app.test_client()
+        response = client.post('/classify-batch', json={'cookies': [
+            {'name': '_ga', 'domain': '.example.com'},
+            {'name': 'IDE', 'domain': '.doubleclick.net'},
+            {'name': '_ga', 'domain': '.example.com'},
+        ]}).get_json()
+        self.assertEqual([r['cookie_name'] for r in response['results']], ['_ga', 'IDE', '_ga'])
+        self.assertEqual(response['statistics']['total_cookies'], 3)
+        self.assertEqual(response['results'][0], response['results'][2])
+
+    @unittest.skipUnless(has_modules('transformers', 'torch'),
+                         'transformers/torch not installed')
+    def test_local_model_batches(self):
+        """A tiny checkpoint with category labels runs in padded batches"""
+        import tempfile
+        from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+        labels = list(api.COOKIE_CATEGORIES)
+        with tempfile.TemporaryDirectory() as model_dir:
+            vocab = os.path.join(model_dir, 'vocab.txt')
+            with open(vocab, 'w') as f:
+                f.write('\n'.join(['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]',
+                                   'cookie', 'name', 'domain', 'path', ':', '.', '_', 'ga']))
+            BertTokenizerFast(vocab_file=vocab).save_pretrained(model_dir)
+            config = BertConfig(vocab_size=13, hidden_size=16, num_hidden_layers=1,
+                                num_attention_heads=2, intermediate_size=32,
+                                num_labels=len(labels), id2label=dict(enumerate(labels)))
+            BertForSequenceClassification(config).save_pretrained(model_dir)
+
+            engine = api.LocalInferenceEngine(model_dir, max_batch_size=4, max_seq_length=16)
+            self.assertTrue(engine.load(), engine.load_error)
+            texts = [api.extract_cookie_features({'name': n, 'domain': d})
+                     for n, d in random_cookie_texts(10)]
+            batched = engine.predict(texts)
+            self.assertEqual(len(batched), len(texts))
+            for text, (category, confidence) in zip(texts, batched):
+                single_category, single_confidence = engine.predict([text])[0]
+                self.assertIn(category, labels)
+                self.assertEqual(category, single_category)
+                self.assertAlmostEqual(confidence, single_confidence, places=3)
+
+
+class TestOnnxBackend(unittest.TestCase):
+    """ONNX Runtime backend selection and batched inference"""
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            api.create_inference_engine('tensorrt')
+
+    def test_backend_selection(self):
+        self.assertIsInstance(api.create_inference_engine('onnx'), api.OnnxInferenceEngine)
+        self.assertEqual(api.create_inference_engine('transformers').backend, 'transformers')
+
+    def test_missing_export_falls_back(self):
+        engine = api.OnnxInferenceEngine('/nonexistent/veil-onnx')
+        self.assertFalse(engine.load())
+        self.assertIsNone(engine.model_id)
+
+    @unittest.skipUnless(has_modules('onnx', 'onnxruntime', 'transformers'),
+                         'onnx/onnxruntime/transformers not installed')
+    def test_onnx_engine_batches(self):
+        """A bag-of-words graph keyed on category words classifies in batches"""
+        import tempfile
+        import numpy as np
+        import onnx
+        from onnx import TensorProto, helper, numpy_helper
+        from transformers import BertConfig, BertTokenizerFast
+
+        labels = list(api.COOKIE_CATEGORIES)
+        # One vocabulary word per category ('social_media' -> 'media')
+        keywords = [label.split('_')[-1] for label in labels]
+        words = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', 'cookie', 'name', 'domain',
+                 'path', ':', '.', '_'] + keywords
+        embedding = np.zeros((len(words), len(labels)), dtype=np.float32)
+        for i, keyword in enumerate(keywords):
+            embedding[words.index(keyword), i] = 5.0
+
+        graph = helper.make_graph(
+            [
+                helper.make_node('Gather', ['embedding', 'input_ids'], ['vectors']),
+                helper.make_node('Cast', ['attention_mask'], ['mask'], to=TensorProto.FLOAT),
+                helper.make_node('Unsqueeze', ['mask', 'axis2'], ['mask3']),
+                helper.make_node('Mul', ['vectors', 'mask3'], ['masked']),
+                helper.make_node('ReduceSum', ['masked', 'axis1'], ['logits'], keepdims=0),
+            ],
+            'bag_of_words',
+            [helper.make_tensor_value_info('input_ids', TensorProto.INT64, ['batch', 'sequence']),
+             helper.make_tensor_value_info('attention_mask', TensorProto.INT64, ['batch', 'sequence'])],
+            [helper.make_tensor_value_info('logits', TensorProto.FLOAT, ['batch', len(labels)])],
+            initializer=[numpy_helper.from_array(embedding, 'embedding'),
+                         numpy_helper.from_array(np.array([2], dtype=np.int64), 'axis2'),
+                         numpy_helper.from_array(np.array([1], dtype=np.int64), 'axis1')],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)])
+        model.ir_version = 8
+
+        with tempfile.TemporaryDirectory() as model_dir:
+            vocab = os.path.join(model_dir, 'vocab.txt')
+            with open(vocab, 'w') as f:
+                f.write('\n'.join(words))
+            BertTokenizerFast(vocab_file=vocab).save_pretrained(model_dir)
+            BertConfig(num_labels=len(labels), id2label=dict(enumerate(labels))).save_pretrained(model_dir)
+            onnx.save(model, os.path.join(model_dir, 'model.onnx'))
+
+            engine = api.OnnxInferenceEngine(model_dir, max_batch_size=3, num_threads=1)
+            self.assertTrue(engine.load(), engine.load_error)
+            self.assertTrue(engine.model_id.endswith('model.onnx'))
+
+            texts = [f'cookie name : {keyword}' for keyword in keywords] + ['cookie name : x analytics']
+            predictions = engine.predict(texts)
+            self.assertEqual([category for category, _ in predictions], labels + ['analytics'])
+            for text, prediction in zip(texts, predictions):
+                self.assertEqual(engine.predict([text]), [prediction])
+
+
+class TestMicroBatcher(unittest.TestCase):
+    """Concurrent /classify requests share model batches"""
+
+    def test_concurrent_requests_coalesce(self):
+        """Submissions inside the wait window land in one batch"""
+        api.classification_cache.invalidate()
+        batcher = api.MicroBatcher(max_batch_size=64, max_wait_ms=200)
+        cookies = [{'name': name, 'domain': domain}
+                   for name, domain in random_cookie_texts(40, seed=21)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = list(pool.map(batcher.submit, cookies))
+        results = [future.result(timeout=10) for future in futures]
+
+        stats = batcher.stats()
+        self.assertEqual(stats['submitted'], 40)
+        self.assertLess(stats['batches'], 40)
+        self.assertEqual(stats['batch_size']['count'], stats['batches'])
+        self.assertEqual(stats['latency_ms']['count'], 40)
+        self.assertEqual(stats['queue_depth'], 0)
+
+        api.classification_cache.invalidate()
+        for cookie, result in zip(cookies, results):
+            self.assertEqual(result, api.classify_with_risk(cookie))
+
+    def test_max_batch_size(self):
+        """Batches never exceed the configured size"""
+        batcher = api.MicroBatcher(max_batch_size=3, max_wait_ms=100)
+        futures = [batcher.submit({'name': f'c{i}', 'domain': 'example.com'}) for i in range(10)]
+        for future in futures:
+            future.result(timeout=10)
+        buckets = batcher.stats()['batch_size']['buckets']
+        self.assertEqual(buckets['4'], buckets['+Inf'])
+        self.assertGreaterEqual(batcher.stats()['batches'], 4)
+
+    def test_errors_reach_callers(self):
+        """A failing batch fails each waiting request"""
+        batcher = api.MicroBatcher(max_batch_size=4, max_wait_ms=1)
+        future = batcher.submit({'name': None, 'domain': 'example.com', 'path': 3})
+        with self.assertRaises(AttributeError):
+            future.result(timeout=10)
+        ok = batcher.submit({'name': '_ga', 'domain': '.example.com'})
+        self.assertEqual(ok.result(timeout=10)[0]['category'], 'analytics')
+
+    def test_cancelled_requests_do_not_stop_worker(self):
+        """A caller that gives up leaves the rest of its batch unaffected"""
+        api.classification_cache.invalidate()
+        batcher = api.MicroBatcher(max_batch_size=8, max_wait_ms=200)
+        cancelled = batcher.submit({'name': 'c0', 'domain': 'example.com'})
+        waiting = batcher.submit({'name': '_ga', 'domain': '.example.com'})
+        self.assertTrue(cancelled.cancel())
+        self.assertEqual(waiting.result(timeout=10)[0]['category'], 'analytics')
+        self.assertTrue(batcher._worker.is_alive())
+        later = batcher.submit({'name': 'fr', 'domain': '.facebook.com'})
+        self.assertEqual(later.result(timeout=10)[0]['category'], 'advertising')
+
+    def test_histogram(self):
+        """Buckets are cumulative with a +Inf total"""
+        histogram = api.Histogram([1, 5])
+        for value in [0.5, 1, 3, 10]:
+            histogram.observe(value)
+        self.assertEqual(histogram.snapshot(),
+                         {'buckets': {'1': 2, '5': 3, '+Inf': 4}, 'count': 4, 'sum': 14.5})
+
+    def test_classify_route_reports_batching(self):
+        """/classify goes through the batcher and /health shows it"""
+        api.classification_cache.invalidate()
+        client = api.app.test_client()
+        response = client.post('/classify', json={'name': 'fr', 'domain': '.facebook.com'})
+        self.assertEqual(response.status_code, 200)
+        batching = client.get('/health').get_json()['micro_batching']
+        if api.micro_batching_active():
+            self.assertGreaterEqual(batching['submitted'], 1)
+            self.assertIn('queue_depth', batching)
+
+    def test_rules_only_bypasses_batcher(self):
+        """Without a loaded model /classify misses skip the batch queue"""
+        if api.micro_batcher is None or api.inference_engine.available:
+            self.skipTest('needs micro-batching on and no local model')
+        api.classification_cache.invalidate()
+        submitted = api.micro_batcher.stats()['submitted']
+        result = api.classify_single({'name': '_ga', 'domain': '.example.com'})
+        self.assertEqual(result[0]['category'], 'analytics')
+        self.assertEqual(api.micro_batcher.stats()['submitted'], submitted)
+
+
+@unittest.skipUnless(has_modules('starlette', 'httpx'), 'starlette/httpx not installed')
+class TestAsgiApp(unittest.TestCase):
+    """ASGI app serves the same contract as the Flask app"""
+
+    @classmethod
+    def setUpClass(cls):
+        from starlette.testclient import TestClient
+        import cookie_classifier_asgi
+
+        cls.asgi = cookie_classifier_asgi
+        cls.client = TestClient(cookie_classifier_asgi.app)
+        cls.flask_client = api.app.test_client()
+
+    def test_same_responses_as_flask(self):
+        """/classify, /classify-batch and /categories match the Flask bodies"""
+        cookie = {'name': '_ga', 'domain': '.example.com', 'secure': True}
+        batch = {'cookies': [cookie, {'name': 'IDE', 'domain': '.doubleclick.net'}]}
+        self.assertEqual(self.client.post('/classify', json=cookie).json(),
+                         self.flask_client.post('/classify', json=cookie).get_json())
+        self.assertEqual(self.client.post('/classify-batch', json=batch).json(),
+                         self.flask_client.post('/classify-batch', json=batch).get_json())
+        self.assertEqual(self.client.get('/categories').json(),
+                         self.flask_client.get('/categories').get_json())
+
+    def test_health_reports_executor(self):
+        health = self.client.get('/health').json()
+        self.assertEqual(health['status'], 'healthy')
+        self.assertEqual(health['asgi']['inference_workers'], self.asgi.ASGI_INFERENCE_WORKERS)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.post('/classify', json={'domain': 'x.com'}).status_code, 400)
+        self.assertEqual(self.client.post('/classify-batch', json={'cookies': []}).status_code, 400)
+
+    def test_concurrent_requests(self):
+        """Parallel clients all get answers through the bounded executor"""
+        cookies = [{'name': name, 'domain': domain}
+                   for name, domain in random_cookie_texts(32, seed=8)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(lambda c: self.client.post('/classify', json=c), cookies))
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        self.assertEqual([r.json()['cookie_name'] for r in responses],
+                         [c['name'] for c in cookies])
+
+    def test_metrics_endpoint(self):
+        self.client.post('/classify-batch', json={'cookies': [{'name': '_ga', 'domain': '.x.com'}]})
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('cookie_api_request_duration_ms_count{endpoint="/classify-batch"}', response.text)
+        self.assertIn('cookie_api_responses_total{endpoint="/classify-batch",status="200"}', response.text)
+
+
+class TestClassifyStream(unittest.TestCase):
+    """NDJSON streaming classification"""
+
+    def setUp(self):
+        self.cookies = [{'name': name, 'domain': domain}
+                        for name, domain in random_cookie_texts(50, seed=17) if name]
+        lines = [json.dumps(cookie) for cookie in self.cookies]
+        lines[3:3] = ['', 'not json', json.dumps({'domain': 'x.com'})]
+        self.body = '\n'.join(lines) + '\n'
+
+    def check_lines(self, lines):
+        expected = json.loads(api.json_codec.dumps(
+            api.batch_response(self.cookies, api.classify_many_with_risk(self.cookies))))
+        results = [line for line in lines[:-1] if 'error' not in line]
+        errors = [line for line in lines[:-1] if 'error' in line]
+        self.assertEqual(results, expected['results'])
+        self.assertEqual(errors, [{'line': 5, 'error': 'Invalid JSON'},
+                                  {'line': 6, 'error': 'Invalid cookie data'}])
+        statistics = lines[-1]['statistics']
+        self.assertEqual(statistics['errors'], 2)
+        del statistics['errors']
+        self.assertEqual(statistics['total_cookies'], expected['statistics']['total_cookies'])
+        self.assertEqual(statistics['by_category'], expected['statistics']['by_category'])
+        self.assertAlmostEqual(statistics['average_risk_score'],
+                               expected['statistics']['average_risk_score'])
+
+    def test_generator_matches_batch(self):
+        """Small chunks give the same results and statistics as /classify-batch"""
+        lines = api.classify_stream(self.body.splitlines(keepends=True), chunk_size=7)
+        self.check_lines([json.loads(line) for line in lines])
+
+    def test_empty_stream(self):
+        lines = [json.loads(line) for line in api.classify_stream([])]
+        self.assertEqual(lines, [{'statistics': {'total_cookies': 0, 'by_category': {},
+                                                 'average_risk_score': 0, 'errors': 0}}])
+
+    def test_flask_route(self):
+        response = api.app.test_client().post('/classify-stream', data=self.body,
+                                              content_type='application/x-ndjson')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.check_lines([json.loads(line) for line in response.get_data(as_text=True).splitlines()])
+
+    @unittest.skipUnless(has_modules('starlette', 'httpx'), 'starlette/httpx not installed')
+    def test_asgi_route(self):
+        from starlette.testclient import TestClient
+        import cookie_classifier_asgi
+
+        response = TestClient(cookie_classifier_asgi.app).post(
+            '/classify-stream', content=self.body, headers={'content-type': 'application/x-ndjson'})
+        self.check_lines([json.loads(line) for line in response.text.splitlines()])
+
+
+class TestJsonCodec(unittest.TestCase):
+    """Pluggable JSON codec, response structs and up-front validation"""
+
+    def test_codecs_agree(self):
+        """Every installed codec serializes the response structs identically"""
+        cookies = [{'name': name, 'domain': domain}
+                   for name, domain in random_cookie_texts(30, seed=3)]
+        response = api.batch_response(cookies, api.classify_many_with_risk(cookies))
+        expected = json.loads(api.JsonCodec().dumps(response))
+        self.assertEqual(len(expected['results']), 30)
+        self.assertEqual(expected['statistics']['total_cookies'], 30)
+        for name in api.JSON_CODECS:
+            codec = api.create_json_codec(name)
+            self.assertEqual(codec.loads(codec.dumps(response)), expected, codec.name)
+            with self.assertRaises(ValueError):
+                codec.loads(b'{"name": ')
+
+    def test_codec_selection(self):
+        with self.assertRaises(ValueError):
+            api.create_json_codec('yaml')
+
+        class Missing(api.JsonCodec):
+            def __init__(self):
+                raise ImportError('not installed')
+
+        with mock.patch.dict(api.JSON_CODECS, {'orjson': Missing, 'msgspec': Missing}):
+            self.assertEqual(api.create_json_codec('orjson').name, 'json')
+            self.assertEqual(api.create_json_codec('auto').name, 'json')
+
+    def test_validate_cookies(self):
+        """All malformed cookies are reported from one pass"""
+        cookies = [{'name': 'a'}, 'x', {'domain': 'y.com'}, {'name': 'b', 'path': 3},
+                   {'name': 'c', 'domain': None}]
+        self.assertEqual(api.validate_cookies(cookies), [
+            {'index': 1, 'error': 'cookie must be an object'},
+            {'index': 2, 'error': "'name' must be a string"},
+            {'index': 3, 'error': "'path' must be a string"},
+            {'index': 4, 'error': "'domain' must be a string"},
+        ])
+        self.assertEqual(api.validate_cookies({'name': 'a'})[0]['index'], None)
+
+    def test_routes_reject_malformed_input(self):
+        client = api.app.test_client()
+        response = client.post('/classify-batch', json={'cookies': [{'name': '_ga'}, {'name': 1}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['invalid'], [{'index': 1, 'error': "'name' must be a string"}])
+        response = client.post('/classify', data='{not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {'error': 'Invalid JSON'})
+        self.assertEqual(client.post('/classify-batch', json=[1]).status_code, 400)
+
+
+class TestBatchAggregation(unittest.TestCase):
+    """Single-pass columnar statistics and stats_only responses"""
+
+    def setUp(self):
+        self.cookies = [{'name': name, 'domain': domain, 'secure': i % 3 == 0}
+                        for i, (name, domain) in enumerate(random_cookie_texts(500, seed=11))]
+        self.classified = api.classify_many_with_risk(self.cookies)
+
+    def test_statistics_match_three_pass_loop(self):
+        """by_category (first-seen order) and average equal the original loops"""
+        statistics = api.batch_response(self.cookies, self.classified).statistics
+        by_category = {}
+        for classification, _ in self.classified:
+            by_category[classification['category']] = by_category.get(classification['category'], 0) + 1
+        self.assertEqual(statistics.total_cookies, len(self.cookies))
+        self.assertEqual(list(statistics.by_category.items()), list(by_category.items()))
+        self.assertEqual(statistics.average_risk_score,
+                         sum(risk for _, risk in self.classified) / len(self.classified))
+        self.assertIsInstance(statistics.by_category[self.classified[0][0]['category']], int)
+
+    def test_stats_only(self):
+        full = api.batch_response(self.cookies, self.classified)
+        stats_only = api.batch_response(self.cookies, self.classified, stats_only=True)
+        self.assertIsInstance(stats_only, api.BatchStatisticsResponse)
+        self.assertEqual(stats_only.statistics, full.statistics)
+        self.assertEqual(api.batch_response([], [], stats_only=True).statistics.average_risk_score, 0)
+
+    def test_stats_only_routes(self):
+        body = {'cookies': self.cookies[:20], 'stats_only': True}
+        flask_body = api.app.test_client().post('/classify-batch', json=body).get_json()
+        self.assertEqual(list(flask_body), ['statistics'])
+        self.assertEqual(flask_body['statistics']['total_cookies'], 20)
+        if has_modules('starlette', 'httpx'):
+            from starlette.testclient import TestClient
+            import cookie_classifier_asgi
+
+            asgi_body = TestClient(cookie_classifier_asgi.app).post('/classify-batch', json=body).json()
+            self.assertEqual(asgi_body, flask_body)
+
+
+def random_risk_cookies(count, seed=7):
+    """Cookies with every risk-relevant field drawn from truthy/falsy/odd values"""
+    rng = random.Random(seed)
+    flag_values = [True, False, None, 0, 1, '', 'yes', [], [0]]
+    same_site_values = ['strict', 'lax', 'Strict', 'LAX', 'none', None, '', ['lax'], 1]
+    domains = ['', '.', '.example.com', 'example.com', '..x', ' .a.com', '.doubleclick.net']
+    cookies = []
+    for i in range(count):
+        cookie = {'name': f'c{i}'}
+        for key in ('httpOnly', 'secure', 'session'):
+            if rng.random() < 0.8:
+                cookie[key] = rng.choice(flag_values)
+        if rng.random() < 0.8:
+            cookie['sameSite'] = rng.choice(same_site_values)
+        if rng.random() < 0.9:
+            cookie['domain'] = rng.choice(domains)
+        cookies.append(cookie)
+    return cookies
+
+
+class TestVectorizedRisk(unittest.TestCase):
+    """Batch risk scorer matches calculate_risk_score exactly"""
+
+    def test_matches_scalar(self):
+        """Random cookies x every category (plus unknown ones) score identically"""
+        rng = random.Random(5)
+        categories = list(api.CATEGORY_RISK) + ['unknown', '']
+        cookies = random_risk_cookies(20000)
+        assigned = [rng.choice(categories) for _ in cookies]
+        self.assertEqual(api.calculate_risk_score_many(cookies, assigned),
+                         [api.calculate_risk_score(c, category) for c, category in zip(cookies, assigned)])
+
+    def test_clamping_and_table_changes(self):
+        """Scores clamp at both ends and follow edits to CATEGORY_RISK"""
+        cookies = [{'domain': '.x.com'}, {'httpOnly': 1, 'secure': 1, 'sameSite': 'lax', 'session': 1}]
+        with mock.patch.dict(api.CATEGORY_RISK, {'advertising': 99, 'necessary': 5}):
+            self.assertEqual(api.calculate_risk_score_many(cookies, ['advertising', 'necessary']), [100, 0])
+            self.assertEqual(api.calculate_risk_score_many(cookies, ['advertising', 'necessary']),
+                             [api.calculate_risk_score(cookies[0], 'advertising'),
+                              api.calculate_risk_score(cookies[1], 'necessary')])
+        self.assertEqual(api.calculate_risk_score_many([], []), [])
+
+    def test_columns(self):
+        codes, base_risk = api.category_risk_table()
+        flags = api.risk_flag_columns([{'secure': True, 'domain': '.a.com'}])
+        self.assertEqual(flags.tolist(), [[False, True, False, True, False]])
+        scores = api.calculate_risk_scores(np.array([codes['analytics']]), flags, base_risk)
+        self.assertEqual(scores.tolist(), [65])
+
+
+class FakeEngine:
+    """Stands in for LocalInferenceEngine; load() waits for `release`"""
+
+    def __init__(self, loads=True):
+        self.loads = loads
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def load(self):
+        self.calls += 1
+        self.release.wait(10)
+        return self.loads
+
+
+class TestModelLoader(unittest.TestCase):
+    """Cold start: the model loads lazily or in the background, once"""
+
+    def test_import_skips_heavy_modules(self):
+        """Importing the API pulls in neither huggingface_hub nor transformers"""
+        probe = ('import sys, cookie_classifier_api; '
+                 'print(sorted(m for m in ("huggingface_hub", "transformers", "torch") if m in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', probe], check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(api.__file__), env=dict(os.environ, MODEL_LOAD_MODE='lazy'))
+        self.assertEqual(output.stdout.strip(), '[]')
+
+    def test_background_start_does_not_block(self):
+        engine = FakeEngine()
+        engine.release.clear()
+        loader = api.ModelLoader(engine, 'background')
+        loader.start()
+        self.assertEqual(loader.state, 'loading')
+        self.assertFalse(loader.warm)
+        engine.release.set()
+        self.assertTrue(loader.load())
+        self.assertEqual((loader.state, engine.calls), ('ready', 1))
+        self.assertIsNotNone(loader.load_seconds)
+
+    def test_lazy_loads_on_first_use(self):
+        engine = FakeEngine(loads=False)
+        loader = api.ModelLoader(engine, 'lazy')
+        self.assertEqual(loader.state, 'pending')
+        loader.ensure()
+        loader.ensure()
+        self.assertEqual((loader.state, engine.calls), ('failed', 1))
+
+    def test_disabled_and_unknown_mode(self):
+        engine = FakeEngine()
+        loader = api.ModelLoader(engine, 'eager', enabled=False)
+        self.assertFalse(loader.load())
+        self.assertEqual((loader.state, engine.calls), ('disabled', 0))
+        with self.assertRaises(ValueError):
+            api.ModelLoader(engine, 'preload')
+
+    def test_load_restarted_after_fork(self):
+        """A load in flight at fork time runs again in the child"""
+        engine = FakeEngine()
+        engine.release.clear()
+        loader = api.ModelLoader(engine, 'background')
+        loader.start()
+        loader.after_fork()
+        engine.release.set()
+        self.assertTrue(loader.load())
+        self.assertEqual(engine.calls, 2)
+
+    def test_health_readiness(self):
+        readiness = api.app.test_client().get('/health').get_json()['readiness']
+        self.assertTrue(readiness['listening'])
+        self.assertEqual(readiness['model_warm'], api.inference_engine.available)
+        self.assertIn(readiness['model_state'], ('disabled', 'pending', 'loading', 'ready', 'failed'))
+
+
+class TestMetrics(unittest.TestCase):
+    """/metrics exposes request, stage, batch, cache and method metrics"""
+
+    def setUp(self):
+        self.client = api.app.test_client()
+
+    def metric_value(self, text, sample):
+        """Value of the sample line starting with `sample`, or None"""
+        for line in text.splitlines():
+            if line.startswith(sample + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return None
+
+    def test_endpoint_reports_requests(self):
+        before = self.client.get('/metrics').get_data(as_text=True)
+        count = 'cookie_api_request_duration_ms_count{endpoint="/classify-batch"}'
+        already = self.metric_value(before, count) or 0
+        api.classification_cache.invalidate()
+        cookies = [{'name': name, 'domain': domain} for name, domain in random_cookie_texts(10, seed=4)]
+        self.client.post('/classify-batch', json={'cookies': cookies})
+        self.client.post('/classify-batch', json={'cookies': 'nope'})
+
+        response = self.client.get('/metrics')
+        self.assertTrue(response.mimetype.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        self.assertEqual(self.metric_value(text, count), already + 2)
+        self.assertGreaterEqual(self.metric_value(
+            text, 'cookie_api_responses_total{endpoint="/classify-batch",status="400"}'), 1)
+        for stage in api.ApiMetrics.STAGES:
+            self.assertGreater(self.metric_value(
+                text, f'cookie_api_stage_duration_ms_count{{stage="{stage}"}}'), 0)
+        self.assertGreaterEqual(self.metric_value(text, 'cookie_api_batch_size_bucket{le="16"}'), 1)
+        self.assertIsNotNone(self.metric_value(text, 'cookie_api_cache_hit_ratio'))
+        self.assertGreaterEqual(self.metric_value(
+            text, 'cookie_api_cache_lookups_total{result="miss"}'), 10)
+        methods = [line for line in text.splitlines() if line.startswith('cookie_api_classifications_total{')]
+        self.assertTrue(methods)
+
+    def test_unknown_paths_share_a_label(self):
+        self.client.get('/no-such-endpoint')
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('cookie_api_responses_total{endpoint="other",status="404"}', text)
+
+    def test_histogram_buckets(self):
+        """Values on a bound land in that bucket ('le' is inclusive)"""
+        histogram = api.Histogram([1, 2, 5])
+        for value in [0, 1, 1.5, 2, 5, 6]:
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['buckets'], {'1': 2, '2': 4, '5': 5, '+Inf': 6})
+        self.assertEqual(snapshot['sum'], 15.5)
+
+    def test_exposition_format(self):
+        lines = api.prometheus_metric('m', 'counter', 'help', [({'a': 'x"y\\z'}, 3), ({}, 1)])
+        self.assertEqual(lines, ['# HELP m help', '# TYPE m counter', 'm{a="x\\"y\\\\z"} 3', 'm 1'])
+
+    def test_per_cookie_logging_is_sampled(self):
+        with mock.patch.object(api, 'CLASSIFY_LOG_SAMPLE_RATE', 0), \
+                mock.patch.object(api.logger, 'info') as info:
+            self.client.post('/classify', json={'name': '_ga', 'domain': '.example.com'})
+        info.assert_not_called()
+        with mock.patch.object(api, 'CLASSIFY_LOG_SAMPLE_RATE', 1), self.assertLogs(api.logger, 'INFO') as logs:
+            self.client.post('/classify', json={'name': '_ga', 'domain': '.example.com'})
+        self.assertIn("Classified cookie '_ga'", logs.output[0])
+
+
+class TestResultStore(unittest.TestCase):
+    """Persistent SQLite results shared across workers"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'results.sqlite')
+        self.store = api.ResultStore(self.path)
+        api.classification_cache.invalidate()
+
+    def tearDown(self):
+        api.classification_cache.invalidate()
+        self.tmp.cleanup()
+
+    def cookies(self, count, seed):
+        return [{'name': name, 'domain': domain, 'secure': i % 3 == 0}
+                for i, (name, domain) in enumerate(random_cookie_texts(count, seed=seed))]
+
+    def test_round_trip_across_connections(self):
+        """Another store on the same file (another worker) sees the writes"""
+        keys = [api.cookie_cache_key(c) for c in self.cookies(30, seed=1)]
+        results = {key: ({'category': 'analytics', 'confidence': 0.5, 'description': 'd',
+                          'method': 'rule-based'}, i) for i, key in enumerate(keys)}
+        self.store.put_many(results, 'v1')
+
+        other = api.ResultStore(self.path)
+        other.LOOKUP_CHUNK = 7
+        self.assertEqual(other.get_many(keys + [('unknown',)], 'v1'), results)
+        self.assertEqual(other.get_many(keys, 'v2'), {})
+        with sqlite3.connect(self.path) as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(self.store.prune('v2'), len(set(keys)))
+
+    def test_only_misses_reach_the_model(self):
+        first, second = self.cookies(40, seed=2), self.cookies(10, seed=3)
+        seen = []
+
+        def counting_batch(cookies):
+            seen.append(len(cookies))
+            return [dict(api.rule_based_classification(cookie), method='ml-local') for cookie in cookies]
+
+        with mock.patch.object(api, 'result_store', self.store), \
+                mock.patch.object(api, 'inference_engine', mock.Mock(available=True)), \
+                mock.patch.object(api, 'ml_based_classification_batch', counting_batch):
+            expected = api.classify_many_with_risk(first)
+            api.classification_cache.invalidate()
+            self.assertEqual(api.classify_many_with_risk(first), expected)
+            self.assertEqual(len(seen), 1)
+
+            api.classification_cache.invalidate()
+            api.classify_many_with_risk(first + second)
+            new_keys = {api.cookie_cache_key(c) for c in second} - {api.cookie_cache_key(c) for c in first}
+            self.assertEqual(seen[1:], [len(new_keys)])
+
+            api.classification_cache.invalidate()
+            self.assertEqual(api.classify_with_risk(first[0]), expected[0])
+            self.assertEqual(len(seen), 2)
+
+    def test_rules_bypass_the_store(self):
+        """Without a model, recomputing is cheaper than a store lookup"""
+        if api.inference_engine.available:
+            self.skipTest('needs no local model')
+        with mock.patch.object(api, 'result_store', self.store):
+            api.classify_many_with_risk(self.cookies(10, seed=5))
+        self.assertEqual(self.store.stats()['misses'] + self.store.stats()['writes'], 0)
+
+    def test_storage_errors_are_misses(self):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('DROP TABLE results')
+        key = api.cookie_cache_key({'name': '_ga'})
+        self.assertEqual(self.store.get_many([key], 'v1'), {})
+        self.store.put_many({key: ({}, 1)}, 'v1')
+        self.assertEqual(self.store.stats()['errors'], 2)
+
+    def test_expired_and_overflow_rows_are_pruned(self):
+        store = api.ResultStore(self.path, maxsize=5, ttl=100)
+        keys = list(dict.fromkeys(api.cookie_cache_key(c) for c in self.cookies(12, seed=6)))[:8]
+        with mock.patch.object(api.time, 'time', return_value=1000.0):
+            store.put_many({keys[0]: ({}, 1)}, 'v1')
+        for i, key in enumerate(keys[1:]):
+            with mock.patch.object(api.time, 'time', return_value=1050.0 + i):
+                store.put_many({key: ({}, 1)}, 'v1')
+
+        with mock.patch.object(api.time, 'time', return_value=1120.0):
+            self.assertEqual(store.get_many(keys[:1], 'v1'), {})
+            self.assertEqual(len(store.get_many(keys[1:], 'v1')), 7)
+            self.assertEqual(store.prune(), 3)
+            self.assertEqual(set(store.get_many(keys, 'v1')), set(keys[3:]))
+        self.assertEqual(store.stats()['pruned'], 3)
+
+    def test_writes_trigger_prune(self):
+        store = api.ResultStore(self.path, maxsize=0)
+        store.PRUNE_INTERVAL = 2
+        key = api.cookie_cache_key({'name': '_ga'})
+        store.put_many({key: ({}, 1)}, 'v1')
+        store.put_many({key: ({}, 2)}, 'v2')
+        self.assertEqual(store.get_many([key], 'v1'), {})
+        self.assertEqual(store.stats()['pruned'], 1)
+
+    def test_refresh_prunes_other_versions(self):
+        """Old versions are dropped once the model's version is known"""
+        key = api.cookie_cache_key({'name': '_ga'})
+        self.store.put_many({key: ({}, 1)}, 'stale')
+        with mock.patch.object(api, 'result_store', self.store):
+            with mock.patch.object(api, 'inference_engine', mock.Mock(available=False)):
+                self.assertEqual(api.prune_result_store(), 0)
+            with mock.patch.object(api, 'inference_engine', mock.Mock(available=True, model_id='m')), \
+                    mock.patch.object(api, 'classifier_version', api.classifier_version):
+                self.assertTrue(api.refresh_classifier())
+                self.store.put_many({key: ({}, 2)}, api.classifier_version)
+                self.assertEqual(api.prune_result_store(), 0)
+                self.assertEqual(self.store.get_many([key], 'stale'), {})
+        self.assertEqual(self.store.stats()['pruned'], 1)
+        api.refresh_classifier()
+
+    def test_concurrent_threads(self):
+        keys = list(dict.fromkeys(api.cookie_cache_key(c) for c in self.cookies(200, seed=4)))
+
+        def write_and_read(offset):
+            part = {key: ({'category': 'functional'}, offset) for key in keys[offset::4]}
+            self.store.put_many(part, 'v1')
+            return self.store.get_many(list(part), 'v1') == part
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            self.assertTrue(all(pool.map(write_and_read, range(4))))
+        self.assertEqual(self.store.stats()['errors'], 0)
+
+
+class TestDomainIndex(unittest.TestCase):
+    """Tracker domains resolve to a category by walking parent domains"""
+
+    def setUp(self):
+        api.classification_cache.invalidate()
+
+    def test_lookup_walks_parents(self):
+        index = api.build_domain_index(['tracker.net', 'stats.tracker.net', 'share-widgets.io'],
+                                       default_category='advertising')
+        self.assertEqual(index.lookup('tracker.net'), 'advertising')
+        self.assertEqual(index.lookup('.A.B.Tracker.NET'), 'advertising')
+        self.assertEqual(index.lookup('x.stats.tracker.net'), 'analytics')
+        self.assertEqual(index.lookup('share-widgets.io'), 'social_media')
+        for domain in ['', 'net', 'nottracker.net', 'tracker.net.evil.com']:
+            self.assertIsNone(index.lookup(domain))
+        with self.assertRaises(ValueError):
+            api.build_domain_index([], default_category='tracking')
+        neutral = api.build_domain_index(['tracker.net', 'stats.tracker.net'])
+        self.assertIsNone(neutral.lookup('tracker.net'))
+        self.assertEqual(neutral.lookup('x.stats.tracker.net'), 'analytics')
+
+    def test_matches_linear_suffix_scan(self):
+        """Random hosts resolve like a scan over every listed domain"""
+        rng = random.Random(13)
+        labels = ['ads', 'cdn', 'x', 'stats', 'pixel', 'a', 'b']
+        listed = sorted({'.'.join(rng.choice(labels) for _ in range(rng.randint(1, 3))) + '.com'
+                         for _ in range(60)})
+        index = api.build_domain_index(listed, default_category='advertising')
+        for _ in range(2000):
+            host = '.'.join(rng.choice(labels) for _ in range(rng.randint(1, 5))) + '.com'
+            matches = [d for d in listed if host == d or host.endswith('.' + d)]
+            expected = index.lookup(max(matches, key=len)) if matches else None
+            self.assertEqual(index.lookup(host), expected)
+
+    def test_loader_reads_blocklist(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'list.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('! comment\n||veil-test-pixel.example^\nplain-tracker.example\n@@||allowed.example^\n')
+            index = api.load_domain_index(path)
+            defaulted = api.load_domain_index(path, default_category='advertising')
+        self.assertEqual(index.lookup('cdn.veil-test-pixel.example'), 'advertising')
+        self.assertIsNone(index.lookup('plain-tracker.example'))
+        self.assertEqual(defaulted.lookup('plain-tracker.example'), 'advertising')
+        self.assertIsNone(index.lookup('allowed.example'))
+        self.assertIsNotNone(index.lookup('criteo.com'))
+        self.assertNotEqual(index.fingerprint, api.load_domain_index().fingerprint)
+
+    def test_builtin_sections_carry_categories(self):
+        """CDN and bot-protection hosts are not labelled as ad trackers"""
+        index = api.load_domain_index()
+        self.assertEqual(index.lookup('ib.adnxs.com'), 'advertising')
+        self.assertEqual(index.lookup('metrics.omtrdc.net'), 'analytics')
+        for domain in ['edgekey.net', 'akadns.net', 'a.hcaptcha.com', 'datadome.co', 'imperva.com']:
+            self.assertIsNone(index.lookup(domain), domain)
+        captcha = api.rule_based_classification({'name': 'hc_accessibility', 'domain': '.a.hcaptcha.com'})
+        self.assertEqual((captcha['category'], captcha['method']), ('functional', 'rule-based-default'))
+        self.assertEqual(api.calculate_risk_score({'name': 'hc_accessibility'}, captcha['category']),
+                         api.CATEGORY_RISK['functional'])
+
+    def test_rule_classification_uses_index(self):
+        """Keywords still win; known trackers no longer default to functional"""
+        tracked = api.rule_based_classification({'name': 'uid', 'domain': '.eu.criteo.com'})
+        self.assertEqual((tracked['category'], tracked['method']), ('advertising', 'domain-index'))
+        keyword = api.rule_based_classification({'name': '_ga', 'domain': '.criteo.com'})
+        self.assertEqual((keyword['category'], keyword['method']), ('analytics', 'rule-based'))
+        unknown = api.rule_based_classification({'name': 'uid', 'domain': '.example.org'})
+        self.assertEqual(unknown['method'], 'rule-based-default')
+        self.assertEqual(api.app.test_client().get('/health').get_json()['domain_index']['domains'],
+                         len(api.domain_index))
+
+
+class TestBatchDedupe(unittest.TestCase):
+    """/classify-batch classifies each distinct cookie once"""
+
+    def setUp(self):
+        api.classification_cache.invalidate()
+        rng = random.Random(17)
+        base = [{'name': name, 'domain': domain, 'secure': i % 2 == 0}
+                for i, (name, domain) in enumerate(random_cookie_texts(50, seed=17))]
+        # Same cookies again from other frames/paths, with other values and name case
+        self.cookies = base + [dict(rng.choice(base), value=str(i), name=rng.choice(base)['name'].upper())
+                               for i in range(150)]
+        rng.shuffle(self.cookies)
+
+    def tearDown(self):
+        api.classification_cache.invalidate()
+
+    def test_grouping_and_fan_out(self):
+        keys, unique_cookies, inverse = api.dedupe_cookies(self.cookies)
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual([keys[i] for i in inverse], [api.cookie_cache_key(c) for c in self.cookies])
+        self.assertEqual([api.cookie_cache_key(c) for c in unique_cookies], keys)
+
+        classified, unique = api.classify_many_deduped(self.cookies)
+        self.assertEqual(unique, len(keys))
+        api.classification_cache.invalidate()
+        self.assertEqual(classified, [api.classify_with_risk(c) for c in self.cookies])
+
+    def test_each_key_reaches_the_classifier_once(self):
+        classify_batch = api.ml_based_classification_batch
+        seen = []
+
+        def recording_batch(cookies):
+            seen.extend(api.cookie_cache_key(c) for c in cookies)
+            return classify_batch(cookies)
+
+        with mock.patch.object(api, 'ml_based_classification_batch', recording_batch):
+            _, unique = api.classify_many_deduped(self.cookies)
+        self.assertEqual(len(seen), unique)
+        self.assertEqual(len(set(seen)), unique)
+
+    def test_path_only_keys_with_a_model(self):
+        cookie = {'name': '_ga', 'domain': '.x.com'}
+        paths = [dict(cookie, path='/a'), dict(cookie, path='/b')]
+        with mock.patch.object(api, 'inference_engine', mock.Mock(available=False)):
+            self.assertEqual(len(set(map(api.cookie_cache_key, paths))), 1)
+        with mock.patch.object(api, 'inference_engine', mock.Mock(available=True)):
+            self.assertEqual(len(set(map(api.cookie_cache_key, paths))), 2)
+
+    def test_response_reports_dedupe_ratio(self):
+        client = api.app.test_client()
+        body = client.post('/classify-batch', json={'cookies': self.cookies}).get_json()
+        unique = len(api.dedupe_cookies(self.cookies)[0])
+        self.assertEqual([r['cookie_name'] for r in body['results']], [c['name'] for c in self.cookies])
+        self.assertEqual(body['statistics']['unique_cookies'], unique)
+        self.assertEqual(body['statistics']['dedupe_ratio'], round(len(self.cookies) / unique, 4))
+        stats_only = client.post('/classify-batch', json={'cookies': self.cookies, 'stats_only': True})
+        self.assertEqual(stats_only.get_json()['statistics'], body['statistics'])
+        self.assertIn('cookie_api_batch_dedupe_ratio ', client.get('/metrics').get_data(as_text=True))
+        self.assertEqual(api.batch_response(self.cookies[:3], api.classify_many_with_risk(self.cookies[:3]))
+                         .statistics.dedupe_ratio, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()